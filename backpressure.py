@@ -0,0 +1,108 @@
+"""
+Adapts the capture to the speed of the disk.
+
+Before every tick the controller looks at the writer queue (jobs of the writer pool not yet
+written) and at the latency of the recent writes. While either stays above its limit it steps
+up one level per --backpressure-hold ticks, and while both stay well below it steps back down:
+
+0  full fidelity
+1  PNG images encoded at the lowest compression effort
+2  and sensors below the highest priority saved at every 2nd of their captures
+3  and every 4th, and the tick loop sleeps before each tick so the writers catch up
+
+The labelled rgb, dvs and depth cameras (the top priority, see configuration.sensorPriority)
+are never decimated. Every change of level is printed and appended to <run>/backpressure.jsonl.
+"""
+
+import json
+import time
+import threading
+import collections
+import numpy as np
+
+# (PNG compression or None for the encoder default, decimation of low priority sensors, seconds of sleep per tick)
+LEVELS = [
+    (None, 1, 0.0),
+    (0, 1, 0.0),
+    (0, 2, 0.0),
+    (0, 4, 0.25),
+]
+
+
+class BackpressureController:
+    def __init__(self, writer_pool, log_path=None, max_queue=64, max_latency=2.0, hold=10, window=200):
+        self.writer_pool = writer_pool
+        self.log_path = log_path
+        self.max_queue = max_queue
+        self.max_latency = max_latency
+        self.hold = hold
+        self.level = 0
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        self._pressured = 0
+        self._relaxed = 0
+        self._top_priority = 0
+
+    def set_priorities(self, priorities):
+        self._top_priority = max([self._top_priority] + list(priorities))
+
+    def observe_write(self, seconds):
+        """ Called after every file write with its duration. """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency(self):
+        """ 90th percentile of the recent write latencies. """
+        with self._lock:
+            latencies = list(self._latencies)
+        return float(np.quantile(latencies, 0.9)) if latencies else 0.0
+
+    def on_tick(self, frame_id):
+        """ Called before every tick; adjusts the level and sleeps at the levels that slow the ticks. """
+        queue = self.writer_pool.pending()
+        latency = self.latency()
+        if queue > self.max_queue or latency > self.max_latency:
+            self._pressured += 1
+            self._relaxed = 0
+        elif queue <= self.max_queue // 4 and latency <= self.max_latency / 2:
+            self._relaxed += 1
+            self._pressured = 0
+        else:
+            self._pressured = self._relaxed = 0
+
+        if self._pressured >= self.hold and self.level < len(LEVELS) - 1:
+            self._set_level(self.level + 1, frame_id, queue, latency)
+        elif self._relaxed >= self.hold and self.level > 0:
+            self._set_level(self.level - 1, frame_id, queue, latency)
+
+        delay = LEVELS[self.level][2]
+        if delay:
+            time.sleep(delay)
+
+    def _set_level(self, level, frame_id, queue, latency):
+        png_compression, decimation, delay = LEVELS[level]
+        direction = "up" if level > self.level else "down"
+        print(f"Backpressure: level {self.level} -> {level} at frame {frame_id} (writer queue {queue}, "
+              f"write p90 {latency * 1000:.0f} ms): png compression {'default' if png_compression is None else png_compression}, "
+              f"low priority sensors every {decimation} frames, {delay:g} s per tick")
+        self.level = level
+        self._pressured = self._relaxed = 0
+        if self.log_path is not None:
+            with open(self.log_path, 'a') as file:
+                file.write(json.dumps({'time': time.time(), 'frame': frame_id, 'level': level,
+                                       'direction': direction, 'writer_queue': queue,
+                                       'write_latency_p90': latency, 'png_compression': png_compression,
+                                       'decimation': decimation, 'tick_delay': delay}) + '\n')
+
+    def png_compression(self):
+        return LEVELS[self.level][0]
+
+    def decimate(self, frame_id, bundle, priorities, periods):
+        """ Clears the slots of low priority sensors that are skipped at frame_id; priorities[i] is None for the world snapshot.
+            A sensor of period p (in ticks) captures on every p-th frame, so frame_id // p counts its captures whatever
+            frame they start on, and every decimation-th capture is kept. """
+        decimation = LEVELS[self.level][1]
+        if decimation == 1:
+            return bundle
+        return [data if priority is None or priority >= self._top_priority or (frame_id // period) % decimation == 0
+                else None for data, priority, period in zip(bundle, priorities, periods)]
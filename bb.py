@@ -12,6 +12,30 @@ OCCLUDED_VERTEX_COLOR = (255, 0, 0)
 VISIBLE_VERTEX_COLOR = (0, 255, 0)
 MIN_VISIBLE_VERTICES_FOR_RENDER = 2
 MIN_BBOX_AREA_IN_PX = 100  # Adjust as required.
+MAX_RENDER_DEPTH = 100
+# KITTI occlusion levels {0,1,2,3} of the occluded fraction of a box
+OCCLUSION_BINS = [0.25, 0.50, 0.75]
+
+
+class LabelingParams:
+    """
+    Thresholds of the labels. Captures label with the defaults; labeler.py --relabel
+    labels a run again under other values without re-simulating it.
+    """
+
+    def __init__(self, min_visible_vertices=MIN_VISIBLE_VERTICES_FOR_RENDER, min_bbox_area=MIN_BBOX_AREA_IN_PX,
+                 max_render_depth=MAX_RENDER_DEPTH, occlusion_bins=OCCLUSION_BINS):
+        self.min_visible_vertices = int(min_visible_vertices)
+        self.min_bbox_area = float(min_bbox_area)
+        self.max_render_depth = float(max_render_depth)
+        self.occlusion_bins = [float(edge) for edge in occlusion_bins]
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
 
 
 class ClientSideBoundingBoxes(object):
@@ -247,7 +271,7 @@ def get_bounding_box_and_refpoint(agent, camera, camera_calibration):
     concatenated with the bbox vertices to boost the performance as all vertices and refpoint are processed in parallel.
     Returns 3D bounding box and its reference point for a agent based on camera view.
     """
-    bbox_refpoint = np.array([[0, 0, 0, 1]], dtype=np.float)
+    bbox_refpoint = np.array([[0, 0, 0, 1]], dtype=np.float64)
     bb_cords = ClientSideBoundingBoxes._create_bb_points(agent)
     bb_cords_and_refpoint = np.vstack((bb_cords, bbox_refpoint))
 
@@ -270,11 +294,12 @@ def get_bounding_box_and_refpoint(agent, camera, camera_calibration):
     return (camera_bbox, camera_refpoint), (sensor_bbox, sensor_refpoint)
 
 
-def create_kitti_datapoint(agent, camera, cam_calibration, image, depth_map, player_transform, bb, max_render_depth=100):
+def create_kitti_datapoint(agent, camera, cam_calibration, image, depth_map, player_transform, bb, params=None):
     """
     Calculates the bounding box of the given agent, and
     returns a KittiDescriptor which describes the object to be labeled
     """
+    params = params or LabelingParams()
 
     obj_type, agent_transform, bbox_transform, ext, location = transforms_from_agent(
         agent)
@@ -282,7 +307,7 @@ def create_kitti_datapoint(agent, camera, cam_calibration, image, depth_map, pla
     if obj_type is None:
         logging.warning(
             "Could not get bounding box for agent. Object type is None")
-        return image, None
+        return image, None, None
 
     (camera_bbox, camera_refpoint), (sensor_bbox,
                                      sensor_refpoint) = get_bounding_box_and_refpoint(agent, camera, cam_calibration)
@@ -290,11 +315,11 @@ def create_kitti_datapoint(agent, camera, cam_calibration, image, depth_map, pla
     num_visible_vertices, num_vertices_outside_camera = calculate_occlusion_stats(image,
                                                                                   bb,
                                                                                   depth_map,
-                                                                                  max_render_depth,
+                                                                                  params.max_render_depth,
                                                                                   draw_vertices=False)
 
     # At least N vertices has to be visible in order to draw bbox
-    if num_visible_vertices >= MIN_VISIBLE_VERTICES_FOR_RENDER > num_vertices_outside_camera:
+    if num_visible_vertices >= params.min_visible_vertices > num_vertices_outside_camera:
 
         # TODO I checked for pedestrians and it works. Test for vehicles too!
         # Visualize midpoint for agents
@@ -307,10 +332,11 @@ def create_kitti_datapoint(agent, camera, cam_calibration, image, depth_map, pla
         bbox_2d = calc_projected_2d_bbox(camera_bbox)
 
         area = calc_bbox2d_area(bbox_2d)
-        if area < MIN_BBOX_AREA_IN_PX:
+        if area < params.min_bbox_area:
             return image, None, None
 
-        occlusion = calculate_occlusion(camera_bbox, agent, depth_map)
+        occlusion = calculate_occlusion(
+            camera_bbox, agent, depth_map, params.occlusion_bins)
         rotation_y = get_relative_rotation_y(agent, player_transform)
         alpha = get_alpha(agent, player_transform)
         truncation = calculate_truncation(uncropped_bbox_2d, bbox_2d)
@@ -330,7 +356,7 @@ def create_kitti_datapoint(agent, camera, cam_calibration, image, depth_map, pla
         return image, None, None
 
 
-def calculate_occlusion(bbox, agent, depth_map):
+def calculate_occlusion(bbox, agent, depth_map, bins=OCCLUSION_BINS):
     """Calculate the occlusion value of a 2D bounding box.
     Iterate through each point (pixel) in the bounding box and declare it occluded only
     if the 4 surroinding points (pixels) are closer to the camera (by using the help of depth map)
@@ -352,8 +378,8 @@ def calculate_occlusion(bbox, agent, depth_map):
     occlusion = ((float(np.sum(is_occluded))) /
                  ((max_x-min_x) * (max_y-min_y)))
 
-    # discretize the 0–1 occlusion value into KITTI’s {0,1,2,3} labels by equally dividing the interval into 4 parts
-    occlusion = np.digitize(occlusion, bins=[0.25, 0.50, 0.75])
+    # discretize the 0–1 occlusion value into KITTI’s {0,1,2,3} labels, by default by equally dividing the interval into 4 parts
+    occlusion = np.digitize(occlusion, bins=bins)
     return occlusion
 
 
@@ -0,0 +1,330 @@
+"""
+Microbenchmarks of the per-frame work of the client: labelling, decoding and encoding.
+
+> python benchmark.py --actors 1 10 50 --box-sizes 40 150 400 --output benchmark.json
+> python benchmark.py --baseline benchmark.json --max-regression 0.1
+
+Every stage is timed on its own over synthetic actors and sensor buffers at the rig resolution,
+so the numbers do not depend on a server: actors are placed in front of a camera so that their
+boxes are --box-sizes pixels high, and the RGB, depth, DVS and optical flow buffers come from
+the mock carla package. The stages that depend on the scene (projection, occlusion, labelling,
+DVS binning, annotations) run for every actor count and box size, the others once.
+
+Frames/s is the median over the iterations of a stage; bytes/s is the data the stage consumes
+(decoding, binning) or produces (encoding, annotations). With --baseline the run fails when a
+stage is slower than in the baseline by more than --max-regression.
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import numpy as np
+import cv2
+
+# The mock provides the carla types and the synthetic sensor buffers, with or without a server
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'mock_carla'))
+
+import carla  # noqa: E402
+from carla import _render  # noqa: E402
+from bb import (ClientSideBoundingBoxes, get_bounding_box_and_refpoint, calculate_occlusion_stats,  # noqa: E402
+                calculate_occlusion, create_kitti_datapoint)
+from camera_utils import WINDOW_WIDTH, WINDOW_HEIGHT, crop_boxes_in_canvas  # noqa: E402
+from dvs_representations import REPRESENTATIONS, decode_dvs_events, build_representations  # noqa: E402
+from utils.flow import encode_flow  # noqa: E402
+from save_sensors import (decode_depth, get_2d_bounding_box, count_dvs_events_inside_bbox,  # noqa: E402
+                          save_pascal_voc_format, save_coco_format, save_kitti_3d_format)
+from output_layout import save_yolo_format  # noqa: E402
+
+SCENE_STAGES = ['projection', 'occlusion', 'labelling',
+                'dvs_binning', 'annotations']
+BUFFER_STAGES = ['depth_decode', 'png_encode', 'npz_encode']
+STAGES = SCENE_STAGES + BUFFER_STAGES
+CAMERA_HEIGHT = 1.7
+MAX_RENDER_DEPTH = 100
+
+
+class SyntheticAgent:
+    """ What the labelling code reads of an actor: id, type_id, attributes, bounding_box, get_transform(). """
+
+    def __init__(self, actor_id, type_id, attributes, extent, transform):
+        self.id = actor_id
+        self.type_id = type_id
+        self.attributes = attributes
+        self.bounding_box = carla.BoundingBox(
+            carla.Location(0.0, 0.0, extent.z), extent)
+        self._transform = transform
+
+    def get_transform(self):
+        return self._transform
+
+
+class SyntheticCamera:
+    def __init__(self, transform):
+        self._transform = transform
+
+    def get_transform(self):
+        return self._transform
+
+
+class Scene:
+    """ Camera, agents and sensor buffers of one benchmark case. """
+
+    def __init__(self, width, height, fov, actors, box_px, frame=1):
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.camera_transform = carla.Transform(
+            carla.Location(0.0, 0.0, CAMERA_HEIGHT))
+        self.camera = SyntheticCamera(self.camera_transform)
+        self.calibration = np.identity(3)
+        self.calibration[0, 2] = width / 2.0
+        self.calibration[1, 2] = height / 2.0
+        self.calibration[0, 0] = self.calibration[1, 1] = width / \
+            (2.0 * np.tan(fov * np.pi / 360.0))
+        self.agents = make_agents(
+            actors, box_px, self.calibration[0, 0], fov)
+
+        self.rgb = _render.rgb(width, height, fov, frame)
+        depth = _render.depth(width, height, fov, frame)
+        self.depth_image = carla.Image(
+            frame, 0.0, self.camera_transform, width, height, fov, depth)
+        self.depth = decode_depth(self.depth_image)
+        self.dvs_raw = _render.dvs_events(
+            width, height, frame, 0, 50000000, 1).view(np.uint8)
+        self.dvs_events = decode_dvs_events(self.dvs_raw)
+        self.flow = _render.optical_flow(width, height, fov, frame)
+
+        # Projected boxes and labels, the inputs of the later stages
+        self.boxes = []
+        self.datapoints = []
+        self.objects = []
+        for agent in self.agents:
+            for bbox in ClientSideBoundingBoxes.get_bounding_boxes([agent], self.camera, height, width, fov):
+                self.boxes.append((agent, bbox))
+                _, datapoint, _ = create_kitti_datapoint(
+                    agent, self.camera, self.calibration, self.rgb, self.depth, self.camera_transform, bbox)
+                if datapoint is not None:
+                    self.datapoints.append(datapoint)
+                    points = np.array([(int(bbox[i, 0]), int(bbox[i, 1]))
+                                       for i in range(8)], dtype=np.int32)
+                    self.objects.append(
+                        (agent.id, agent.attributes['base_type'], get_2d_bounding_box(points)))
+
+
+def make_agents(count, box_px, focal, fov):
+    """ Alternating cars and pedestrians spread over the field of view, boxes box_px pixels high. """
+    agents = []
+    for i in range(count):
+        if i % 2 == 0:
+            type_id, base_type = 'vehicle.tesla.model3', 'car'
+            extent = carla.Vector3D(2.4, 1.08, 0.75)
+        else:
+            type_id, base_type = 'walker.pedestrian.0001', 'pedestrian'
+            extent = carla.Vector3D(0.19, 0.34, 0.93)
+        distance = focal * 2.0 * extent.z / box_px
+        angle = np.radians(fov * 0.35) * \
+            ((i + 0.5) / count * 2.0 - 1.0)
+        location = carla.Location(
+            distance, distance * np.tan(angle), 0.0)
+        agents.append(SyntheticAgent(i + 1, type_id, {'base_type': base_type}, extent,
+                                     carla.Transform(location, carla.Rotation(yaw=37.0 * i))))
+    return agents
+
+
+def stage_projection(scene, folder):
+    for agent in scene.agents:
+        ClientSideBoundingBoxes.get_bounding_boxes(
+            [agent], scene.camera, scene.height, scene.width, scene.fov)
+        get_bounding_box_and_refpoint(agent, scene.camera, scene.calibration)
+    return 0
+
+
+def stage_occlusion(scene, folder):
+    for agent, bbox in scene.boxes:
+        calculate_occlusion_stats(
+            scene.rgb, bbox, scene.depth, MAX_RENDER_DEPTH, draw_vertices=False)
+        camera_bbox = bbox.copy()
+        crop_boxes_in_canvas(camera_bbox)
+        calculate_occlusion(camera_bbox, agent, scene.depth)
+    return 0
+
+
+def stage_labelling(scene, folder):
+    for agent, bbox in scene.boxes:
+        create_kitti_datapoint(agent, scene.camera, scene.calibration,
+                               scene.rgb, scene.depth, scene.camera_transform, bbox)
+    return 0
+
+
+def stage_dvs_binning(scene, folder):
+    events = decode_dvs_events(scene.dvs_raw)
+    build_representations(events, scene.height, scene.width, REPRESENTATIONS)
+    for obj_id, class_name, (min_x, min_y, xdiff, ydiff) in scene.objects:
+        count_dvs_events_inside_bbox(
+            events, min_x, min_y, min_x + xdiff, min_y + ydiff)
+    return scene.dvs_raw.nbytes
+
+
+def stage_annotations(scene, folder):
+    paths = [os.path.join(folder, name)
+             for name in ['1.xml', '1.json', '1.txt', '1-yolo.txt']]
+    save_pascal_voc_format(
+        scene.objects, paths[0], '1.png', scene.width, scene.height)
+    save_coco_format(scene.objects, paths[1], 1,
+                     '1.png', scene.width, scene.height)
+    save_kitti_3d_format(scene.datapoints, paths[2])
+    save_yolo_format(scene.objects, paths[3], scene.width, scene.height)
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def stage_depth_decode(scene, folder):
+    decode_depth(scene.depth_image)
+    return scene.depth_image.raw_data.nbytes
+
+
+def stage_png_encode(scene, folder):
+    return len(cv2.imencode('.png', scene.rgb)[1])
+
+
+def stage_npz_encode(scene, folder):
+    # The DVS events and optical flow NPZs of a frame, both written compressed
+    written = 0
+    for arrays in [{'dvs_events': scene.dvs_events}, encode_flow(scene.flow)]:
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        written += buffer.tell()
+    return written
+
+
+def time_stage(function, scene, folder, min_time, min_iterations):
+    """ Runs function until both min_time and min_iterations are reached; returns (seconds per run, bytes per run). """
+    durations = []
+    processed = 0
+    started = time.perf_counter()
+    while len(durations) < min_iterations or time.perf_counter() - started < min_time:
+        start = time.perf_counter()
+        processed = function(scene, folder)
+        durations.append(time.perf_counter() - start)
+    return float(np.median(durations)), processed, len(durations)
+
+
+def result_key(result):
+    return (result['stage'], result['actors'], result['box_px'])
+
+
+def compare(results, baseline, max_regression):
+    """ Returns the results slower than their baseline by more than max_regression. """
+    reference = {result_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        base = reference.get(result_key(result))
+        if base is None:
+            continue
+        change = result['frames_per_second'] / \
+            base['frames_per_second'] - 1.0
+        if change < -max_regression:
+            regressions.append((result, base, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Microbenchmarks of labelling, decoding and encoding')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='stages to run (default: all)')
+    parser.add_argument('--actors', nargs='+', type=int, default=[1, 10],
+                        help='actor counts of the scene stages (default: 1 10)')
+    parser.add_argument('--box-sizes', nargs='+', type=int, default=[40, 150],
+                        help='box heights in pixels of the scene stages (default: 40 150)')
+    parser.add_argument('--res', default='%dx%d' % (WINDOW_WIDTH, WINDOW_HEIGHT),
+                        help='camera resolution (default: %dx%d)' % (WINDOW_WIDTH, WINDOW_HEIGHT))
+    parser.add_argument('--fov', default=90.0, type=float,
+                        help='camera field of view (default: 90)')
+    parser.add_argument('--min-time', default=1.0, type=float,
+                        help='seconds every stage runs at least (default: 1)')
+    parser.add_argument('--min-iterations', default=3, type=int,
+                        help='iterations every stage runs at least (default: 3)')
+    parser.add_argument('--output', default=None,
+                        help='JSON file the results are written to')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON results of an earlier run to compare with')
+    parser.add_argument('--max-regression', default=0.1, type=float,
+                        help='fraction of frames/s a stage may lose against the baseline (default: 0.1)')
+    args = parser.parse_args()
+
+    width, height = [int(x) for x in args.res.split('x')]
+    cases = []
+    for stage in args.stages:
+        if stage in SCENE_STAGES:
+            cases += [(stage, actors, box_px)
+                      for actors in args.actors for box_px in args.box_sizes]
+        else:
+            cases.append((stage, None, None))
+
+    folder = tempfile.mkdtemp(prefix='benchmark-')
+    scenes = {}
+    results = []
+    try:
+        print(f"{'stage':<14}{'actors':>8}{'box px':>8}{'frames/s':>12}{'MB/s':>10}")
+        for stage, actors, box_px in cases:
+            key = (actors or 0, box_px or 100)
+            if key not in scenes:
+                scenes[key] = Scene(width, height, args.fov, *key)
+            seconds, processed, iterations = time_stage(globals()['stage_' + stage], scenes[key], folder,
+                                                        args.min_time, args.min_iterations)
+            result = {
+                'stage': stage,
+                'actors': actors,
+                'box_px': box_px,
+                'iterations': iterations,
+                'seconds_per_frame': seconds,
+                'frames_per_second': 1.0 / seconds if seconds > 0 else float('inf'),
+                'bytes_per_frame': processed,
+                'bytes_per_second': processed / seconds if seconds > 0 else 0.0,
+            }
+            results.append(result)
+            print(f"{stage:<14}{'-' if actors is None else actors:>8}{'-' if box_px is None else box_px:>8}"
+                  f"{result['frames_per_second']:>12.1f}{result['bytes_per_second'] / 1e6:>10.1f}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+        },
+        'resolution': [width, height],
+        'fov': args.fov,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+        print("Results written to", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.max_regression)
+        for result, base, change in regressions:
+            print(f"Regression in {result['stage']} (actors {result['actors']}, box {result['box_px']} px): "
+                  f"{base['frames_per_second']:.1f} -> {result['frames_per_second']:.1f} frames/s ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage slower than the baseline by more than {args.max_regression:.0%}")
+
+
+if __name__ == '__main__':
+    main()
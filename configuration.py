@@ -2,9 +2,11 @@ import carla
 from datetime import datetime
 import os
 from carla import Transform, Location, Rotation
-import queue
 import time
+import json
 import numpy as np
+from output_layout import make_camera_folders
+from bb import LabelingParams
 
 
 class SimulationParams:
@@ -25,6 +27,37 @@ class SimulationParams:
     # town_map + "_" + dt_string
     data_output_subfolder = None
     # os.path.join("out/", PHASE)
+    # Storage of optical flow: int16 (fixed point), float16 or float32
+    flow_encoding = "int16"
+    # DVS tensors built at capture time, see dvs_representations.py
+    dvs_representations = []
+    dvs_bins = 5
+    dvs_time_surface_tau = 0.3
+    dvs_normalization = "none"
+    # Write the red/blue rendering of the DVS events
+    dvs_png = True
+    # Background encode/write threads, see writer_pool.WriterPool
+    writer_pool = None
+    # Capture time review videos, see video_sink.VideoSink
+    video_sink = None
+    # SQLite frame and object index of the run, see run_index.RunIndex
+    run_index = None
+    # Loose files (None) or tar shards, see output_backend.TarShardBackend
+    output_backend = None
+    # Frames ticked but not yet saved; 1 runs tick and save strictly in sequence
+    max_frames_in_flight = 2
+    # Per-stage timings, queue depths and bytes written, see telemetry.Telemetry
+    telemetry = None
+    # Store raw rgb, dvs and depth buffers and actor states instead of labels, see raw_recording
+    record_raw = False
+    # Store actor states, sensor poses and raw depth next to the labels for labeler.py --relabel
+    label_inputs = True
+    # Thresholds of the labels, see bb.LabelingParams
+    labeling = LabelingParams()
+    # Memory budget of the arrived sensor data, see intake.IntakeBudget
+    intake = None
+    # Adapts PNG effort, decimation and tick rate to the writers, see backpressure.BackpressureController
+    backpressure = None
 
     # town_map = "Town03"
     # num_of_walkers = 20
@@ -48,102 +81,118 @@ class SimulationParams:
     # data_output_subfolder = os.path.join("out/", PHASE)
 
 
-def attachSensorsToVehicle(world, data, vehicle_actor):
-    blueprint_library = world.get_blueprint_library()
-    sensor_references = []
-    sensor_types = []
-    sensor_names = []
-    for i in range(len(data['sensors'])):
-        sensor = data['sensors'][i]
-        bp = blueprint_library.find(sensor['type'])
-        json_trans = sensor["transform"][0]
+def sensorPeriod(sensor):
+    """ Ticks between two captures of a sensor config entry, from its optional sensor_tick in seconds. """
+    if 'sensor_tick' not in sensor:
+        return 1
+    return max(1, int(round(float(sensor['sensor_tick']) / SimulationParams.delta_seconds)))
 
-        relative_transf = Transform(Location(x=float(json_trans['x']), y=float(json_trans['y']), z=float(json_trans['z'])), Rotation(
-            pitch=float(json_trans['pitch']), yaw=float(json_trans['yaw']), roll=float(json_trans['roll'])))
 
-        # Get all the attributes EXCLUDING type and transform
-        blacklist = ['type', 'transform']
-        settable_attributes = [
-            attribute for attribute in sensor if attribute not in blacklist]
-        for attr in settable_attributes:
-            try:
-                bp.set_attribute(str(attr), str(sensor[attr]))
-            except:
-                print("attr = ", attr)
-                print("sensor[attr] = ", sensor[attr])
-                print("sensor['type'] = ", sensor['type'])
-                print("Problem with setting " + attr + "to " +
-                      sensor[attr] + " in sensor " + sensor['type'])
-
-        # vehicle_transform = vehicle_actor.get_transform()
-        # roof_front_position = vehicle_transform.location + vehicle_transform.rotation.rotate(vehicle_actor.bounding_box.extent / 2 * carla.Vector3D(0.5, 0, 0.5))
-        # print(roof_front_position)
-        camera_init_trans = carla.Transform(carla.Location(z=2))
-        sensor_actor = world.spawn_actor(
-            bp, relative_transf, attach_to=vehicle_actor)
-
-        sensor_types.append(sensor['type'])
-        sensor_names.append(sensor['role_name'])
-        sensor_references.append(sensor_actor)
-
-        # PRINT CALIBRATION MATRICES
-        if sensor["type"] == "sensor.lidar.ray_cast_semantic":
-            lidar_2_world = sensor_actor.get_transform().get_matrix()
-            print("LIDAR INFO")
-            print("=================================================")
-            print(
-                "TRANSFORM the points from lidar space to world space = ", lidar_2_world)
-            print("=================================================")
-
-        if sensor["type"] == "sensor.other.gnss":
-            gnss_2_world = sensor_actor.get_transform().get_matrix()
-            print("GNSS INFO")
-            print("=================================================")
-            print("TRANSFORM the points from gnss space to world space = ", gnss_2_world)
-            print("=================================================")
-
-        if sensor["type"] == "sensor.other.imu":
-            imu_2_world = sensor_actor.get_transform().get_matrix()
-            print("IMU INFO")
-            print("=================================================")
-            print("TRANSFORM the points from imu space to world space = ", imu_2_world)
-            print("=================================================")
-
-        if sensor["type"] == "sensor.camera.rgb":
-            # Build the K projection matrix:
-            # K = [[Fx,  0, image_w/2],
-            #      [ 0, Fy, image_h/2],
-            #      [ 0,  0,         1]]
-
-            # This (4, 4) matrix transforms the points from world to sensor coordinates.
-            world_2_camera = np.array(
-                sensor_actor.get_transform().get_inverse_matrix())
-            image_w = bp.get_attribute("image_size_x").as_int()
-            image_h = bp.get_attribute("image_size_y").as_int()
-            fov = bp.get_attribute("fov").as_float()
-            focal = image_w / (2.0 * np.tan(fov * np.pi / 360.0))
-
-            # In this case Fx and Fy are the same since the pixel aspect
-            # ratio is 1
-            K = np.identity(3)
-            K[0, 0] = K[1, 1] = focal
-            K[0, 2] = image_w / 2.0
-            K[1, 2] = image_h / 2.0
-
-            print("CAMERA INFO")
-            print("=================================================")
-            print("image_w = ", image_w)
-            print("image_h = ", image_h)
-            print("fov = ", fov)
-            print("focal = ", focal)
-            print("TRANSFORM from world to sensor coordinates = ", world_2_camera)
-            print("PROJECT from sensor to pixel coordinates = ", K)
-            print("=================================================")
+def sensorPriority(sensor):
+    """ Priority of a sensor's data in the intake; the labelled cameras by default rank above the others. """
+    if 'priority' in sensor:
+        return int(sensor['priority'])
+    labelled = ['rgb_camera', 'dvs', 'depth_camera']
+    return 1 if any(sensor['role_name'].find(name) != -1 for name in labelled) else 0
+
+
+def sensorTick(sensor):
+    # Half a tick below the period, so the server's float accumulation can not slip a tick
+    return (sensorPeriod(sensor) - 0.5) * SimulationParams.delta_seconds
+
+
+# Blueprint libraries by world id; get_blueprint_library() is a round trip to the server
+_blueprint_libraries = {}
+# Sensor blueprints with their attributes set, by world id, tick length and sensor configuration
+_sensor_blueprints = {}
+# Maps by world id; get_map() transfers the whole OpenDRIVE description
+_world_maps = {}
+
+
+def blueprintLibrary(world):
+    library = _blueprint_libraries.get(world.id)
+    if library is None:
+        library = _blueprint_libraries[world.id] = world.get_blueprint_library()
+    return library
+
+
+def worldMap(world):
+    world_map = _world_maps.get(world.id)
+    if world_map is None:
+        world_map = _world_maps[world.id] = world.get_map()
+    return world_map
+
 
+def sensorBlueprint(world, sensor):
+    """ Blueprint of a sensor configuration; views with the same sensors share the blueprints.
+        sensor_tick is rounded to whole ticks of SimulationParams.delta_seconds, so runs of a batch
+        with another tick length get blueprints of their own. """
+    key = (world.id, SimulationParams.delta_seconds, json.dumps(
+        {name: value for name, value in sensor.items() if name not in ('transform', 'priority')}, sort_keys=True))
+    bp = _sensor_blueprints.get(key)
+    if bp is not None:
+        return bp
+    bp = blueprintLibrary(world).find(sensor['type'])
+
+    # Get all the attributes EXCLUDING type, transform, sensor_tick and priority
+    blacklist = ['type', 'transform', 'sensor_tick', 'priority']
+    settable_attributes = [
+        attribute for attribute in sensor if attribute not in blacklist]
+    for attr in settable_attributes:
+        try:
+            bp.set_attribute(str(attr), str(sensor[attr]))
+        except:
+            print("attr = ", attr)
+            print("sensor[attr] = ", sensor[attr])
+            print("sensor['type'] = ", sensor['type'])
+            print("Problem with setting " + attr + "to " +
+                  sensor[attr] + " in sensor " + sensor['type'])
+    if 'sensor_tick' in sensor:
+        bp.set_attribute('sensor_tick', str(sensorTick(sensor)))
+    _sensor_blueprints[key] = bp
+    return bp
+
+
+def spawnSensors(client, world, data, transforms, parent=None):
+    """ Spawns the sensors of a configuration in one batch and returns (actors, types, names) in configuration order. """
+    blueprints = [sensorBlueprint(world, sensor) for sensor in data['sensors']]
+    batch = []
+    for bp, transform in zip(blueprints, transforms):
+        if parent is None:
+            batch.append(carla.command.SpawnActor(bp, transform))
+        else:
+            batch.append(carla.command.SpawnActor(bp, transform, parent.id))
+    results = client.apply_batch_sync(batch, False)
+
+    errors = [(sensor['role_name'], result.error)
+              for sensor, result in zip(data['sensors'], results) if result.error]
+    if errors:
+        client.apply_batch([carla.command.DestroyActor(result.actor_id)
+                            for result in results if not result.error])
+        raise RuntimeError("Could not spawn sensors: " +
+                           ", ".join(f"{name} ({error})" for name, error in errors))
+
+    actors = {actor.id: actor for actor in world.get_actors(
+        [result.actor_id for result in results])}
+    sensor_references = [actors[result.actor_id] for result in results]
+    sensor_types = [sensor['type'] for sensor in data['sensors']]
+    sensor_names = [sensor['role_name'] for sensor in data['sensors']]
+    for sensor, sensor_actor, bp in zip(data['sensors'], sensor_references, blueprints):
+        printCalibration(sensor, sensor_actor, bp)
     return sensor_references, sensor_types, sensor_names
 
 
-def attachSensorsForFixedPerception(world, data, coordinate):
+def attachSensorsToVehicle(client, world, data, vehicle_actor):
+    transforms = []
+    for sensor in data['sensors']:
+        json_trans = sensor["transform"][0]
+        relative_transf = Transform(Location(x=float(json_trans['x']), y=float(json_trans['y']), z=float(json_trans['z'])), Rotation(
+            pitch=float(json_trans['pitch']), yaw=float(json_trans['yaw']), roll=float(json_trans['roll'])))
+        transforms.append(relative_transf)
+    return spawnSensors(client, world, data, transforms, parent=vehicle_actor)
+
+
+def attachSensorsForFixedPerception(client, world, data, coordinate):
     location_data = coordinate['location']
     rotation_data = coordinate['rotation']
     location = carla.Location(
@@ -151,114 +200,80 @@ def attachSensorsForFixedPerception(world, data, coordinate):
     rotation = carla.Rotation(
                 pitch=rotation_data['pitch'], yaw=rotation_data['yaw'], roll=rotation_data['roll'])
     transform = carla.Transform(location, rotation)
-    blueprint_library = world.get_blueprint_library()
-    sensor_references = []
-    sensor_types = []
-    sensor_names = []
-    for i in range(len(data['sensors'])):
-        sensor = data['sensors'][i]
-        bp = blueprint_library.find(sensor['type'])
-
-        # Get all the attributes EXCLUDING type and transform
-        blacklist = ['type', 'transform']
-        settable_attributes = [
-            attribute for attribute in sensor if attribute not in blacklist]
-        for attr in settable_attributes:
-            try:
-                bp.set_attribute(str(attr), str(sensor[attr]))
-            except:
-                print("attr = ", attr)
-                print("sensor[attr] = ", sensor[attr])
-                print("sensor['type'] = ", sensor['type'])
-                print("Problem with setting " + attr + "to " +
-                      sensor[attr] + " in sensor " + sensor['type'])
-
-
-        sensor_actor =  world.spawn_actor(bp, transform)
-        sensor_types.append(sensor['type'])
-        sensor_names.append(sensor['role_name'])
-        sensor_references.append(sensor_actor)
-
-        # PRINT CALIBRATION MATRICES
-        if sensor["type"] == "sensor.lidar.ray_cast_semantic":
-            lidar_2_world = sensor_actor.get_transform().get_matrix()
-            print("LIDAR INFO")
-            print("=================================================")
-            print(
-                "TRANSFORM the points from lidar space to world space = ", lidar_2_world)
-            print("=================================================")
-
-        if sensor["type"] == "sensor.other.gnss":
-            gnss_2_world = sensor_actor.get_transform().get_matrix()
-            print("GNSS INFO")
-            print("=================================================")
-            print("TRANSFORM the points from gnss space to world space = ", gnss_2_world)
-            print("=================================================")
-
-        if sensor["type"] == "sensor.other.imu":
-            imu_2_world = sensor_actor.get_transform().get_matrix()
-            print("IMU INFO")
-            print("=================================================")
-            print("TRANSFORM the points from imu space to world space = ", imu_2_world)
-            print("=================================================")
-
-        if sensor["type"] == "sensor.camera.rgb":
-            # Build the K projection matrix:
-            # K = [[Fx,  0, image_w/2],
-            #      [ 0, Fy, image_h/2],
-            #      [ 0,  0,         1]]
-
-            # This (4, 4) matrix transforms the points from world to sensor coordinates.
-            world_2_camera = np.array(
-                sensor_actor.get_transform().get_inverse_matrix())
-            image_w = bp.get_attribute("image_size_x").as_int()
-            image_h = bp.get_attribute("image_size_y").as_int()
-            fov = bp.get_attribute("fov").as_float()
-            focal = image_w / (2.0 * np.tan(fov * np.pi / 360.0))
-
-            # In this case Fx and Fy are the same since the pixel aspect
-            # ratio is 1
-            K = np.identity(3)
-            K[0, 0] = K[1, 1] = focal
-            K[0, 2] = image_w / 2.0
-            K[1, 2] = image_h / 2.0
-
-            print("CAMERA INFO")
-            print("=================================================")
-            print("image_w = ", image_w)
-            print("image_h = ", image_h)
-            print("fov = ", fov)
-            print("focal = ", focal)
-            print("TRANSFORM from world to sensor coordinates = ", world_2_camera)
-            print("PROJECT from sensor to pixel coordinates = ", K)
-            print("=================================================")
+    return spawnSensors(client, world, data, [transform] * len(data['sensors']))
+
+
+def printCalibration(sensor, sensor_actor, bp):
+    # PRINT CALIBRATION MATRICES
+    if sensor["type"] == "sensor.lidar.ray_cast_semantic":
+        lidar_2_world = sensor_actor.get_transform().get_matrix()
+        print("LIDAR INFO")
+        print("=================================================")
+        print(
+            "TRANSFORM the points from lidar space to world space = ", lidar_2_world)
+        print("=================================================")
+
+    if sensor["type"] == "sensor.other.gnss":
+        gnss_2_world = sensor_actor.get_transform().get_matrix()
+        print("GNSS INFO")
+        print("=================================================")
+        print("TRANSFORM the points from gnss space to world space = ", gnss_2_world)
+        print("=================================================")
+
+    if sensor["type"] == "sensor.other.imu":
+        imu_2_world = sensor_actor.get_transform().get_matrix()
+        print("IMU INFO")
+        print("=================================================")
+        print("TRANSFORM the points from imu space to world space = ", imu_2_world)
+        print("=================================================")
+
+    if sensor["type"] == "sensor.camera.rgb":
+        # Build the K projection matrix:
+        # K = [[Fx,  0, image_w/2],
+        #      [ 0, Fy, image_h/2],
+        #      [ 0,  0,         1]]
+
+        # This (4, 4) matrix transforms the points from world to sensor coordinates.
+        world_2_camera = np.array(
+            sensor_actor.get_transform().get_inverse_matrix())
+        image_w = bp.get_attribute("image_size_x").as_int()
+        image_h = bp.get_attribute("image_size_y").as_int()
+        fov = bp.get_attribute("fov").as_float()
+        focal = image_w / (2.0 * np.tan(fov * np.pi / 360.0))
+
+        # In this case Fx and Fy are the same since the pixel aspect
+        # ratio is 1
+        K = np.identity(3)
+        K[0, 0] = K[1, 1] = focal
+        K[0, 2] = image_w / 2.0
+        K[1, 2] = image_h / 2.0
+
+        print("CAMERA INFO")
+        print("=================================================")
+        print("image_w = ", image_w)
+        print("image_h = ", image_h)
+        print("fov = ", fov)
+        print("focal = ", focal)
+        print("TRANSFORM from world to sensor coordinates = ", world_2_camera)
+        print("PROJECT from sensor to pixel coordinates = ", K)
+        print("=================================================")
 
-    return sensor_references, sensor_types, sensor_names
 
 class CarlaSyncMode(object):
     def __init__(self, world, sensors):
         self.world = world
         self.sensors = sensors
         self.frame = None
-        self._queues = []
-        # self._settings = None
+        self._settings = None
         self.first_time = True
 
     def __enter__(self):
-        def make_queue(register_event):
-            q = queue.Queue()
-            register_event(q.put)
-            self._queues.append(q)
-
-        make_queue(self.world.on_tick)
-        for sensor in self.sensors:
-            make_queue(sensor.listen)
+        # Sensor data is assembled by the views' FrameAggregators
+        self._settings = self.world.get_settings()
         return self
 
     def tick(self, timeout):
         self.frame = self.world.tick()
-        # data = [self._retrieve_data(q, timeout) for q in self._queues]
-        # assert all(x.frame == self.frame for x in data)
         return self.frame
 
     def __exit__(self, *args, **kwargs):
@@ -267,21 +282,13 @@ class CarlaSyncMode(object):
         self.world.apply_settings(self._settings)
         return
 
-    def _retrieve_data(self, sensor_queue, timeout):
-        while True:
-            data = sensor_queue.get(timeout=timeout)
-            if data.frame == self.frame:
-                return data
-            else:
-                print("frame mismatch")
-                print(data.frame)
-                print(self.frame)
-
 
-def setupTrafficManager(client):
+def setupTrafficManager(client, port=8000, seed=None):
     print("Settting up traffic manager...")
-    tm = client.get_trafficmanager(8000)
+    tm = client.get_trafficmanager(port)
     tm.set_synchronous_mode(True)
+    if seed is not None:
+        tm.set_random_device_seed(seed)
 
 
 def setupWorld(world):
@@ -325,6 +332,12 @@ def createOutputDirectories(data):
             pass
             # print("Ego folder " + ego_folder + " already exists!")
         for sensor in output_sensor_folders:
+            # rgb and dvs cameras are written to the images/labels/annotations layout
+            if sensor.find('rgb_camera') != -1:
+                make_camera_folders(ego_folder, sensor)
+                continue
+            if sensor.find('dvs') != -1:
+                continue
             try:
                 os.mkdir(os.path.join(ego_folder, sensor))
             except OSError:
@@ -355,7 +368,13 @@ def createOutputDirectoriesFixedPerception(data, id):
         pass
             # print("Ego folder " + fixed_folder + " already exists!")
     for sensor in output_sensor_folders:
+        # rgb and dvs cameras are written to the images/labels/annotations layout
+        if sensor.find('rgb_camera') != -1:
+            make_camera_folders(fixed_folder, sensor)
+            continue
+        if sensor.find('dvs') != -1:
+            continue
         try:
             os.mkdir(os.path.join(fixed_folder, sensor))
         except OSError:
-            pass
\ No newline at end of file
+            pass
@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+from utils.flow import decode_flow
+from utils.event_store import EventStore
+
+FRAME_FILE = re.compile(r'^(\d+)(-xytp|-repr)?\.(png|txt|xml|json|npz)$')
+INDEX_FILENAME = 'index.json'
+
+
+def classify(folders, filename):
+    """ Returns (camera, kind, frame) for a file of a view, or None.
+        folders are the directories between the view folder and the file.
+    """
+    match = FRAME_FILE.match(filename)
+    if match is None or not folders:
+        return None
+    frame, suffix, extension = int(match.group(1)), match.group(2), match.group(3)
+    section = folders[0]
+    if folders[-1] == 'npz':
+        return folders[-2], 'events' if suffix == '-xytp' else 'dvs_tensors', frame
+    camera = folders[-1]
+    if section == 'images':
+        return camera, 'calibration' if extension == 'txt' else 'image', frame
+    if section == 'labels':
+        return camera, 'labels', frame
+    if section == 'annotations':
+        return camera, {'xml': 'voc', 'json': 'coco', 'txt': 'kitti'}.get(extension), frame
+    if extension == 'png':
+        return camera, 'image', frame
+    if extension == 'npz' and camera.find('optical_flow') != -1:
+        return camera, 'flow', frame
+    return None
+
+
+class LRUCache:
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = load()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return value
+
+
+class RunReader:
+    """
+    Random access to everything save_sensors.py writes for a run.
+
+    reader = RunReader("out/Town10HD_Opt_19_10_2026_10_00_00")
+    image = reader.rgb("ego0", "rgb_camera-front", 1234)
+    events = reader.dvs_events("ego0", "dvs_camera-front", 1234)
+
+    The file index is stored as <run>/index.json with the modification times of the folders
+    it walked, and is rebuilt when a folder or view was added or changed since. Decoding is lazy and the
+    decoded frames are kept in an LRU cache; compiled DVS stores are memory-mapped.
+    """
+
+    def __init__(self, run_root, cache_size=256, rebuild_index=False):
+        self.run_root = run_root
+        self.cache = LRUCache(cache_size)
+        self._event_stores = {}
+        index_path = os.path.join(run_root, INDEX_FILENAME)
+        loaded = None
+        if os.path.exists(index_path) and not rebuild_index:
+            loaded = self._load_index(index_path)
+        if loaded is not None:
+            self.index, self.stores, self.folders = loaded
+        else:
+            self.index, self.stores, self.folders = self.build_index()
+            self._save_index(index_path)
+
+    def _views(self):
+        return [view for view in sorted(os.listdir(self.run_root))
+                if os.path.isdir(os.path.join(self.run_root, view))
+                and view not in ('videos', 'shards', 'relabel') and not view.startswith('.')]
+
+    def build_index(self):
+        """ {(view, camera, kind): {frame: relative path}}, {(view, camera): compiled event store}
+            and {relative folder: mtime} of the walked folders.
+        """
+        index = {}
+        stores = {}
+        folders_mtime = {}
+
+        def walk(folder, view, folders):
+            folders_mtime[os.path.relpath(folder, self.run_root)] = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if entry.name != 'videos':
+                            walk(entry.path, view, folders + [entry.name])
+                        continue
+                    if entry.name.startswith('compiled-') and entry.name.endswith('.npy') \
+                            and not entry.name.endswith('-index.npy'):
+                        stores[(view, entry.name[len('compiled-'):-len('.npy')])] = \
+                            os.path.relpath(entry.path, self.run_root)
+                        continue
+                    key = classify(folders, entry.name)
+                    if key is None or key[1] is None:
+                        continue
+                    camera, kind, frame = key
+                    index.setdefault((view, camera, kind), {})[frame] = \
+                        os.path.relpath(entry.path, self.run_root)
+
+        for view in self._views():
+            walk(os.path.join(self.run_root, view), view, [])
+        return index, stores, folders_mtime
+
+    def _is_current(self, folders_mtime):
+        """ A file added to or removed from a folder changes the folder's mtime. """
+        if set(self._views()) != set(folder for folder in folders_mtime if os.sep not in folder):
+            return False
+        try:
+            return all(os.stat(os.path.join(self.run_root, folder)).st_mtime_ns == mtime
+                       for folder, mtime in folders_mtime.items())
+        except OSError:
+            return False
+
+    def _save_index(self, index_path):
+        data = {
+            'files': [[view, camera, kind, {str(frame): path for frame, path in frames.items()}]
+                      for (view, camera, kind), frames in self.index.items()],
+            'stores': [[view, camera, path] for (view, camera), path in self.stores.items()],
+            'folders': self.folders,
+        }
+        with open(index_path, 'w') as file:
+            json.dump(data, file)
+
+    def _load_index(self, index_path):
+        """ Returns None when the stored index is out of date. """
+        with open(index_path) as file:
+            data = json.load(file)
+        if 'folders' not in data or not self._is_current(data['folders']):
+            return None
+        index = {(view, camera, kind): {int(frame): path for frame, path in frames.items()}
+                 for view, camera, kind, frames in data['files']}
+        stores = {(view, camera): path for view, camera, path in data['stores']}
+        return index, stores, data['folders']
+
+    def views(self):
+        return sorted(set(view for view, camera, kind in self.index))
+
+    def cameras(self, view):
+        return sorted(set(camera for v, camera, kind in self.index if v == view))
+
+    def frames(self, view, camera, kind='image'):
+        if kind == 'events' and (view, camera) in self.stores:
+            return self._event_store(view, camera).frames()
+        return sorted(self.index.get((view, camera, kind), {}))
+
+    def path(self, view, camera, frame, kind='image'):
+        return os.path.join(self.run_root, self.index[(view, camera, kind)][frame])
+
+    def get(self, view, camera, frame, kind='image'):
+        return self.cache.get((view, camera, frame, kind),
+                              lambda: self._decode(view, camera, frame, kind))
+
+    def _decode(self, view, camera, frame, kind):
+        if kind == 'events' and (view, camera) in self.stores:
+            return self._event_store(view, camera)[frame]
+        path = self.path(view, camera, frame, kind)
+        if kind == 'image':
+            return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if kind == 'flow':
+            with np.load(path) as stored:
+                return decode_flow(stored)
+        if kind == 'events':
+            with np.load(path) as stored:
+                return stored['dvs_events']
+        if kind == 'dvs_tensors':
+            with np.load(path) as stored:
+                return {name: stored[name] for name in stored.files}
+        if kind == 'labels':
+            labels = np.loadtxt(path, dtype=np.float32, ndmin=2)
+            return labels.reshape((-1, 5))
+        with open(path) as file:
+            if kind == 'coco':
+                return json.load(file)
+            return file.read()
+
+    def _event_store(self, view, camera):
+        store = self._event_stores.get((view, camera))
+        if store is None:
+            store = EventStore(os.path.join(
+                self.run_root, self.stores[(view, camera)]))
+            self._event_stores[(view, camera)] = store
+        return store
+
+    def rgb(self, view, camera, frame):
+        return self.get(view, camera, frame, 'image')
+
+    def depth(self, view, camera, frame):
+        return self.get(view, camera, frame, 'image')
+
+    def segmentation(self, view, camera, frame):
+        return self.get(view, camera, frame, 'image')
+
+    def flow(self, view, camera, frame):
+        return self.get(view, camera, frame, 'flow')
+
+    def dvs_events(self, view, camera, frame):
+        return self.get(view, camera, frame, 'events')
+
+    def labels(self, view, camera, frame):
+        """ YOLO labels as a (N, 5) array of class, center x, center y, width, height. """
+        return self.get(view, camera, frame, 'labels')
@@ -0,0 +1,112 @@
+import numpy as np
+
+# Layout of sensor.camera.dvs raw_data
+DVS_EVENT_DTYPE = np.dtype([
+    ('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', np.bool_)])
+
+REPRESENTATIONS = ['voxel_grid', 'time_surface', 'event_histogram']
+NORMALIZATIONS = ['none', 'max', 'zscore']
+
+
+def decode_dvs_events(raw_data):
+    return np.frombuffer(raw_data, dtype=DVS_EVENT_DTYPE)
+
+
+def _pixel_index(events, width):
+    return events['y'].astype(np.int64) * width + events['x'].astype(np.int64)
+
+
+def _normalize(array, normalization):
+    if normalization == 'none':
+        return array
+    if normalization == 'max':
+        peak = np.max(np.abs(array))
+        return array / peak if peak > 0 else array
+    if normalization == 'zscore':
+        # Statistics over the pixels that saw events, as in E2VID
+        nonzero = array != 0
+        if not nonzero.any():
+            return array
+        mean = array[nonzero].mean()
+        std = array[nonzero].std()
+        array = np.where(nonzero, array - mean, 0)
+        return array / std if std > 0 else array
+    raise ValueError("Unknown normalization " + str(normalization))
+
+
+def event_histogram(events, height, width, normalization='none'):
+    """ (2, H, W) counts of positive and negative events per pixel. """
+    index = _pixel_index(events, width)
+    pol = events['pol']
+    positive = np.bincount(index[pol], minlength=height * width)
+    negative = np.bincount(index[~pol], minlength=height * width)
+    histogram = np.stack([positive, negative]).reshape(
+        (2, height, width)).astype(np.float32)
+    return _normalize(histogram, normalization).astype(np.float32)
+
+
+def voxel_grid(events, height, width, bins=5, normalization='none'):
+    """ (bins, H, W) polarity weighted events, linearly interpolated between the two nearest time bins. """
+    grid = np.zeros(bins * height * width, dtype=np.float32)
+    if len(events) == 0:
+        return grid.reshape((bins, height, width))
+
+    t = events['t'].astype(np.float64)
+    duration = t.max() - t.min()
+    t = (bins - 1) * (t - t.min()) / duration if duration > 0 else np.zeros_like(t)
+    left_bin = np.floor(t).astype(np.int64)
+    right_weight = (t - left_bin).astype(np.float32)
+    polarity = np.where(events['pol'], 1.0, -1.0).astype(np.float32)
+    index = _pixel_index(events, width)
+
+    size = bins * height * width
+    grid += np.bincount(left_bin * height * width + index,
+                        weights=polarity * (1.0 - right_weight), minlength=size)
+    in_range = left_bin + 1 < bins
+    grid += np.bincount((left_bin[in_range] + 1) * height * width + index[in_range],
+                        weights=polarity[in_range] * right_weight[in_range], minlength=size)
+    return _normalize(grid.reshape((bins, height, width)), normalization).astype(np.float32)
+
+
+def time_surface(events, height, width, tau=0.3, normalization='none'):
+    """ (2, H, W) exponentially decayed age of the latest positive / negative event per pixel.
+        tau is a fraction of the frame's event window so the result does not depend on timestamp units.
+    """
+    surface = np.zeros((2, height * width), dtype=np.float32)
+    if len(events) == 0:
+        return surface.reshape((2, height, width))
+
+    t = events['t']
+    t_start, t_end = t.min(), t.max()
+    decay = max(float(t_end - t_start) * tau, 1e-9)
+    index = _pixel_index(events, width)
+    channel = np.where(events['pol'], 0, 1)
+
+    latest = np.full(2 * height * width, t_start - 1, dtype=np.int64)
+    np.maximum.at(latest, channel * height * width + index, t)
+    latest = latest.reshape((2, height * width))
+    seen = latest >= t_start
+    surface[seen] = np.exp(-(t_end - latest[seen]).astype(np.float64) / decay)
+    return _normalize(surface.reshape((2, height, width)), normalization).astype(np.float32)
+
+
+def build_representations(events, height, width, representations, bins=5, tau=0.3, normalization='none'):
+    """ Returns a dict name -> tensor for each requested representation. """
+    output = {}
+    for name in representations:
+        if name == 'voxel_grid':
+            output[name] = voxel_grid(events, height, width, bins, normalization)
+        elif name == 'time_surface':
+            output[name] = time_surface(events, height, width, tau, normalization)
+        elif name == 'event_histogram':
+            output[name] = event_histogram(events, height, width, normalization)
+        else:
+            raise ValueError("Unknown DVS representation " + str(name))
+    return output
+
+
+def render_dvs_image(events, height, width):
+    """ BGR image with positive events in blue and negative events in red. """
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[events['y'], events['x'], np.where(events['pol'], 0, 2)] = 255
+    return image
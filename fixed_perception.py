@@ -1,14 +1,14 @@
 import carla
 from carla import Transform, Location, Rotation
 from npc_spawning import spawnWalkers, spawnVehicles
-from configuration import attachSensorsForFixedPerception, SimulationParams, setupTrafficManager, setupWorld, createOutputDirectoriesFixedPerception, CarlaSyncMode
+from configuration import attachSensorsForFixedPerception, SimulationParams, sensorPeriod, sensorPriority, setupTrafficManager, setupWorld, createOutputDirectoriesFixedPerception, CarlaSyncMode
 from utils import g29_steering_wheel
 import save_sensors
 import random
 import json
 import time
-import queue
 import threading
+from frame_aggregator import FrameAggregator
 
 
 def findClosestSpawnPoint(spawn_points, target):
@@ -19,8 +19,10 @@ def findClosestSpawnPoint(spawn_points, target):
 
 class FixedPerception:
 
-    def __init__(self, config_filepath, position, world, args, coordinate):
+    def __init__(self, config_filepath, position, client, world, args, coordinate, view=None):
         self.world = world
+        self.view = view
+        self.on_tick_id = None
 
         f = open(config_filepath)
         data = json.load(f)
@@ -28,37 +30,44 @@ class FixedPerception:
         createOutputDirectoriesFixedPerception(data, coordinate['id'])
 
         self.sensors_ref, self.sensor_types, self.sensor_names = attachSensorsForFixedPerception(
-            world, data, coordinate)  
+            client, world, data, coordinate)  
 
-        self.queues = []
-        q = queue.Queue()
-        world.on_tick(q.put)
-        self.queues.append(q)
-        self.sensor_q_map = {}
-        self.sensor_q_map[q] = None
-        for sensor in self.sensors_ref:
-            q = queue.Queue()
-            sensor.listen(q.put)
-            self.sensor_q_map[q] = sensor
-            self.queues.append(q)
+        # Bundle slot 0 is the world snapshot, then one slot per sensor; they are fed from listen()
+        telemetry = SimulationParams.telemetry
+        intake = SimulationParams.intake
+        self.sensor_priorities = [sensorPriority(sensor) for sensor in data['sensors']]
+        self.sensor_periods = [sensorPeriod(sensor) for sensor in data['sensors']]
+        if SimulationParams.backpressure is not None:
+            SimulationParams.backpressure.set_priorities(self.sensor_priorities)
+        self.aggregator = FrameAggregator(
+            len(self.sensors_ref) + 1, SimulationParams.max_frames_in_flight,
+            periods=[1] + self.sensor_periods,
+            on_arrival=None if telemetry is None else telemetry.arrival_callback(view, self.sensor_names),
+            intake=None if intake is None else intake.view_intake(
+                view, self.sensor_names, self.sensor_types, self.sensor_priorities))
+
+    def listen(self, first_frame):
+        """ Starts the sensors of the view; data of frames before first_frame is dropped. """
+        self.aggregator.start_at(first_frame)
+        self.on_tick_id = self.world.on_tick(self.aggregator.callback(0))
+        for i, sensor in enumerate(self.sensors_ref):
+            sensor.listen(self.aggregator.callback(i + 1))
 
     def getSensorData(self, frame_id):
         try:
-            data = [self._retrieve_data(q, frame_id) for q in self.queues]
-            return data
+            bundle = self.aggregator.wait_for(frame_id, timeout=60.0)
+            if SimulationParams.backpressure is not None:
+                bundle = SimulationParams.backpressure.decimate(
+                    frame_id, bundle, [None] + self.sensor_priorities, [1] + self.sensor_periods)
+            sensors = [None] + self.sensors_ref
+            return [(data, sensor) for data, sensor in zip(bundle, sensors)]
         except Exception as error:
             print("An exception occurred:", error)
 
-    def _retrieve_data(self, sensor_queue, frame_id):
-        while True:
-            data = sensor_queue.get(timeout=60.0)
-            sensor = None
-            if sensor_queue in self.sensor_q_map:
-                sensor = self.sensor_q_map[sensor_queue]
-            if data.frame == frame_id:
-                return (data,sensor)
-
     def destroy(self):
+        print("Frame aggregator:", self.aggregator.metrics())
+        if self.on_tick_id is not None:
+            self.world.remove_on_tick(self.on_tick_id)
         [s.destroy() for s in self.sensors_ref]
         # This is to prevent Unreal from crashing from waiting the client.
         settings = self.world.get_settings()
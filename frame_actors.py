@@ -0,0 +1,112 @@
+"""
+Actors and sensors as they were at one simulation frame.
+
+With several frames in flight, the live actors have moved on by the time a frame is labelled.
+The labelling code (bb.py, save_sensors.py) only needs id, type_id, attributes, bounding_box
+and get_transform() of an actor, so these proxies answer get_transform() from the world
+snapshot of the frame, and from the sensor data for sensors.
+
+For offline labelling, actor_record() stores that much of an agent as JSON and RecordedActor
+answers the same from the record.
+"""
+
+import carla
+
+AGENT_PATTERNS = ["*vehicle*", "*pedestrian*"]
+
+
+class FrameActor:
+    def __init__(self, actor, transform):
+        self.actor = actor
+        self.id = actor.id
+        self.type_id = actor.type_id
+        self.attributes = actor.attributes
+        self.bounding_box = actor.bounding_box
+        self._transform = transform
+
+    def get_transform(self):
+        return self._transform
+
+
+class FrameSensor:
+    def __init__(self, sensor, transform):
+        self.sensor = sensor
+        self.id = sensor.id
+        self.type_id = sensor.type_id
+        self.attributes = sensor.attributes
+        self._transform = transform
+
+    def get_transform(self):
+        return self._transform
+
+
+def frame_agents(world, snapshot):
+    """ Returns [(class_name, FrameActor)] of the vehicles and pedestrians alive at the snapshot. """
+    agents = []
+    for pattern in AGENT_PATTERNS:
+        for actor in world.get_actors().filter(pattern):
+            actor_snapshot = snapshot.find(actor.id) if snapshot is not None else None
+            if snapshot is not None and actor_snapshot is None:
+                # Spawned after this frame
+                continue
+            if pattern == "*pedestrian*":
+                class_name = 'pedestrian'
+            else:
+                class_name = actor.attributes.get('base_type')
+            transform = actor_snapshot.get_transform(
+            ) if actor_snapshot is not None else actor.get_transform()
+            agents.append((class_name, FrameActor(actor, transform)))
+    return agents
+
+
+class RecordedActor:
+    def __init__(self, record):
+        self.id = record['id']
+        self.type_id = record['type_id']
+        self.attributes = record['attributes']
+        self.bounding_box = carla.BoundingBox(
+            carla.Location(*record['bbox_location']), carla.Vector3D(*record['extent']))
+        self._transform = record_transform(record['transform'])
+
+    def get_transform(self):
+        return self._transform
+
+
+class RecordedSensor:
+    def __init__(self, record):
+        self.id = record['id']
+        self.type_id = record['type_id']
+        self.attributes = record.get('attributes', {})
+        self._transform = record_transform(record['transform'])
+
+    def get_transform(self):
+        return self._transform
+
+
+def transform_record(transform):
+    location, rotation = transform.location, transform.rotation
+    return [location.x, location.y, location.z, rotation.pitch, rotation.yaw, rotation.roll]
+
+
+def record_transform(record):
+    return carla.Transform(carla.Location(*record[:3]), carla.Rotation(*record[3:]))
+
+
+def actor_record(class_name, agent):
+    """ JSON serialisable state of an agent of frame_agents(), see RecordedActor. """
+    bounding_box = agent.bounding_box
+    return {
+        'class': class_name,
+        'id': agent.id,
+        'type_id': agent.type_id,
+        # base_type is the only attribute the labels use
+        'attributes': {key: value for key, value in agent.attributes.items() if key == 'base_type'},
+        'bbox_location': [bounding_box.location.x, bounding_box.location.y, bounding_box.location.z],
+        'extent': [bounding_box.extent.x, bounding_box.extent.y, bounding_box.extent.z],
+        'transform': transform_record(agent.get_transform()),
+    }
+
+
+def recorded_agents(records):
+    """ [(class_name, RecordedActor)] of actor_record() records, as frame_agents() returns them. """
+    return [(record['class'], RecordedActor(record)) for record in records]
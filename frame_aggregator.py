@@ -0,0 +1,193 @@
+import time
+import threading
+
+# Bundle slot of data the intake dropped; reported, but None in the returned bundle
+DROPPED = object()
+
+
+class FrameAggregator:
+    """
+    Assembles the data of a set of sensors into per-frame bundles. Sensor callbacks push
+    into it directly (sensor.listen(aggregator.callback(i))) and wait_for(frame) returns
+    the bundle, in sensor order, as soon as every sensor has reported that frame.
+
+    Sensors may run at a fraction of the tick rate: periods[i] is the number of ticks between
+    two captures of sensor i. A sensor is due at the frames that are a whole number of periods
+    after the last frame it reported; a bundle is complete once every due sensor has reported,
+    and the slots of sensors that are not due stay None.
+
+    Frames that are not complete by the time max_pending newer frames exist are evicted,
+    as are frames older than a requested frame by max_frames_in_flight or more.
+
+    on_arrival(index, frame), if given, is called on the sensor thread for every pushed data.
+    start_at(frame) drops the data of earlier frames, e.g. of frames still in the server's
+    pipeline when the sensors start listening.
+
+    intake, if given, admits every pushed data against the memory budget (see intake.py);
+    it may drop it or replace it by a spilled stand-in. The memory of a bundle returned by
+    wait_for() is held until release(frame) is called once the bundle is saved.
+    """
+
+    def __init__(self, sensor_count, max_frames_in_flight=1, max_pending=None, periods=None, on_arrival=None,
+                 intake=None):
+        self.sensor_count = sensor_count
+        self.on_arrival = on_arrival
+        self.intake = intake
+        self.periods = periods or [1] * sensor_count
+        # Last frame each sensor reported, anchors the due frames of decimated sensors
+        self._last_frame = [None] * sensor_count
+        self.max_frames_in_flight = max_frames_in_flight
+        self.max_pending = max_pending or max(4, 2 * max_frames_in_flight)
+        self._condition = threading.Condition()
+        # frame -> [bundle, due sensors received, due sensors, first arrival, completion time, [bytes, spill slots]]
+        self._frames = {}
+        # Intake held by bundles returned and not yet released
+        self._held = {}
+        self._evicted_below = None
+        self._metrics = {
+            'completed': 0,
+            'evicted_partial': 0,
+            'evicted_complete': 0,
+            'late': 0,
+            'dropped': 0,
+            'timeouts': 0,
+            'assembly_seconds_total': 0.0,
+            'assembly_seconds_max': 0.0,
+        }
+
+    def callback(self, index):
+        return lambda data: self.push(index, data)
+
+    def push(self, index, data):
+        now = time.monotonic()
+        frame = data.frame
+        if self.on_arrival is not None:
+            self.on_arrival(index, frame)
+        if self._is_late(frame):
+            return
+        nbytes, slot = 0, None
+        if self.intake is not None:
+            data, nbytes, slot = self.intake.admit(index, data)
+        with self._condition:
+            if self._evicted_below is not None and frame < self._evicted_below:
+                self._metrics['late'] += 1
+                self._release_intake([nbytes, [] if slot is None else [slot]])
+                return
+            entry = self._frames.get(frame)
+            if entry is None:
+                due = self._due(frame)
+                entry = [[None] * self.sensor_count, 0, due, now, None, [0, []]]
+                self._frames[frame] = entry
+                self._evict_overflow()
+                if frame not in self._frames:
+                    # Older than every pending frame, evicted right away
+                    self._release_intake([nbytes, [] if slot is None else [slot]])
+                    return
+            entry[5][0] += nbytes
+            if slot is not None:
+                entry[5][1].append(slot)
+            if data is None:
+                self._metrics['dropped'] += 1
+                data = DROPPED
+            if entry[0][index] is None and index in entry[2]:
+                entry[1] += 1
+            entry[0][index] = data
+            if self._last_frame[index] is None or frame > self._last_frame[index]:
+                self._last_frame[index] = frame
+            if entry[1] == len(entry[2]):
+                entry[4] = now
+                self._condition.notify_all()
+
+    def _is_late(self, frame):
+        with self._condition:
+            if self._evicted_below is not None and frame < self._evicted_below:
+                self._metrics['late'] += 1
+                return True
+            return False
+
+    def _release_intake(self, held):
+        if self.intake is not None and (held[0] or held[1]):
+            self.intake.release(held[0], held[1])
+
+    def _due(self, frame):
+        due = set()
+        for index, period in enumerate(self.periods):
+            if period == 1:
+                due.add(index)
+                continue
+            last = self._last_frame[index]
+            if last is not None and (frame - last) % period == 0:
+                due.add(index)
+        return due
+
+    def wait_for(self, frame_id, timeout=60.0):
+        """ Returns the complete bundle of frame_id; raises TimeoutError if it does not complete in time. """
+        with self._condition:
+            complete = self._condition.wait_for(
+                lambda: self._is_complete(frame_id), timeout)
+            self._evict_before(frame_id - self.max_frames_in_flight + 1)
+            if not complete:
+                self._metrics['timeouts'] += 1
+                entry = self._frames.pop(frame_id, None)
+                if entry is not None:
+                    self._release_intake(entry[5])
+                missing = len(self._due(frame_id)) if entry is None else len(entry[2]) - entry[1]
+                raise TimeoutError(
+                    f"Frame {frame_id} incomplete after {timeout}s, {missing} sensors missing")
+            bundle, count, due, first_arrival, completed_at, held = self._frames.pop(frame_id)
+            self._held[frame_id] = held
+            bundle = [None if data is DROPPED else data for data in bundle]
+            latency = completed_at - first_arrival
+            self._metrics['completed'] += 1
+            self._metrics['assembly_seconds_total'] += latency
+            self._metrics['assembly_seconds_max'] = max(
+                self._metrics['assembly_seconds_max'], latency)
+            return bundle
+
+    def _is_complete(self, frame_id):
+        entry = self._frames.get(frame_id)
+        return entry is not None and entry[1] == len(entry[2])
+
+    def release(self, frame_id):
+        """ Returns the intake held by the bundle of frame_id to the budget. """
+        with self._condition:
+            held = self._held.pop(frame_id, None)
+        if held is not None:
+            self._release_intake(held)
+
+    def _evict(self, frame):
+        entry = self._frames.pop(frame)
+        self._release_intake(entry[5])
+        if entry[1] == len(entry[2]):
+            self._metrics['evicted_complete'] += 1
+        else:
+            self._metrics['evicted_partial'] += 1
+        if self._evicted_below is None or frame >= self._evicted_below:
+            self._evicted_below = frame + 1
+
+    def _evict_before(self, frame_id):
+        for frame in [f for f in self._frames if f < frame_id]:
+            self._evict(frame)
+
+    def _evict_overflow(self):
+        while len(self._frames) > self.max_pending:
+            self._evict(min(self._frames))
+
+    def start_at(self, frame):
+        with self._condition:
+            self._evict_before(frame)
+            if self._evicted_below is None or frame > self._evicted_below:
+                self._evicted_below = frame
+
+    def pending(self):
+        with self._condition:
+            return len(self._frames)
+
+    def metrics(self):
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics['pending'] = len(self._frames)
+        completed = metrics['completed']
+        metrics['assembly_seconds_mean'] = metrics['assembly_seconds_total'] / \
+            completed if completed else 0.0
+        return metrics
@@ -0,0 +1,199 @@
+"""
+Memory budget of the sensor data that has arrived but is not saved yet.
+
+Every view's FrameAggregator admits the data pushed by the sensor callbacks through an
+IntakeBudget shared by all views. A view's bundle is released when the writer jobs of its
+frame are written (WriterPool.when_written), since they may hold copies of its data.
+Within the budget all data is kept in memory. Over budget, --intake-policy decides:
+
+block  the tick loop waits before the next tick until saving has brought the intake back
+       under the budget
+drop   data of sensors below the highest priority is dropped; its slot of the bundle stays
+       None, like that of a sensor that is not due
+spill  raw buffers of rgb and dvs cameras are moved to files of a bounded spill ring on local
+       disk and read back when the frame is saved
+
+drop and spill fall back to blocking for the data they must keep. A sensor's priority is its
+"priority" key in the sensor configuration, by default 1 for the labelled rgb, dvs and depth
+cameras and 0 for the others. Drops are counted per view and sensor in <run>/intake_drops.json.
+"""
+
+import os
+import json
+import time
+import threading
+import collections
+import numpy as np
+
+POLICIES = ['block', 'drop', 'spill']
+# Sensor data the labelling reads through raw_data only, so a file can stand in for it
+SPILLABLE_TYPES = ['sensor.camera.rgb', 'sensor.camera.dvs']
+
+
+class SpillRing:
+    """ At most capacity bytes of buffers in reusable slot files of a folder. """
+
+    def __init__(self, folder, capacity):
+        self.folder = folder
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._used = 0
+        self._free_slots = []
+        self._slots = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def store(self, buffer):
+        """ Writes buffer to a free slot; returns the slot, or None when the ring is full. """
+        nbytes = len(buffer)
+        with self._lock:
+            if self._used + nbytes > self.capacity:
+                return None
+            self._used += nbytes
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = self._slots
+                self._slots += 1
+        with open(self._path(slot), 'wb') as file:
+            file.write(buffer)
+        return slot, nbytes
+
+    def load(self, slot):
+        return np.fromfile(self._path(slot[0]), dtype=np.uint8)
+
+    def free(self, slot):
+        with self._lock:
+            self._used -= slot[1]
+            self._free_slots.append(slot[0])
+
+    def _path(self, slot):
+        return os.path.join(self.folder, f'{slot}.raw')
+
+    def close(self):
+        for slot in range(self._slots):
+            if os.path.exists(self._path(slot)):
+                os.remove(self._path(slot))
+
+
+class SpilledImage:
+    """ Camera data whose raw_data was moved to the spill ring, with the attributes the labelling reads. """
+
+    def __init__(self, data, ring, slot):
+        self.frame = data.frame
+        self.timestamp = data.timestamp
+        self.transform = data.transform
+        self.width = data.width
+        self.height = data.height
+        self.fov = getattr(data, 'fov', None)
+        self._ring = ring
+        self.slot = slot
+
+    @property
+    def raw_data(self):
+        return self._ring.load(self.slot)
+
+
+class IntakeBudget:
+    def __init__(self, budget_bytes, policy='block', counter_path=None, spill_folder=None, spill_bytes=0):
+        self.budget_bytes = budget_bytes
+        self.policy = policy
+        self.counter_path = counter_path
+        self.ring = SpillRing(spill_folder, spill_bytes) if policy == 'spill' else None
+        self._condition = threading.Condition()
+        self._used = 0
+        self._top_priority = 0
+        self._drops = collections.Counter()
+        self._spills = collections.Counter()
+        self._counters_written = 0.0
+        self._dirty = False
+
+    def view_intake(self, view, names, types, priorities):
+        """ Admission of one view's bundle slots: the world snapshot, then the sensors in configuration order. """
+        with self._condition:
+            self._top_priority = max([self._top_priority] + priorities)
+        return ViewIntake(self, [view + '/world'] + [view + '/' + name for name in names],
+                          [None] + types, [None] + priorities)
+
+    def admit(self, sensor, sensor_type, priority, data):
+        """ Returns (data to keep or None if dropped, bytes held in memory, spill slot or None). """
+        raw_data = getattr(data, 'raw_data', None)
+        nbytes = len(raw_data) if raw_data is not None else 0
+        with self._condition:
+            over = self._used + nbytes > self.budget_bytes
+            if over and self.policy == 'drop' and priority is not None and priority < self._top_priority:
+                self._drops[sensor] += 1
+                self._dirty = True
+                return None, 0, None
+            spill = over and self.policy == 'spill' and sensor_type in SPILLABLE_TYPES
+            if not spill:
+                self._used += nbytes
+                return data, nbytes, None
+        slot = self.ring.store(raw_data)
+        with self._condition:
+            if slot is None:
+                # Ring full, keep it in memory
+                self._used += nbytes
+                return data, nbytes, None
+            self._spills[sensor] += 1
+            self._dirty = True
+        return SpilledImage(data, self.ring, slot), 0, slot
+
+    def release(self, nbytes, slots=()):
+        for slot in slots:
+            self.ring.free(slot)
+        with self._condition:
+            self._used -= nbytes
+            self._condition.notify_all()
+
+    def used(self):
+        with self._condition:
+            return self._used
+
+    def wait(self, timeout=60.0):
+        """ Called before a tick; blocks while the intake is over budget. Returns the seconds waited. """
+        started = time.monotonic()
+        with self._condition:
+            within = self._condition.wait_for(
+                lambda: self._used <= self.budget_bytes, timeout)
+        if not within:
+            print(f"Intake still over budget after {timeout}s "
+                  f"({self.used() / 1e6:.0f} of {self.budget_bytes / 1e6:.0f} MB), ticking anyway")
+        if self._dirty and time.monotonic() - self._counters_written > 1.0:
+            self.write_counters()
+        return time.monotonic() - started
+
+    def write_counters(self):
+        with self._condition:
+            counters = {'policy': self.policy, 'budget_bytes': self.budget_bytes,
+                        'drops': dict(self._drops), 'spills': dict(self._spills),
+                        'total_drops': sum(self._drops.values())}
+            self._dirty = False
+            self._counters_written = time.monotonic()
+        if self.counter_path is not None:
+            temporary = self.counter_path + '.tmp'
+            with open(temporary, 'w') as file:
+                json.dump(counters, file, indent=4)
+            os.replace(temporary, self.counter_path)
+        return counters
+
+    def close(self):
+        counters = self.write_counters()
+        if counters['total_drops'] or counters['spills']:
+            print(f"Intake: {counters['total_drops']} sensor data dropped, "
+                  f"{sum(counters['spills'].values())} spilled to disk")
+        if self.ring is not None:
+            self.ring.close()
+
+
+class ViewIntake:
+    def __init__(self, budget, sensors, types, priorities):
+        self.budget = budget
+        self.sensors = sensors
+        self.types = types
+        self.priorities = priorities
+
+    def admit(self, index, data):
+        return self.budget.admit(self.sensors[index], self.types[index], self.priorities[index], data)
+
+    def release(self, nbytes, slots=()):
+        self.budget.release(nbytes, slots)
@@ -0,0 +1,202 @@
+"""
+Labels a capture recorded with --record-raw on all cores, or labels any capture again with
+other labelling thresholds.
+
+> python labeler.py out/Town03_01_01_2024_12_00_00 --workers 16 --dvs-representations voxel_grid
+
+Reads <view>/raw/ (see raw_recording.py) of every view of the run, from loose files or from the
+tar shards of --output-format tar, and writes the images,
+DVS events, YOLO labels, Pascal VOC, COCO and KITTI annotations and calibration files of each
+recorded rgb camera frame into the usual layout (see output_layout.py), exactly as the capture
+does without --record-raw.
+
+> python labeler.py out/Town03_01_01_2024_12_00_00 --relabel --min-bbox-area 50 --occlusion-bins 0.1 0.4 0.7
+
+computes the labels and annotations only, from the recorded actors, poses and depth and the
+saved DVS events, under the given bb.LabelingParams, and writes them to
+<run>/relabel/<version>/<view>/{labels,annotations}/... with the parameters in
+<run>/relabel/<version>/labeling.json. The version is named after a hash of the parameters
+unless --version is given.
+
+Frames are labelled independently, one task per camera frame. The carla package (or
+mock_carla/ on the path) is needed for its geometry types only.
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import traceback
+import multiprocessing
+
+import numpy as np
+
+import raw_recording
+import save_sensors
+from bb import LabelingParams
+from configuration import SimulationParams
+from frame_actors import FrameSensor
+from output_backend import RunFiles
+from output_layout import camera_folders, make_camera_folders
+
+RELABEL_FOLDER = 'relabel'
+# Files of the run being labelled, in each worker
+run_files = None
+
+
+def init_worker(options):
+    global run_files
+    run_files = RunFiles(options['run_folder'])
+    SimulationParams.dvs_representations = options['dvs_representations']
+    SimulationParams.dvs_bins = options['dvs_bins']
+    SimulationParams.dvs_time_surface_tau = options['dvs_time_surface_tau']
+    SimulationParams.dvs_normalization = options['dvs_normalization']
+    SimulationParams.dvs_png = options['dvs_png']
+    SimulationParams.labeling = LabelingParams.from_dict(options['labeling'])
+    # Plain files written by this process, no capture time sinks
+    SimulationParams.writer_pool = None
+    SimulationParams.video_sink = None
+    SimulationParams.run_index = None
+    SimulationParams.output_backend = None
+    SimulationParams.telemetry = None
+    SimulationParams.backpressure = None
+
+
+def label_frame(task):
+    view_folder, camera, frame = task
+    try:
+        agents, sensor, output, dvs, depth = raw_recording.load_camera(
+            view_folder, camera, frame, run_files)
+        save_sensors.saveRgbImage(output, os.path.join(view_folder, camera),
+                                  agents, sensor, None, dvs, depth)
+        return True
+    except Exception as error:
+        print(f"An exception occurred labelling {view_folder}/{camera} frame {frame}:", error)
+        traceback.print_exc()
+        return False
+
+
+def relabel_frame(task):
+    view_folder, camera, frame, version_view_folder = task
+    try:
+        agents, sensor, output, dvs, depth = raw_recording.load_camera(
+            view_folder, camera, frame, run_files)
+        if dvs.raw_data is not None:
+            dvs_events = save_sensors.decode_dvs_events(dvs.raw_data)
+        else:
+            events_path = os.path.join(camera_folders(view_folder, camera)['dvs_events'],
+                                       f'{output.frame}-xytp.npz')
+            with run_files.open(events_path, 'rb') as file, np.load(file) as events:
+                dvs_events = events['dvs_events']
+        labels = save_sensors.label_agents(agents, FrameSensor(sensor, output.transform), output, None,
+                                           dvs_events, save_sensors.decode_depth(depth), SimulationParams.labeling)
+        save_sensors.save_annotations(camera_folders(
+            version_view_folder, camera), output, labels)
+        return True
+    except Exception as error:
+        print(f"An exception occurred relabelling {view_folder}/{camera} frame {frame}:", error)
+        traceback.print_exc()
+        return False
+
+
+def params_version(params):
+    """ Stable name of a parameter set, e.g. v-3f2a9c1e """
+    text = json.dumps(params.to_dict(), sort_keys=True)
+    return 'v-' + hashlib.sha1(text.encode()).hexdigest()[:8]
+
+
+def recorded_views(run_folder, files, views=None):
+    """ Views of a run (ego0, fixed-1, ...) that hold a raw recording. """
+    names = views or files.listdir(run_folder)
+    return [os.path.join(run_folder, name) for name in names
+            if files.isdir(os.path.join(run_folder, name, raw_recording.RAW_FOLDER))]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Label a capture recorded with --record-raw, or label a capture again')
+    parser.add_argument('run_folder', help='Run folder, e.g. out/<run name>')
+    parser.add_argument('--views', nargs='*', default=None,
+                        help='Views to label, e.g. ego0 fixed-1 (default: all)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes (default: number of cores)')
+    parser.add_argument('--dvs-representations', nargs='*', default=[],
+                        choices=['voxel_grid', 'time_surface', 'event_histogram'],
+                        help='DVS tensors to build per camera per frame (default: none)')
+    parser.add_argument('--dvs-bins', default=5, type=int,
+                        help='Number of time bins of the DVS voxel grid (default: 5)')
+    parser.add_argument('--dvs-time-surface-tau', default=0.3, type=float,
+                        help='Decay of the DVS time surface as a fraction of the time spanned by the events of the frame (default: 0.3)')
+    parser.add_argument('--dvs-normalization', default='none', choices=['none', 'max', 'zscore'],
+                        help='Normalisation of the DVS tensors (default: none)')
+    parser.add_argument('--no-dvs-png', default=False, action='store_true',
+                        help='Do not write the red/blue DVS rendering (default: False)')
+    parser.add_argument('--relabel', default=False, action='store_true',
+                        help='Write labels and annotations only, to <run>/relabel/<version>/ (default: False)')
+    parser.add_argument('--version', default=None,
+                        help='Name of the relabel version (default: hash of the labelling parameters)')
+    defaults = LabelingParams()
+    parser.add_argument('--min-visible-vertices', default=defaults.min_visible_vertices, type=int,
+                        help=f'Box corners that must be visible for a label (default: {defaults.min_visible_vertices})')
+    parser.add_argument('--min-bbox-area', default=defaults.min_bbox_area, type=float,
+                        help=f'Smallest labelled 2D box in pixels (default: {defaults.min_bbox_area:g})')
+    parser.add_argument('--max-render-depth', default=defaults.max_render_depth, type=float,
+                        help=f'Farthest labelled box corner in meters (default: {defaults.max_render_depth:g})')
+    parser.add_argument('--occlusion-bins', default=defaults.occlusion_bins, type=float, nargs=3,
+                        help='Occluded fractions between the KITTI occlusion levels 0-3 (default: 0.25 0.5 0.75)')
+    args = parser.parse_args()
+
+    params = LabelingParams(args.min_visible_vertices, args.min_bbox_area,
+                            args.max_render_depth, args.occlusion_bins)
+    if args.relabel:
+        version_folder = os.path.join(
+            args.run_folder, RELABEL_FOLDER, args.version or params_version(params))
+        os.makedirs(version_folder, exist_ok=True)
+        with open(os.path.join(version_folder, 'labeling.json'), 'w') as file:
+            json.dump(params.to_dict(), file, indent=4)
+
+    files = RunFiles(args.run_folder)
+    tasks = []
+    for view_folder in recorded_views(args.run_folder, files, args.views):
+        if args.relabel:
+            version_view_folder = os.path.join(
+                version_folder, os.path.basename(view_folder))
+            for camera, frames in raw_recording.recorded_cameras(view_folder, 'depth', files).items():
+                make_camera_folders(version_view_folder, camera)
+                tasks += [(view_folder, camera, frame, version_view_folder)
+                          for frame in frames]
+        else:
+            for camera, frames in raw_recording.recorded_cameras(view_folder, 'rgb', files).items():
+                make_camera_folders(view_folder, camera)
+                tasks += [(view_folder, camera, frame) for frame in frames]
+    if not tasks:
+        print(f"No raw recordings found in {args.run_folder}")
+        return
+
+    options = {
+        'run_folder': args.run_folder,
+        'dvs_representations': args.dvs_representations,
+        'dvs_bins': args.dvs_bins,
+        'dvs_time_surface_tau': args.dvs_time_surface_tau,
+        'dvs_normalization': args.dvs_normalization,
+        'dvs_png': not args.no_dvs_png,
+        'labeling': params.to_dict(),
+    }
+    started = time.perf_counter()
+    failed = 0
+    with multiprocessing.Pool(max(1, args.workers), init_worker, (options,)) as pool:
+        work = relabel_frame if args.relabel else label_frame
+        for done, labelled in enumerate(pool.imap_unordered(work, tasks, chunksize=4), 1):
+            failed += not labelled
+            if done % 100 == 0 or done == len(tasks):
+                elapsed = time.perf_counter() - started
+                print(f"Labelled {done}/{len(tasks)} camera frames, {done / elapsed:.1f} frames/s")
+    if failed:
+        print(f"{failed} camera frames could not be labelled")
+    if args.relabel:
+        print(f"Labels written to {version_folder}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,8 @@ import glob
 import shutil
 import os
 import concurrent.futures
+import collections
+import functools
 from datetime import datetime
 
 try:
@@ -24,7 +26,7 @@ from carla import Transform, Location, Rotation
 import argparse
 import logging
 from npc_spawning import spawnWalkers, spawnVehicles
-from configuration import attachSensorsToVehicle, SimulationParams, setupTrafficManager, setupWorld, setupWorldWeather, createOutputDirectories, CarlaSyncMode
+from configuration import attachSensorsToVehicle, blueprintLibrary, worldMap, SimulationParams, setupTrafficManager, setupWorld, setupWorldWeather, createOutputDirectories, CarlaSyncMode
 import save_sensors
 import random
 import json
@@ -34,21 +36,42 @@ import os
 from os import path
 from ego_vehicle import EgoVehicle
 from fixed_perception import FixedPerception
+from writer_pool import WriterPool
+from video_sink import VideoSink
+from run_index import RunIndex
+from telemetry import Telemetry
+from intake import IntakeBudget
+from backpressure import BackpressureController
+from sampling_profiler import SamplingProfiler
+from output_backend import TarShardBackend
+import orchestrator
 from utils.arg_parser import CommandLineArgsParser
 from utils.weather import weather_presets
 
 
-def main():
+class StartupPhases:
+    """ Wall time of the setup phases before the first captured frame. """
 
-    args_parser = CommandLineArgsParser()
-    args = args_parser.parse_args()
-    print(args)
+    def __init__(self):
+        self.seconds = {}
+        self._started = time.perf_counter()
+
+    def done(self, phase):
+        now = time.perf_counter()
+        self.seconds[phase] = round(now - self._started, 3)
+        self._started = now
+        print(f"Startup: {phase} took {self.seconds[phase]:.2f} s")
+
+    def total(self):
+        return round(sum(self.seconds.values()), 3)
+
+    def summary(self):
+        print("Startup: " + " | ".join(f"{phase} {seconds:.2f} s" for phase, seconds in self.seconds.items()) +
+              f" | total {self.total():.2f} s")
 
-    # Create CARLA client
-    client = carla.Client(args.host, args.port)
-    client.set_timeout(args.timeout)
 
-    # Setup simulation parameters
+def configure(args):
+    """ Sets SimulationParams and opens the output sinks of one run; returns the run's profiler. """
     SimulationParams.town_map = args.map
     SimulationParams.num_of_walkers = args.number_of_walkers
     SimulationParams.num_of_vehicles = args.number_of_vehicles
@@ -56,7 +79,9 @@ def main():
     SimulationParams.ignore_first_n_ticks = args.ignore_first_n_ticks
     # TODO: Is > 1 ego vehicle really required?
     SimulationParams.number_of_ego_vehicles = args.number_of_ego_vehicles
-    SimulationParams.PHASE = SimulationParams.town_map + \
+    SimulationParams.sensor_json_filepath = args.sensor_config
+    SimulationParams.fixed_perception_sensor_json_filepath = args.fixed_sensor_config
+    SimulationParams.PHASE = args.run_name or SimulationParams.town_map + \
         "_" + SimulationParams.dt_string
     SimulationParams.data_output_subfolder = os.path.join(
         "out/", SimulationParams.PHASE)
@@ -68,232 +93,506 @@ def main():
     SimulationParams.start_weather = args.start_weather
     SimulationParams.end_weather = args.end_weather
     SimulationParams.duration = args.duration
-
+    SimulationParams.flow_encoding = args.flow_encoding
+    SimulationParams.dvs_representations = args.dvs_representations
+    SimulationParams.dvs_bins = args.dvs_bins
+    SimulationParams.dvs_time_surface_tau = args.dvs_time_surface_tau
+    SimulationParams.dvs_normalization = args.dvs_normalization
+    SimulationParams.dvs_png = not args.no_dvs_png
+    SimulationParams.record_raw = args.record_raw
+    SimulationParams.label_inputs = not args.no_label_inputs
+    SimulationParams.writer_pool = WriterPool(args.writer_threads)
+    SimulationParams.max_frames_in_flight = max(1, args.max_frames_in_flight)
+    # Sinks of an earlier run of a batch must not leak into this one
+    SimulationParams.run_index = None
+    SimulationParams.telemetry = None
+    SimulationParams.intake = None
+    SimulationParams.backpressure = None
+    SimulationParams.output_backend = None
+    SimulationParams.video_sink = None
+    if not args.no_index:
+        os.makedirs(SimulationParams.data_output_subfolder, exist_ok=True)
+        SimulationParams.run_index = RunIndex(os.path.join(
+            SimulationParams.data_output_subfolder, "index.sqlite"))
+    if not args.no_telemetry:
+        SimulationParams.telemetry = Telemetry(
+            SimulationParams.data_output_subfolder, args.metrics_format, args.telemetry_interval,
+            args.telemetry_window)
+    if args.intake_budget > 0:
+        os.makedirs(SimulationParams.data_output_subfolder, exist_ok=True)
+        SimulationParams.intake = IntakeBudget(
+            args.intake_budget * 1024 * 1024, args.intake_policy,
+            os.path.join(SimulationParams.data_output_subfolder, "intake_drops.json"),
+            args.spill_folder or os.path.join(SimulationParams.data_output_subfolder, "spill"),
+            args.spill_size * 1024 * 1024)
+    if not args.no_backpressure:
+        os.makedirs(SimulationParams.data_output_subfolder, exist_ok=True)
+        SimulationParams.backpressure = BackpressureController(
+            SimulationParams.writer_pool,
+            os.path.join(SimulationParams.data_output_subfolder, "backpressure.jsonl"),
+            args.backpressure_queue, args.backpressure_latency, max(1, args.backpressure_hold))
+    profiler = SamplingProfiler(os.path.join(SimulationParams.data_output_subfolder, "profiles"),
+                                args.profile_ticks, args.profile_interval / 1000.0)
+    profiler.install()
+    if args.output_format == 'tar':
+        SimulationParams.output_backend = TarShardBackend(
+            SimulationParams.data_output_subfolder, args.shard_size * 1024 * 1024)
+    if args.video_cameras:
+        SimulationParams.video_sink = VideoSink(
+            os.path.join(SimulationParams.data_output_subfolder, "videos"), args.video_cameras,
+            args.video_fps or 1.0 / args.delta_seconds, dvs=args.video_dvs,
+            reorder=SimulationParams.max_frames_in_flight - 1)
+    return profiler
+
+
+def close_outputs():
+    print("Waiting for pending writes...")
+    SimulationParams.writer_pool.shutdown()
+    if SimulationParams.video_sink is not None:
+        SimulationParams.video_sink.close()
+    if SimulationParams.output_backend is not None:
+        SimulationParams.output_backend.close()
+    if SimulationParams.run_index is not None:
+        SimulationParams.run_index.close()
+    if SimulationParams.telemetry is not None:
+        SimulationParams.telemetry.close()
+    if SimulationParams.intake is not None:
+        SimulationParams.intake.close()
+
+
+def prepare_world(client, town, startup):
+    """ The world of town, loaded unless the server already runs it, without parked vehicles. """
     world = client.get_world()
-
-    # Remove all parked vehicles etc.
-    env_objs = world.get_environment_objects(carla.CityObjectLabel.Car)
-    for i in range(0, len(env_objs)):
-        world.enable_environment_objects({env_objs[i].id}, False)
-    env_objs = world.get_environment_objects(carla.CityObjectLabel.Bicycle)
-    for i in range(0, len(env_objs)):
-        world.enable_environment_objects({env_objs[i].id}, False)
-    env_objs = world.get_environment_objects(carla.CityObjectLabel.Bus)
-    for i in range(0, len(env_objs)):
-        world.enable_environment_objects({env_objs[i].id}, False)
-    env_objs = world.get_environment_objects(carla.CityObjectLabel.Motorcycle)
-    for i in range(0, len(env_objs)):
-        world.enable_environment_objects({env_objs[i].id}, False)
-    env_objs = world.get_environment_objects(carla.CityObjectLabel.Pedestrians)
-    for i in range(0, len(env_objs)):
-        world.enable_environment_objects({env_objs[i].id}, False)
-    env_objs = world.get_environment_objects(carla.CityObjectLabel.Train)
-    for i in range(0, len(env_objs)):
-        world.enable_environment_objects({env_objs[i].id}, False)
-    env_objs = world.get_environment_objects(carla.CityObjectLabel.Truck)
-    for i in range(0, len(env_objs)):
-        world.enable_environment_objects({env_objs[i].id}, False)
-
-    # Setup
-    setupWorld(world)
-    setupTrafficManager(client)
-
-    # Get all required blueprints
-    blueprint_library = world.get_blueprint_library()
-    blueprintsVehicles = blueprint_library.filter('vehicle.*')
-    vehicles_spawn_points = world.get_map().get_spawn_points()
-    blueprintsWalkers = blueprint_library.filter('walker.pedestrian.*')
-    walker_controller_bp = blueprint_library.find('controller.ai.walker')
-    walkers_spawn_points = world.get_random_location_from_navigation()
-    lidar_segment_bp = blueprint_library.find('sensor.lidar.ray_cast_semantic')
-
-    participant_density = {
-        'bicycle': 0,
-        'truck': 0,
-        'van': 0,
-        'car': 0,
-        'motorcycle': 0,
-        'pedestrian': 0
-    }
-
-    w_all_actors, w_all_id = spawnWalkers(
-        client, world, blueprintsWalkers, SimulationParams.num_of_walkers)
-    for actor in w_all_actors:
-        actor_type = actor.attributes['role_name']
-        if actor_type == "pedestrian":
-            participant_density["pedestrian"] += 1
-    world.tick()
-
-    egos = []
-    fixed = []
-    map_name = world.get_map().name
-
-    if SimulationParams.fixed_perception == True:
-        with open(SimulationParams.fixed_perception_sensor_locations_json_filepath, 'r') as json_file:
-            sensor_locations = json.load(json_file)
-        SimulationParams.town_map = map_name.split("/")[-1]
-        for config_entry in sensor_locations:
-            if config_entry["town"] == map_name:
-                for coordinate in config_entry["cordinates"]:
-                    fixed.append(FixedPerception(
-                        SimulationParams.fixed_perception_sensor_json_filepath, None, world, args, coordinate))
-
-    for i in range(SimulationParams.number_of_ego_vehicles):
-        egos.append(EgoVehicle(
-            SimulationParams.sensor_json_filepath, None, world, args))
-
-    v_all_actors, v_all_id = spawnVehicles(
-        client, world, vehicles_spawn_points, blueprintsVehicles, SimulationParams.num_of_vehicles)
-
-    for actor in v_all_actors:
-        actor_type = actor.attributes.get('base_type')
-
-        if actor_type in participant_density:
-            participant_density[actor_type] += 1
-    world.tick()
-
-    print("Starting simulation...")
-
-    def process_egos(i, frame_id):
-        data = egos[i].getSensorData(frame_id)
+    if not world.get_map().name.endswith(town):
+        print("Loading map " + town + "...")
+        world = client.load_world(town)
+    startup.done("world")
+
+    # Remove all parked vehicles etc. in one call
+    env_obj_ids = set()
+    for label in [carla.CityObjectLabel.Car, carla.CityObjectLabel.Bicycle, carla.CityObjectLabel.Bus,
+                  carla.CityObjectLabel.Motorcycle, carla.CityObjectLabel.Pedestrians,
+                  carla.CityObjectLabel.Train, carla.CityObjectLabel.Truck]:
+        env_obj_ids.update(env_obj.id for env_obj in world.get_environment_objects(label))
+    if env_obj_ids:
+        world.enable_environment_objects(env_obj_ids, False)
+    startup.done("environment objects")
+    return world
+
+
+def interpolate_weather(start_weather, end_weather, progress):
+    weather = carla.WeatherParameters(
+        cloudiness=start_weather.cloudiness +
+        (end_weather.cloudiness - start_weather.cloudiness) * progress,
+        dust_storm=start_weather.dust_storm +
+        (end_weather.dust_storm - start_weather.dust_storm) * progress,
+        fog_density=start_weather.fog_density +
+        (end_weather.fog_density - start_weather.fog_density) * progress,
+        fog_distance=start_weather.fog_distance +
+        (end_weather.fog_distance - start_weather.fog_distance) * progress,
+        fog_falloff=start_weather.fog_falloff +
+        (end_weather.fog_falloff - start_weather.fog_falloff) * progress,
+        mie_scattering_scale=start_weather.mie_scattering_scale,
+        precipitation=start_weather.precipitation +
+        (end_weather.precipitation - start_weather.precipitation) * progress,
+        precipitation_deposits=start_weather.precipitation_deposits +
+        (end_weather.precipitation_deposits -
+         start_weather.precipitation_deposits) * progress,
+        rayleigh_scattering_scale=start_weather.rayleigh_scattering_scale,
+        scattering_intensity=start_weather.scattering_intensity +
+        (end_weather.scattering_intensity -
+         start_weather.scattering_intensity) * progress,
+        sun_azimuth_angle=start_weather.sun_azimuth_angle +
+        (end_weather.sun_azimuth_angle -
+         start_weather.sun_azimuth_angle) * progress,
+        sun_altitude_angle=start_weather.sun_altitude_angle +
+        (end_weather.sun_altitude_angle -
+         start_weather.sun_altitude_angle) * progress,
+        wind_intensity=start_weather.wind_intensity +
+        (end_weather.wind_intensity - start_weather.wind_intensity) * progress,
+        wetness=start_weather.wetness +
+        (end_weather.wetness - start_weather.wetness) * progress
+    )
+    return weather
+
+
+class Capture:
+    """
+    One capture run in a loaded world. setup() spawns the walkers, views and vehicles, run()
+    ticks and saves until the duration, teardown() destroys everything setup() spawned and
+    closes the outputs, leaving the world to the next run of a batch.
+    """
+
+    def __init__(self, client, world, args, startup):
+        self.client = client
+        self.world = world
+        self.args = args
+        self.startup = startup
+        self.profiler = None
+        self.egos = []
+        self.fixed = []
+        self.w_all_actors = []
+        self.w_all_id = []
+        self.v_all_id = []
+        self.participant_density = {
+            'bicycle': 0,
+            'truck': 0,
+            'van': 0,
+            'car': 0,
+            'motorcycle': 0,
+            'pedestrian': 0
+        }
+
+    def setup(self):
+        client, world, args, startup = self.client, self.world, self.args, self.startup
+        self.profiler = configure(args)
+
+        # Setup
+        setupWorld(world)
+        setupTrafficManager(client, args.tm_port, args.seed)
+        startup.done("settings")
+
+        # Get all required blueprints
+        blueprint_library = blueprintLibrary(world)
+        blueprintsVehicles = blueprint_library.filter('vehicle.*')
+        vehicles_spawn_points = worldMap(world).get_spawn_points()
+        blueprintsWalkers = blueprint_library.filter('walker.pedestrian.*')
+
+        self.w_all_actors, self.w_all_id = spawnWalkers(
+            client, world, blueprintsWalkers, SimulationParams.num_of_walkers)
+        for actor in self.w_all_actors:
+            actor_type = actor.attributes['role_name']
+            if actor_type == "pedestrian":
+                self.participant_density["pedestrian"] += 1
+        world.tick()
+        startup.done("walkers")
+
+        map_name = worldMap(world).name
+
+        if SimulationParams.fixed_perception == True:
+            with open(SimulationParams.fixed_perception_sensor_locations_json_filepath, 'r') as json_file:
+                sensor_locations = json.load(json_file)
+            SimulationParams.town_map = map_name.split("/")[-1]
+            for config_entry in sensor_locations:
+                if config_entry["town"] == map_name:
+                    for coordinate in config_entry["cordinates"]:
+                        self.fixed.append(FixedPerception(
+                            SimulationParams.fixed_perception_sensor_json_filepath, None, client, world, args, coordinate,
+                            view="fixed-" + str(len(self.fixed) + 1)))
+
+        for i in range(SimulationParams.number_of_ego_vehicles):
+            self.egos.append(EgoVehicle(
+                SimulationParams.sensor_json_filepath, None, client, world, args, view="ego" + str(i)))
+        startup.done("views")
+
+        v_all_actors, self.v_all_id = spawnVehicles(
+            client, world, vehicles_spawn_points, blueprintsVehicles, SimulationParams.num_of_vehicles, args.tm_port)
+
+        for actor in v_all_actors:
+            actor_type = actor.attributes.get('base_type')
+
+            if actor_type in self.participant_density:
+                self.participant_density[actor_type] += 1
+        world.tick()
+        startup.done("vehicles")
+
+    def process_egos(self, i, frame_id):
+        ego = self.egos[i]
+        data = ego.getSensorData(frame_id)
         output_folder = os.path.join(
             SimulationParams.data_output_subfolder, "ego" + str(i))
         try:
+            started = time.perf_counter()
             save_sensors.saveAllSensors(
-                output_folder, data, egos[i].sensor_names, world)
-            control = egos[i].ego.get_control()
-            angle = control.steer
-            save_sensors.saveSteeringAngle(angle, output_folder)
+                output_folder, data, ego.sensor_names, self.world)
+            telemetry = SimulationParams.telemetry
+            if telemetry is not None:
+                telemetry.observe('save_seconds', time.perf_counter() - started,
+                                  sensor=ego.view, frame=frame_id)
         except Exception as error:
             print("An exception occurred in egos - perception and control saving:", error)
             traceback.print_exc()
-
-    def process_fixed(i, frame_id):
-        data = fixed[i].getSensorData(frame_id)
+        finally:
+            # Writer jobs of the frame may still hold its data
+            SimulationParams.writer_pool.when_written(
+                frame_id, functools.partial(ego.aggregator.release, frame_id))
+
+    def process_fixed(self, i, frame_id):
+        fixed = self.fixed[i]
+        data = fixed.getSensorData(frame_id)
         output_folder = os.path.join(
             SimulationParams.data_output_subfolder, "fixed-" + str(i+1))
         try:
+            started = time.perf_counter()
             save_sensors.saveAllSensors(
-                output_folder, data, fixed[i].sensor_names, world)
+                output_folder, data, fixed.sensor_names, self.world)
+            telemetry = SimulationParams.telemetry
+            if telemetry is not None:
+                telemetry.observe('save_seconds', time.perf_counter() - started,
+                                  sensor=fixed.view, frame=frame_id)
         except Exception as error:
             print("An exception occurred in fixed - perception saving:", error)
             traceback.print_exc()
+        finally:
+            SimulationParams.writer_pool.when_written(
+                frame_id, functools.partial(fixed.aggregator.release, frame_id))
+
+    def process_frame(self, frame_id):
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = [executor.submit(
+                self.process_egos, i, frame_id) for i in range(len(self.egos))]
+            concurrent.futures.wait(futures)
+
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = [executor.submit(
+                self.process_fixed, i, frame_id) for i in range(len(self.fixed))]
+            concurrent.futures.wait(futures)
+
+    def run(self):
+        world, args, startup, profiler = self.world, self.args, self.startup, self.profiler
+        egos, fixed = self.egos, self.fixed
+        telemetry = SimulationParams.telemetry
+        print("Starting simulation...")
+
+        start_weather = SimulationParams.start_weather
+        end_weather = SimulationParams.end_weather
+        duration = SimulationParams.duration
+        metadata = {
+            "start_weather": start_weather,
+            "end_weather": end_weather,
+            "duration": duration,
+            "map_name": worldMap(world).name,
+            "participant_density": self.participant_density,
+            "delta_seconds": SimulationParams.delta_seconds,
+            "egos": len(egos),
+            "fixed-views": len(fixed),
+            "labeling": SimulationParams.labeling.to_dict(),
+            "startup_seconds": startup.seconds,
+            "startup_total_seconds": startup.total()
+        }
+
+        for name, value in weather_presets:
+            if name == start_weather:
+                start_weather = value
+                break
+
+        for name, value in weather_presets:
+            if name == end_weather:
+                end_weather = value
+                break
+
+        world.set_weather(start_weather)
+
+        step = 0
+        k = 0
+        listening = False
+        frame_id = None
+
+        file_path = f'./out/metadata-{datetime.now().strftime("%Y%m%d%H%M%S")}.json'
+        if args.run_name:
+            # Named runs are started in parallel by orchestrator.py
+            os.makedirs(SimulationParams.data_output_subfolder, exist_ok=True)
+            file_path = os.path.join(
+                SimulationParams.data_output_subfolder, "metadata.json")
+
+        def write_metadata():
+            with open(file_path, "w") as file:
+                file.write(json.dumps(metadata, indent=4))
+
+        write_metadata()
+        # Frames are saved on a pool while the next ones are ticked; at most
+        # max_frames_in_flight frames are ticked and not yet saved
+        frame_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=SimulationParams.max_frames_in_flight, thread_name_prefix="frame")
+        in_flight = collections.deque()
+        try:
+            with CarlaSyncMode(world, []) as sync_mode:
+                while True:
+                    while len(in_flight) >= SimulationParams.max_frames_in_flight:
+                        in_flight.popleft().result()
+
+                    if not listening and k >= SimulationParams.ignore_first_n_ticks:
+                        # Sensors stay silent during the warm-up; all views start with the next frame
+                        first_frame = (frame_id if frame_id is not None else world.get_snapshot().frame) + 1
+                        for view in egos + fixed:
+                            view.listen(first_frame)
+                        listening = True
+
+                    if SimulationParams.intake is not None:
+                        # Saving has fallen behind by more than the memory budget
+                        SimulationParams.intake.wait()
+                    if SimulationParams.backpressure is not None and listening:
+                        # Writers behind: cheaper encoding, fewer low priority frames, slower ticks
+                        SimulationParams.backpressure.on_tick(frame_id)
+
+                    if telemetry is not None:
+                        telemetry.tick_started()
+                    frame_id = sync_mode.tick(timeout=5.0)
+                    if telemetry is not None:
+                        telemetry.tick_finished(frame_id)
+                    profiler.on_tick(frame_id)
+                    if (k < SimulationParams.ignore_first_n_ticks):
+                        k = k + 1
+                        print("Ignore Count: ", k)
+                        continue
+
+                    if step == 0:
+                        startup.done("warm-up")
+                        startup.summary()
+                        # Written again with the warm-up and the total startup time
+                        metadata["startup_total_seconds"] = startup.total()
+                        write_metadata()
+
+                    if step > duration:
+                        break
+
+                    print("Frame: ", step)
+                    step = step + 1
+
+                    # The vehicles drive on while the frame is saved, so the steering is read and written now
+                    for i, ego in enumerate(egos):
+                        save_sensors.saveSteeringAngle(frame_id, ego.ego.get_control().steer, os.path.join(
+                            SimulationParams.data_output_subfolder, "ego" + str(i)))
+                    in_flight.append(frame_executor.submit(self.process_frame, frame_id))
+
+                    if telemetry is not None:
+                        telemetry.gauge('writer_queue', SimulationParams.writer_pool.pending(), frame=frame_id)
+                        telemetry.gauge('frames_in_flight', len(in_flight), frame=frame_id)
+                        if SimulationParams.intake is not None:
+                            telemetry.gauge('intake_bytes', SimulationParams.intake.used(), frame=frame_id)
+                        if SimulationParams.backpressure is not None:
+                            telemetry.gauge('backpressure_level', SimulationParams.backpressure.level, frame=frame_id)
+                        for view in egos + fixed:
+                            telemetry.gauge('pending_frames', view.aggregator.pending(),
+                                            sensor=view.view, frame=frame_id)
+                        telemetry.maybe_summarize()
+
+                    # progress = step / duration
+                    # current_weather = interpolate_weather(
+                    #     start_weather, end_weather, progress)
+                    # world.set_weather(current_weather)
+        finally:
+            print("Waiting for frames in flight...")
+            for future in in_flight:
+                try:
+                    future.result()
+                except Exception as error:
+                    print("An exception occurred in frame processing:", error)
+                    traceback.print_exc()
+            frame_executor.shutdown()
+
+    def teardown(self):
+        if self.profiler is None:
+            # configure() did not get to open the outputs
+            return
+        self.profiler.close()
 
-    def interpolate_weather(start_weather, end_weather, progress):
-        weather = carla.WeatherParameters(
-            cloudiness=start_weather.cloudiness +
-            (end_weather.cloudiness - start_weather.cloudiness) * progress,
-            dust_storm=start_weather.dust_storm +
-            (end_weather.dust_storm - start_weather.dust_storm) * progress,
-            fog_density=start_weather.fog_density +
-            (end_weather.fog_density - start_weather.fog_density) * progress,
-            fog_distance=start_weather.fog_distance +
-            (end_weather.fog_distance - start_weather.fog_distance) * progress,
-            fog_falloff=start_weather.fog_falloff +
-            (end_weather.fog_falloff - start_weather.fog_falloff) * progress,
-            mie_scattering_scale=start_weather.mie_scattering_scale,
-            precipitation=start_weather.precipitation +
-            (end_weather.precipitation - start_weather.precipitation) * progress,
-            precipitation_deposits=start_weather.precipitation_deposits +
-            (end_weather.precipitation_deposits -
-             start_weather.precipitation_deposits) * progress,
-            rayleigh_scattering_scale=start_weather.rayleigh_scattering_scale,
-            scattering_intensity=start_weather.scattering_intensity +
-            (end_weather.scattering_intensity -
-             start_weather.scattering_intensity) * progress,
-            sun_azimuth_angle=start_weather.sun_azimuth_angle +
-            (end_weather.sun_azimuth_angle -
-             start_weather.sun_azimuth_angle) * progress,
-            sun_altitude_angle=start_weather.sun_altitude_angle +
-            (end_weather.sun_altitude_angle -
-             start_weather.sun_altitude_angle) * progress,
-            wind_intensity=start_weather.wind_intensity +
-            (end_weather.wind_intensity - start_weather.wind_intensity) * progress,
-            wetness=start_weather.wetness +
-            (end_weather.wetness - start_weather.wetness) * progress
-        )
-        return weather
-
-    start_weather = SimulationParams.start_weather
-    end_weather = SimulationParams.end_weather
-    duration = SimulationParams.duration
-    metadata = {
-        "start_weather": start_weather,
-        "end_weather": end_weather,
-        "duration": duration,
-        "map_name": map_name,
-        "participant_density": participant_density,
-        "delta_seconds": SimulationParams.delta_seconds,
-        "egos": len(egos),
-        "fixed-views": len(fixed)
-    }
-
-    for name, value in weather_presets:
-        if name == start_weather:
-            start_weather = value
-            break
-
-    for name, value in weather_presets:
-        if name == end_weather:
-            end_weather = value
-            break
-
-    world.set_weather(start_weather)
-
-    step = 0
-    k = 0
-
-    json_string = json.dumps(metadata, indent=4)
-    file_path = f'./out/metadata-{datetime.now().strftime("%Y%m%d%H%M%S")}.json'
-    with open(file_path, "w") as file:
-        file.write(json_string)
-    try:
-        with CarlaSyncMode(world, []) as sync_mode:
-            while True:
-                frame_id = sync_mode.tick(timeout=5.0)
-                if (k < SimulationParams.ignore_first_n_ticks):
-                    k = k + 1
-                    print("Ignore Count: ", k)
-                    continue
-
-                if step > duration:
-                    break
-
-                print("Frame: ", step)
-                step = step + 1
-
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    futures = [executor.submit(
-                        process_egos, i, frame_id) for i in range(len(egos))]
-                    concurrent.futures.wait(futures)
-
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    futures = [executor.submit(
-                        process_fixed, i, frame_id) for i in range(len(fixed))]
-                    concurrent.futures.wait(futures)
-
-                # progress = step / duration
-                # current_weather = interpolate_weather(
-                #     start_weather, end_weather, progress)
-                # world.set_weather(current_weather)
-    finally:
         # stop pedestrians (list is [controller, actor, controller, actor ...])
-        for i in range(0, len(w_all_actors)):
+        for i in range(0, len(self.w_all_actors)):
             try:
-                w_all_actors[i].stop()
+                self.w_all_actors[i].stop()
             except:
                 pass
         # destroy pedestrian (actor and controller)
-        client.apply_batch([carla.command.DestroyActor(x) for x in w_all_id])
-        client.apply_batch([carla.command.DestroyActor(x) for x in v_all_id])
+        self.client.apply_batch([carla.command.DestroyActor(x) for x in self.w_all_id])
+        self.client.apply_batch([carla.command.DestroyActor(x) for x in self.v_all_id])
+
+        for view in self.egos + self.fixed:
+            try:
+                view.destroy()
+            except Exception as error:
+                print("An exception occurred destroying " + view.view + ":", error)
+                traceback.print_exc()
 
-        for ego in egos:
-            ego.destroy()
+        close_outputs()
 
         # This is to prevent Unreal from crashing from waiting the client.
-        settings = world.get_settings()
+        settings = self.world.get_settings()
         settings.synchronous_mode = False
-        world.apply_settings(settings)
+        self.world.apply_settings(settings)
+
+
+def capture(client, args, world=None):
+    """ Captures one run; world is that of args.map when a batch reuses it. Returns the world. """
+    startup = StartupPhases()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if world is None:
+        world = prepare_world(client, args.map, startup)
+    run = Capture(client, world, args, startup)
+    try:
+        run.setup()
+        run.run()
+    finally:
+        run.teardown()
+    return world
+
+
+def run_batch(client, args_parser, args):
+    """
+    Runs the scenarios of an orchestrator.py matrix one after the other. The scenarios of a town
+    run back to back in the world loaded once; between them only the actors, sensors and
+    weather are reset. Every scenario is a run of its own in out/<scenario name>.
+    """
+    with open(args.scenarios) as file:
+        scenarios = orchestrator.expand_matrix(json.load(file))
+    towns = list(dict.fromkeys(scenario['map'] for scenario in scenarios))
+    scenarios.sort(key=lambda scenario: towns.index(scenario['map']))
+
+    os.makedirs("out", exist_ok=True)
+    state_path = os.path.join("out", "batch.jsonl")
+    done = orchestrator.load_done(state_path)
+    pending = [scenario for scenario in scenarios if scenario['name'] not in done]
+    print(f"{len(scenarios)} scenarios in {len(towns)} towns, {len(scenarios) - len(pending)} already done")
+
+    world = None
+    town = None
+    failed = []
+    for scenario in pending:
+        # The scenario's arguments come last and override those of the batch
+        scenario_args = args_parser.parse_args(
+            sys.argv[1:] + orchestrator.scenario_arguments(scenario))
+        print("Scenario " + scenario['name'])
+        start = time.time()
+        try:
+            world = capture(client, scenario_args, world if town == scenario['map'] else None)
+            town = scenario['map']
+            returncode = 0
+        except Exception as error:
+            print("An exception occurred in scenario " + scenario['name'] + ":", error)
+            traceback.print_exc()
+            # Get the world from the server again before the next scenario
+            world = None
+            town = None
+            returncode = 'error'
+            failed.append(scenario['name'])
+        with open(state_path, 'a') as state:
+            state.write(json.dumps({'name': scenario['name'], 'attempt': 1,
+                                    'endpoint': '%s:%d:%d' % (args.host, args.port, args.tm_port),
+                                    'returncode': returncode, 'seconds': round(time.time() - start, 1)}) + '\n')
+
+    print(f"Finished: {len(pending) - len(failed)} done, {len(failed)} failed")
+    for name in failed:
+        print("    failed:", name)
+    if failed:
+        sys.exit(1)
+
+
+def main():
+
+    args_parser = CommandLineArgsParser()
+    args = args_parser.parse_args()
+    print(args)
+
+    # Create CARLA client
+    client = carla.Client(args.host, args.port)
+    client.set_timeout(args.timeout)
+
+    if args.scenarios:
+        run_batch(client, args_parser, args)
+    else:
+        capture(client, args)
 
 
 if __name__ == '__main__':
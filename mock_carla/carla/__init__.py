@@ -0,0 +1,1058 @@
+"""
+Stand-in for the CARLA Python API, to run the capture pipeline without a server.
+
+> PYTHONPATH=mock_carla python main.py --fixed-perception --duration 100
+
+It covers what main.py, EgoVehicle, FixedPerception, save_sensors.py and bb.py use: a client
+with worlds per map, synchronous ticks, blueprints, vehicles and walkers that move between
+ticks, traffic manager, batch commands, world snapshots, weather presets and sensors that
+deliver synthetic buffers (see _render.py) at their configured resolution and sensor_tick
+on background threads, like the real client does.
+"""
+
+import enum
+import math
+import time
+import fnmatch
+import itertools
+import threading
+import concurrent.futures
+import numpy as np
+
+from . import command
+from . import _render
+
+# Mock server side settings
+MAP_EXTENT = 120.0
+SPAWN_POINT_COUNT = 200
+SENSOR_THREADS = 8
+
+
+class Vector3D:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def __add__(self, other):
+        return type(self)(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return type(self)(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, value):
+        return type(self)(self.x * value, self.y * value, self.z * value)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, value):
+        return type(self)(self.x / value, self.y / value, self.z / value)
+
+    def __eq__(self, other):
+        if not isinstance(other, Vector3D):
+            return NotImplemented
+        return (self.x, self.y, self.z) == (other.x, other.y, other.z)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def length(self):
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+    def distance(self, other):
+        return (self - other).length()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(x={self.x:.6f}, y={self.y:.6f}, z={self.z:.6f})"
+
+
+class Location(Vector3D):
+    pass
+
+
+class Vector2D:
+    def __init__(self, x=0.0, y=0.0):
+        self.x = float(x)
+        self.y = float(y)
+
+
+def _wrap_angle(degrees):
+    """ Like the simulator, angles are kept in [-180, 180) degrees. """
+    return (degrees + 180.0) % 360.0 - 180.0
+
+
+class Rotation:
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch = float(pitch)
+        self.yaw = float(yaw)
+        self.roll = float(roll)
+
+    def get_forward_vector(self):
+        cp, sp = math.cos(math.radians(self.pitch)), math.sin(math.radians(self.pitch))
+        cy, sy = math.cos(math.radians(self.yaw)), math.sin(math.radians(self.yaw))
+        return Vector3D(cp * cy, cp * sy, sp)
+
+    def __eq__(self, other):
+        if not isinstance(other, Rotation):
+            return NotImplemented
+        return (self.pitch, self.yaw, self.roll) == (other.pitch, other.yaw, other.roll)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Rotation(pitch={self.pitch:.6f}, yaw={self.yaw:.6f}, roll={self.roll:.6f})"
+
+
+class Transform:
+    def __init__(self, location=None, rotation=None):
+        self.location = location if location is not None else Location()
+        self.rotation = rotation if rotation is not None else Rotation()
+
+    def get_matrix(self):
+        r, l = self.rotation, self.location
+        cy, sy = math.cos(math.radians(r.yaw)), math.sin(math.radians(r.yaw))
+        cr, sr = math.cos(math.radians(r.roll)), math.sin(math.radians(r.roll))
+        cp, sp = math.cos(math.radians(r.pitch)), math.sin(math.radians(r.pitch))
+        return [[cp * cy, cy * sp * sr - sy * cr, -cy * sp * cr - sy * sr, l.x],
+                [sy * cp, sy * sp * sr + cy * cr, -sy * sp * cr + cy * sr, l.y],
+                [sp, -cp * sr, cp * cr, l.z],
+                [0.0, 0.0, 0.0, 1.0]]
+
+    def get_inverse_matrix(self):
+        return np.linalg.inv(np.array(self.get_matrix())).tolist()
+
+    def transform(self, point):
+        x, y, z, _ = np.dot(self.get_matrix(), [point.x, point.y, point.z, 1.0])
+        return Location(x, y, z)
+
+    def get_forward_vector(self):
+        return self.rotation.get_forward_vector()
+
+    def compose(self, relative):
+        """ The world transform of relative, given in the frame of this transform. """
+        return Transform(self.transform(relative.location), Rotation(
+            _wrap_angle(self.rotation.pitch + relative.rotation.pitch),
+            _wrap_angle(self.rotation.yaw + relative.rotation.yaw),
+            _wrap_angle(self.rotation.roll + relative.rotation.roll)))
+
+    def __repr__(self):
+        return f"Transform({self.location!r}, {self.rotation!r})"
+
+
+class BoundingBox:
+    def __init__(self, location=None, extent=None):
+        self.location = location if location is not None else Location()
+        self.extent = extent if extent is not None else Vector3D()
+        self.rotation = Rotation()
+
+    def __repr__(self):
+        return f"BoundingBox({self.location!r}, Extent({self.extent.x}, {self.extent.y}, {self.extent.z}))"
+
+
+class CityObjectLabel(enum.IntEnum):
+    NONE = 0
+    Roads = 1
+    Sidewalks = 2
+    Buildings = 3
+    Walls = 4
+    Fences = 5
+    Poles = 6
+    TrafficLight = 7
+    TrafficSigns = 8
+    Vegetation = 9
+    Terrain = 10
+    Sky = 11
+    Pedestrians = 12
+    Rider = 13
+    Car = 14
+    Truck = 15
+    Bus = 16
+    Train = 17
+    Motorcycle = 18
+    Bicycle = 19
+    Static = 20
+    Dynamic = 21
+    Other = 22
+    Water = 23
+    RoadLines = 24
+    Ground = 25
+    Bridge = 26
+    RailTrack = 27
+    GuardRail = 28
+    Any = 255
+
+
+class ColorConverter(enum.IntEnum):
+    Raw = 0
+    Depth = 1
+    LogarithmicDepth = 2
+    CityScapesPalette = 3
+
+
+class VehicleLightState(enum.IntFlag):
+    NONE = 0
+    Position = 1
+    LowBeam = 2
+    HighBeam = 4
+    Brake = 8
+    RightBlinker = 16
+    LeftBlinker = 32
+    Reverse = 64
+    Fog = 128
+    Interior = 256
+    Special1 = 512
+    Special2 = 1024
+    All = 0xFFFFFFFF
+
+
+class AttachmentType(enum.IntEnum):
+    Rigid = 0
+    SpringArm = 1
+
+
+class Color:
+    def __init__(self, r=0, g=0, b=0, a=255):
+        self.r = int(r)
+        self.g = int(g)
+        self.b = int(b)
+        self.a = int(a)
+
+    def __repr__(self):
+        return f"Color({self.r},{self.g},{self.b},{self.a})"
+
+
+class VehicleControl:
+    def __init__(self, throttle=0.0, steer=0.0, brake=0.0, hand_brake=False, reverse=False,
+                 manual_gear_shift=False, gear=0):
+        self.throttle = throttle
+        self.steer = steer
+        self.brake = brake
+        self.hand_brake = hand_brake
+        self.reverse = reverse
+        self.manual_gear_shift = manual_gear_shift
+        self.gear = gear
+
+
+class WalkerControl:
+    def __init__(self, direction=None, speed=0.0, jump=False):
+        self.direction = direction if direction is not None else Vector3D(1.0, 0.0, 0.0)
+        self.speed = speed
+        self.jump = jump
+
+
+WEATHER_ATTRIBUTES = ['cloudiness', 'precipitation', 'precipitation_deposits', 'wind_intensity',
+                      'sun_azimuth_angle', 'sun_altitude_angle', 'fog_density', 'fog_distance',
+                      'fog_falloff', 'wetness', 'scattering_intensity', 'mie_scattering_scale',
+                      'rayleigh_scattering_scale', 'dust_storm']
+
+
+class WeatherParameters:
+    def __init__(self, cloudiness=0.0, precipitation=0.0, precipitation_deposits=0.0, wind_intensity=0.0,
+                 sun_azimuth_angle=0.0, sun_altitude_angle=0.0, fog_density=0.0, fog_distance=0.0,
+                 fog_falloff=0.0, wetness=0.0, scattering_intensity=0.0, mie_scattering_scale=0.0,
+                 rayleigh_scattering_scale=0.0331, dust_storm=0.0):
+        values = locals()
+        for name in WEATHER_ATTRIBUTES:
+            setattr(self, name, float(values[name]))
+
+    def __repr__(self):
+        return "WeatherParameters(" + ", ".join(f"{name}={getattr(self, name)}" for name in WEATHER_ATTRIBUTES) + ")"
+
+
+def _weather_presets():
+    times = {'Noon': 45.0, 'Sunset': 15.0, 'Night': -90.0}
+    kinds = {
+        'Clear': dict(cloudiness=5.0),
+        'Cloudy': dict(cloudiness=60.0),
+        'Wet': dict(cloudiness=5.0, precipitation_deposits=50.0, wetness=50.0),
+        'WetCloudy': dict(cloudiness=60.0, precipitation_deposits=50.0, wetness=50.0),
+        'SoftRain': dict(cloudiness=20.0, precipitation=30.0, precipitation_deposits=50.0, wetness=50.0),
+        'MidRain': dict(cloudiness=60.0, precipitation=60.0, precipitation_deposits=60.0, wetness=60.0),
+        'HardRain': dict(cloudiness=100.0, precipitation=100.0, precipitation_deposits=90.0, wetness=100.0),
+    }
+    for kind, values in kinds.items():
+        for name, altitude in times.items():
+            setattr(WeatherParameters, kind + name,
+                    WeatherParameters(sun_altitude_angle=altitude, **values))
+    # CARLA spells these two differently
+    WeatherParameters.MidRainyNoon = WeatherParameters.MidRainNoon
+    WeatherParameters.MidRainyNight = WeatherParameters.MidRainNight
+    WeatherParameters.DustStorm = WeatherParameters(
+        cloudiness=100.0, wind_intensity=100.0, sun_altitude_angle=45.0, dust_storm=100.0)
+    WeatherParameters.Default = WeatherParameters.ClearNoon
+
+
+_weather_presets()
+
+
+class Timestamp:
+    def __init__(self, frame, elapsed_seconds, delta_seconds):
+        self.frame = frame
+        self.frame_count = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.delta_seconds = delta_seconds
+        self.platform_timestamp = time.time()
+
+
+class ActorSnapshot:
+    def __init__(self, actor_id, transform, velocity):
+        self.id = actor_id
+        self._transform = transform
+        self._velocity = velocity
+
+    def get_transform(self):
+        return self._transform
+
+    def get_velocity(self):
+        return self._velocity
+
+
+class WorldSnapshot:
+    def __init__(self, frame, timestamp, actors):
+        self.id = frame
+        self.frame = frame
+        self.timestamp = timestamp
+        self._actors = actors
+
+    def find(self, actor_id):
+        return self._actors.get(actor_id)
+
+    def has_actor(self, actor_id):
+        return actor_id in self._actors
+
+    def __iter__(self):
+        return iter(self._actors.values())
+
+    def __len__(self):
+        return len(self._actors)
+
+
+class ActorAttribute:
+    def __init__(self, attribute_id, value):
+        self.id = attribute_id
+        self.value = str(value)
+
+    def as_int(self):
+        return int(float(self.value))
+
+    def as_float(self):
+        return float(self.value)
+
+    def as_str(self):
+        return self.value
+
+    def as_bool(self):
+        return self.value.lower() in ('true', '1')
+
+    def __str__(self):
+        return self.value
+
+
+class ActorBlueprint:
+    def __init__(self, blueprint_id, attributes, open_attributes=False):
+        self.id = blueprint_id
+        self.tags = blueprint_id.split('.')
+        self._attributes = {name: str(value) for name, value in attributes.items()}
+        self._attributes.setdefault('role_name', '')
+        # Sensors accept any attribute, the mock does not model their noise parameters
+        self._open_attributes = open_attributes
+
+    def has_attribute(self, attribute_id):
+        return attribute_id in self._attributes
+
+    def has_tag(self, tag):
+        return tag in self.tags
+
+    def get_attribute(self, attribute_id):
+        return ActorAttribute(attribute_id, self._attributes[attribute_id])
+
+    def set_attribute(self, attribute_id, value):
+        if attribute_id not in self._attributes and not self._open_attributes:
+            raise IndexError(f"Blueprint {self.id} has no attribute {attribute_id}")
+        self._attributes[attribute_id] = str(value)
+
+    def __iter__(self):
+        return iter([ActorAttribute(name, value) for name, value in self._attributes.items()])
+
+    def __repr__(self):
+        return f"ActorBlueprint(id={self.id}, tags={self.tags})"
+
+
+VEHICLES = {
+    'vehicle.citroen.c3': ('car', (1.99, 0.92, 0.81)),
+    'vehicle.tesla.model3': ('car', (2.40, 1.08, 0.75)),
+    'vehicle.audi.a2': ('car', (1.85, 0.90, 0.78)),
+    'vehicle.mercedes.coupe': ('car', (2.51, 1.08, 0.82)),
+    'vehicle.dodge.charger_police': ('car', (2.49, 1.02, 0.78)),
+    'vehicle.ford.mustang': ('car', (2.36, 0.94, 0.65)),
+    'vehicle.toyota.prius': ('car', (2.26, 1.00, 0.77)),
+    'vehicle.jeep.wrangler_rubicon': ('car', (1.93, 0.96, 0.95)),
+    'vehicle.tesla.cybertruck': ('truck', (3.13, 1.19, 1.04)),
+    'vehicle.carlamotors.firetruck': ('truck', (4.23, 1.43, 1.92)),
+    'vehicle.ford.ambulance': ('van', (3.18, 1.19, 1.22)),
+    'vehicle.kawasaki.ninja': ('motorcycle', (1.02, 0.40, 0.64)),
+    'vehicle.vespa.zx125': ('motorcycle', (0.90, 0.40, 0.62)),
+    'vehicle.harley-davidson.low_rider': ('motorcycle', (1.18, 0.38, 0.64)),
+    'vehicle.bh.crossbike': ('bicycle', (0.74, 0.43, 0.54)),
+}
+WALKER_COUNT = 10
+CAMERA_TYPES = ['rgb', 'depth', 'semantic_segmentation', 'instance_segmentation', 'dvs', 'optical_flow']
+
+
+class BlueprintLibrary:
+    def __init__(self, blueprints=None):
+        if blueprints is None:
+            blueprints = []
+            for blueprint_id, (base_type, extent) in VEHICLES.items():
+                blueprints.append(ActorBlueprint(blueprint_id, {
+                    'base_type': base_type, 'number_of_wheels': 2 if base_type in ('motorcycle', 'bicycle') else 4,
+                    'color': '0,0,0', 'generation': 2, 'extent': ','.join(map(str, extent))}))
+            for i in range(1, WALKER_COUNT + 1):
+                blueprints.append(ActorBlueprint('walker.pedestrian.%04d' % i, {
+                    'is_invincible': 'false', 'speed': '1.4', 'generation': 2}))
+            blueprints.append(ActorBlueprint('controller.ai.walker', {}))
+            for camera in CAMERA_TYPES:
+                blueprints.append(ActorBlueprint('sensor.camera.' + camera, {
+                    'image_size_x': 800, 'image_size_y': 600, 'fov': 90.0, 'sensor_tick': 0.0}, True))
+            for other in ['gnss', 'imu']:
+                blueprints.append(ActorBlueprint('sensor.other.' + other, {'sensor_tick': 0.0}, True))
+            blueprints.append(ActorBlueprint('sensor.lidar.ray_cast_semantic', {
+                'channels': 32, 'range': 10.0, 'sensor_tick': 0.0}, True))
+        self._blueprints = blueprints
+
+    def filter(self, wildcard_pattern):
+        return BlueprintLibrary([bp for bp in self._blueprints if fnmatch.fnmatch(bp.id, wildcard_pattern)])
+
+    def find(self, blueprint_id):
+        for blueprint in self._blueprints:
+            if blueprint.id == blueprint_id:
+                # Like the client library, a copy the caller may change
+                return ActorBlueprint(blueprint.id, blueprint._attributes, blueprint._open_attributes)
+        raise IndexError("Blueprint " + blueprint_id + " not found")
+
+    def __iter__(self):
+        return iter(self._blueprints)
+
+    def __len__(self):
+        return len(self._blueprints)
+
+    def __getitem__(self, index):
+        return self._blueprints[index]
+
+
+class Actor:
+    def __init__(self, world, actor_id, blueprint, transform, parent=None):
+        self._world = world
+        self.id = actor_id
+        self.type_id = blueprint.id
+        self.attributes = dict(blueprint._attributes)
+        self.parent = parent
+        self.is_alive = True
+        self.semantic_tags = []
+        self._relative = transform if parent is not None else None
+        self._transform = transform
+        self._velocity = Vector3D()
+        self.bounding_box = BoundingBox()
+
+    def get_transform(self):
+        if self.parent is not None:
+            return self.parent.get_transform().compose(self._relative)
+        return self._transform
+
+    def get_location(self):
+        return self.get_transform().location
+
+    def get_velocity(self):
+        return self._velocity
+
+    def set_transform(self, transform):
+        self._transform = transform
+
+    def get_world(self):
+        return self._world
+
+    def destroy(self):
+        if not self.is_alive:
+            return False
+        self.is_alive = False
+        self._world._remove(self.id)
+        return True
+
+    def _step(self, delta_seconds):
+        pass
+
+    def __repr__(self):
+        return f"Actor(id={self.id}, type={self.type_id})"
+
+
+class Vehicle(Actor):
+    def __init__(self, world, actor_id, blueprint, transform, parent=None):
+        super().__init__(world, actor_id, blueprint, transform, parent)
+        extent = [float(v) for v in self.attributes.pop('extent').split(',')]
+        self.bounding_box = BoundingBox(Location(0.0, 0.0, extent[2]), Vector3D(*extent))
+        self._autopilot = False
+        self._control = VehicleControl()
+        self._speed = world._rng.uniform(4.0, 12.0)
+
+    def set_autopilot(self, enabled=True, tm_port=8000):
+        self._autopilot = enabled
+
+    def apply_control(self, control):
+        self._control = control
+
+    def get_control(self):
+        return self._control
+
+    def set_light_state(self, light_state):
+        self.light_state = light_state
+
+    def _step(self, delta_seconds):
+        if not self._autopilot:
+            return
+        # Drive on a gently curving path and turn around at the map border
+        # A new rotation every step, snapshots of earlier frames hold the old one
+        transform = self._transform
+        location = transform.location
+        rotation = Rotation(transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll)
+        if abs(location.x) > MAP_EXTENT or abs(location.y) > MAP_EXTENT:
+            rotation.yaw = math.degrees(math.atan2(-location.y, -location.x))
+        steer = 0.05 * math.sin(self._world._elapsed * 0.2 + self.id)
+        self._control = VehicleControl(throttle=0.5, steer=steer)
+        rotation.yaw = _wrap_angle(rotation.yaw + steer * 20.0 * delta_seconds)
+        forward = rotation.get_forward_vector()
+        self._velocity = Vector3D(forward.x, forward.y, 0.0) * self._speed
+        self._transform = Transform(location + self._velocity * delta_seconds, rotation)
+
+
+class Walker(Actor):
+    def __init__(self, world, actor_id, blueprint, transform, parent=None):
+        super().__init__(world, actor_id, blueprint, transform, parent)
+        self.bounding_box = BoundingBox(Location(0.0, 0.0, 0.0), Vector3D(0.19, 0.34, 0.93))
+        self._target = None
+        self._speed = 0.0
+
+    def apply_control(self, control):
+        self._velocity = control.direction * control.speed
+
+    def _step(self, delta_seconds):
+        if self._target is None:
+            return
+        location = self._transform.location
+        offset = self._target - location
+        distance = offset.length()
+        if distance < 0.5:
+            self._target = self._world.get_random_location_from_navigation()
+            return
+        step = min(distance, self._speed * delta_seconds)
+        self._velocity = offset / distance * self._speed
+        yaw = math.degrees(math.atan2(offset.y, offset.x))
+        self._transform = Transform(location + offset / distance * step, Rotation(yaw=yaw))
+
+
+class WalkerAIController(Actor):
+    def start(self):
+        self.parent._target = self.parent.get_location()
+        self.parent._speed = 1.4
+
+    def go_to_location(self, destination):
+        self.parent._target = destination
+
+    def set_max_speed(self, speed):
+        self.parent._speed = speed
+
+    def stop(self):
+        self.parent._target = None
+        self.parent._velocity = Vector3D()
+
+    def get_transform(self):
+        return self.parent.get_transform()
+
+
+class SensorData:
+    def __init__(self, frame, timestamp, transform):
+        self.frame = frame
+        self.frame_number = frame
+        self.timestamp = timestamp
+        self.transform = transform
+
+
+class Image(SensorData):
+    def __init__(self, frame, timestamp, transform, width, height, fov, bgra):
+        super().__init__(frame, timestamp, transform)
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self._bgra = bgra
+        self.raw_data = bgra.reshape(-1)
+
+    def convert(self, color_converter):
+        if color_converter == ColorConverter.Depth or color_converter == ColorConverter.LogarithmicDepth:
+            _render.depth_to_gray(self._bgra)
+        elif color_converter == ColorConverter.CityScapesPalette:
+            _render.cityscapes(self._bgra)
+
+    def save_to_disk(self, path, color_converter=ColorConverter.Raw):
+        import os
+        import cv2
+        if color_converter != ColorConverter.Raw:
+            self.convert(color_converter)
+        if not os.path.splitext(path)[1]:
+            path += '.png'
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        cv2.imwrite(path, self._bgra)
+        return path
+
+    def __len__(self):
+        return self.width * self.height
+
+    def __getitem__(self, index):
+        b, g, r, a = self._bgra.reshape(-1, 4)[index]
+        return Color(r, g, b, a)
+
+    def __str__(self):
+        return f"Image(frame={self.frame}, timestamp={self.timestamp:.6f}, size={self.width}x{self.height})"
+
+
+class OpticalFlowImage(SensorData):
+    def __init__(self, frame, timestamp, transform, width, height, fov, flow):
+        super().__init__(frame, timestamp, transform)
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.raw_data = flow.reshape(-1).view(np.uint8)
+
+    def __str__(self):
+        return f"OpticalFlowImage(frame={self.frame}, timestamp={self.timestamp:.6f}, size={self.width}x{self.height})"
+
+
+class DVSEventArray(SensorData):
+    def __init__(self, frame, timestamp, transform, width, height, fov, events):
+        super().__init__(frame, timestamp, transform)
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.raw_data = events.view(np.uint8)
+        self._count = len(events)
+
+    def __len__(self):
+        return self._count
+
+    def __str__(self):
+        return f"DVSEventArray(frame={self.frame}, timestamp={self.timestamp:.6f}, dimensions={self.width}x{self.height}, number_of_events={self._count})"
+
+
+class IMUMeasurement(SensorData):
+    def __init__(self, frame, timestamp, transform, accelerometer, gyroscope, compass):
+        super().__init__(frame, timestamp, transform)
+        self.accelerometer = accelerometer
+        self.gyroscope = gyroscope
+        self.compass = compass
+
+    def __str__(self):
+        return (f"IMUMeasurement(frame={self.frame}, timestamp={self.timestamp:.6f}, accelerometer={self.accelerometer!r}, "
+                f"gyroscope={self.gyroscope!r}, compass={self.compass:.6f})")
+
+
+class GnssMeasurement(SensorData):
+    def __init__(self, frame, timestamp, transform, latitude, longitude, altitude):
+        super().__init__(frame, timestamp, transform)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+
+    def __str__(self):
+        return (f"GnssMeasurement(frame={self.frame}, timestamp={self.timestamp:.6f}, lat={self.latitude:.6f}, "
+                f"lon={self.longitude:.6f}, alt={self.altitude:.6f})")
+
+
+class SemanticLidarMeasurement(SensorData):
+    def __init__(self, frame, timestamp, transform, points):
+        super().__init__(frame, timestamp, transform)
+        self.raw_data = points.view(np.uint8)
+        self.channels = 32
+
+    def save_to_disk(self, path):
+        import os
+        if not os.path.splitext(path)[1]:
+            path += '.ply'
+        np.savetxt(path, self.raw_data.view(np.float32).reshape(-1, 4)[:, :3])
+        return path
+
+    def __str__(self):
+        return f"SemanticLidarMeasurement(frame={self.frame}, timestamp={self.timestamp:.6f})"
+
+
+class Sensor(Actor):
+    def __init__(self, world, actor_id, blueprint, transform, parent=None):
+        super().__init__(world, actor_id, blueprint, transform, parent)
+        self._callback = None
+        self._since_last = 0.0
+        self._seed = actor_id
+
+    def listen(self, callback):
+        self._callback = callback
+
+    def stop(self):
+        self._callback = None
+
+    def is_listening(self):
+        return self._callback is not None
+
+    def destroy(self):
+        self.stop()
+        return super().destroy()
+
+    def _due(self, delta_seconds):
+        """ sensor_tick semantics of the server: capture once the time since the last capture reaches it. """
+        self._since_last += delta_seconds
+        if self._since_last + 1e-9 >= float(self.attributes.get('sensor_tick', 0.0)):
+            self._since_last = 0.0
+            return True
+        return False
+
+    def _measure(self, frame, elapsed, delta_seconds, transform):
+        timestamp = elapsed
+        kind = self.type_id
+        if kind.startswith('sensor.camera.'):
+            width = int(float(self.attributes['image_size_x']))
+            height = int(float(self.attributes['image_size_y']))
+            fov = float(self.attributes['fov'])
+            camera = kind[len('sensor.camera.'):]
+            if camera == 'dvs':
+                events = _render.dvs_events(width, height, frame, int((elapsed - delta_seconds) * 1e9),
+                                            int(delta_seconds * 1e9), self._seed)
+                return DVSEventArray(frame, timestamp, transform, width, height, fov, events)
+            if camera == 'optical_flow':
+                return OpticalFlowImage(frame, timestamp, transform, width, height, fov,
+                                        _render.optical_flow(width, height, fov, frame))
+            if camera == 'depth':
+                bgra = _render.depth(width, height, fov, frame)
+            elif camera == 'semantic_segmentation':
+                bgra = _render.segmentation(width, height, fov, frame)
+            elif camera == 'instance_segmentation':
+                bgra = _render.segmentation(width, height, fov, frame, instances=True)
+            else:
+                bgra = _render.rgb(width, height, fov, frame)
+            return Image(frame, timestamp, transform, width, height, fov, bgra)
+        if kind == 'sensor.other.imu':
+            velocity = self.parent.get_velocity() if self.parent is not None else Vector3D()
+            return IMUMeasurement(frame, timestamp, transform, Vector3D(velocity.x * 0.01, velocity.y * 0.01, 9.81),
+                                  Vector3D(), math.radians(transform.rotation.yaw % 360.0))
+        if kind == 'sensor.other.gnss':
+            location = transform.location
+            return GnssMeasurement(frame, timestamp, transform, location.y * 1e-5, location.x * 1e-5, location.z)
+        points = np.zeros((1000, 4), dtype=np.float32)
+        return SemanticLidarMeasurement(frame, timestamp, transform, points)
+
+
+class EnvironmentObject:
+    def __init__(self, object_id, name, transform, bounding_box, object_type):
+        self.id = object_id
+        self.name = name
+        self.transform = transform
+        self.bounding_box = bounding_box
+        self.type = object_type
+
+
+class Map:
+    def __init__(self, name, seed=0):
+        self.name = name
+        rng = np.random.default_rng(abs(hash(name)) % (2 ** 32) + seed)
+        self._spawn_points = [
+            Transform(Location(x, y, 0.5), Rotation(yaw=yaw)) for x, y, yaw in zip(
+                rng.uniform(-MAP_EXTENT, MAP_EXTENT, SPAWN_POINT_COUNT),
+                rng.uniform(-MAP_EXTENT, MAP_EXTENT, SPAWN_POINT_COUNT),
+                rng.choice([0.0, 90.0, 180.0, -90.0], SPAWN_POINT_COUNT))]
+
+    def get_spawn_points(self):
+        return [Transform(Location(t.location.x, t.location.y, t.location.z), Rotation(yaw=t.rotation.yaw))
+                for t in self._spawn_points]
+
+    def __repr__(self):
+        return f"Map(name={self.name})"
+
+
+class WorldSettings:
+    def __init__(self, synchronous_mode=False, no_rendering_mode=False, fixed_delta_seconds=None):
+        self.synchronous_mode = synchronous_mode
+        self.no_rendering_mode = no_rendering_mode
+        self.fixed_delta_seconds = fixed_delta_seconds
+        self.substepping = True
+        self.max_substep_delta_time = 0.01
+        self.max_substeps = 10
+
+
+class ActorList:
+    def __init__(self, actors):
+        self._actors = list(actors)
+
+    def filter(self, wildcard_pattern):
+        return ActorList(actor for actor in self._actors if fnmatch.fnmatch(actor.type_id, wildcard_pattern))
+
+    def find(self, actor_id):
+        for actor in self._actors:
+            if actor.id == actor_id:
+                return actor
+        return None
+
+    def __iter__(self):
+        return iter(self._actors)
+
+    def __len__(self):
+        return len(self._actors)
+
+    def __getitem__(self, index):
+        return self._actors[index]
+
+
+class World:
+    def __init__(self, map_name):
+        self.id = id(self)
+        self._map = Map(map_name)
+        self._rng = np.random.default_rng(0)
+        self._settings = WorldSettings()
+        self._weather = WeatherParameters.ClearNoon
+        self._actors = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._frame = 0
+        self._elapsed = 0.0
+        self._tick_callbacks = {}
+        self._callback_ids = itertools.count(1)
+        self._delivery = concurrent.futures.ThreadPoolExecutor(
+            max_workers=SENSOR_THREADS, thread_name_prefix="mock-sensor")
+        self._blueprints = BlueprintLibrary()
+        self._environment = [EnvironmentObject(
+            1000000 + i, 'Parked_Car_%d' % i, Transform(Location(10.0 * i, -30.0, 0.5)),
+            BoundingBox(Location(10.0 * i, -30.0, 0.8), Vector3D(2.3, 1.0, 0.8)), CityObjectLabel.Car)
+            for i in range(5)]
+
+    def get_map(self):
+        return self._map
+
+    def get_blueprint_library(self):
+        return self._blueprints
+
+    def get_settings(self):
+        s = self._settings
+        return WorldSettings(s.synchronous_mode, s.no_rendering_mode, s.fixed_delta_seconds)
+
+    def apply_settings(self, settings):
+        self._settings = WorldSettings(settings.synchronous_mode, settings.no_rendering_mode,
+                                       settings.fixed_delta_seconds)
+        return self._frame
+
+    def get_weather(self):
+        return self._weather
+
+    def set_weather(self, weather):
+        self._weather = weather
+
+    def set_pedestrians_cross_factor(self, percentage):
+        pass
+
+    def set_pedestrians_seed(self, seed):
+        self._rng = np.random.default_rng(seed)
+
+    def get_environment_objects(self, object_type=CityObjectLabel.Any):
+        return [obj for obj in self._environment if object_type == CityObjectLabel.Any or obj.type == object_type]
+
+    def enable_environment_objects(self, env_objects_ids, enable):
+        pass
+
+    def get_random_location_from_navigation(self):
+        with self._lock:
+            x, y = self._rng.uniform(-MAP_EXTENT, MAP_EXTENT, 2)
+        return Location(x, y, 1.0)
+
+    def spawn_actor(self, blueprint, transform, attach_to=None, attachment_type=AttachmentType.Rigid):
+        actor = self.try_spawn_actor(blueprint, transform, attach_to)
+        if actor is None:
+            raise RuntimeError("Spawn failed because of collision at spawn position")
+        return actor
+
+    def try_spawn_actor(self, blueprint, transform, attach_to=None, attachment_type=AttachmentType.Rigid):
+        if blueprint.id.startswith('vehicle.'):
+            actor_class = Vehicle
+        elif blueprint.id.startswith('walker.'):
+            actor_class = Walker
+        elif blueprint.id == 'controller.ai.walker':
+            actor_class = WalkerAIController
+        elif blueprint.id.startswith('sensor.'):
+            actor_class = Sensor
+        else:
+            actor_class = Actor
+        transform = Transform(Location(transform.location.x, transform.location.y, transform.location.z),
+                              Rotation(transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll))
+        with self._lock:
+            actor = actor_class(self, next(self._ids), blueprint, transform, attach_to)
+            self._actors[actor.id] = actor
+        return actor
+
+    def _remove(self, actor_id):
+        with self._lock:
+            self._actors.pop(actor_id, None)
+
+    def get_actor(self, actor_id):
+        return self._actors.get(actor_id)
+
+    def get_actors(self, actor_ids=None):
+        with self._lock:
+            if actor_ids is None:
+                return ActorList(self._actors.values())
+            return ActorList(self._actors[i] for i in actor_ids if i in self._actors)
+
+    def on_tick(self, callback):
+        callback_id = next(self._callback_ids)
+        self._tick_callbacks[callback_id] = callback
+        return callback_id
+
+    def remove_on_tick(self, callback_id):
+        self._tick_callbacks.pop(callback_id, None)
+
+    def get_snapshot(self):
+        return self._snapshot
+
+    def wait_for_tick(self, seconds=10.0):
+        return self.tick(seconds)
+
+    def tick(self, seconds=10.0):
+        """ Advances the simulation one step; sensor data and tick callbacks follow on other threads. """
+        delta_seconds = self._settings.fixed_delta_seconds or 0.05
+        with self._lock:
+            self._frame += 1
+            self._elapsed += delta_seconds
+            frame, elapsed = self._frame, self._elapsed
+            actors = list(self._actors.values())
+            for actor in actors:
+                actor._step(delta_seconds)
+            timestamp = Timestamp(frame, elapsed, delta_seconds)
+            self._snapshot = WorldSnapshot(frame, timestamp, {
+                actor.id: ActorSnapshot(actor.id, actor.get_transform(), actor.get_velocity()) for actor in actors})
+            captures = [(sensor, sensor.get_transform()) for sensor in actors
+                        if isinstance(sensor, Sensor) and sensor._due(delta_seconds) and sensor.is_listening()]
+        snapshot = self._snapshot
+        for callback in list(self._tick_callbacks.values()):
+            self._delivery.submit(self._deliver, callback, lambda: snapshot)
+        for sensor, transform in captures:
+            callback = sensor._callback
+            self._delivery.submit(self._deliver, callback, lambda sensor=sensor, transform=transform:
+                                  sensor._measure(frame, elapsed, delta_seconds, transform))
+        return frame
+
+    @staticmethod
+    def _deliver(callback, measure):
+        try:
+            callback(measure())
+        except Exception as error:
+            print("An exception occurred in mock sensor callback:", error)
+
+
+class TrafficManager:
+    def __init__(self, port):
+        self._port = port
+
+    def get_port(self):
+        return self._port
+
+    def set_synchronous_mode(self, mode):
+        pass
+
+    def set_random_device_seed(self, seed):
+        pass
+
+    def set_hybrid_physics_mode(self, enabled):
+        pass
+
+    def set_global_distance_to_leading_vehicle(self, distance):
+        pass
+
+    def global_percentage_speed_difference(self, percentage):
+        pass
+
+    def set_respawn_dormant_vehicles(self, enabled):
+        pass
+
+
+class Client:
+    _worlds = {}
+
+    def __init__(self, host='127.0.0.1', port=2000, worker_threads=0):
+        self.host = host
+        self.port = port
+        self._timeout = 10.0
+        key = (host, port)
+        if key not in Client._worlds:
+            Client._worlds[key] = World('Carla/Maps/Town10HD_Opt')
+        self._key = key
+
+    def set_timeout(self, seconds):
+        self._timeout = seconds
+
+    def get_client_version(self):
+        return 'mock'
+
+    def get_server_version(self):
+        return 'mock'
+
+    def get_world(self):
+        return Client._worlds[self._key]
+
+    def get_available_maps(self):
+        return ['/Game/Carla/Maps/Town%02d' % i for i in (1, 2, 3, 4, 5, 6, 7, 10)] + ['/Game/Carla/Maps/Town10HD_Opt']
+
+    def load_world(self, map_name, reset_settings=True):
+        old = Client._worlds[self._key]
+        world = World('Carla/Maps/' + map_name.split('/')[-1])
+        if not reset_settings:
+            world.apply_settings(old.get_settings())
+        Client._worlds[self._key] = world
+        return world
+
+    def reload_world(self, reset_settings=True):
+        return self.load_world(self.get_world().get_map().name, reset_settings)
+
+    def get_trafficmanager(self, client_connection=8000):
+        return TrafficManager(client_connection)
+
+    def apply_batch(self, commands):
+        self.apply_batch_sync(commands, False)
+
+    def apply_batch_sync(self, commands, do_tick=False):
+        world = self.get_world()
+        responses = [self._apply(world, item, None) for item in commands]
+        if do_tick:
+            world.tick()
+        return responses
+
+    def _apply(self, world, item, future_actor):
+        try:
+            actor_id = 0
+            if isinstance(item, command.SpawnActor):
+                parent = world.get_actor(getattr(item.parent, 'id', item.parent)) if item.parent else None
+                blueprint = item.blueprint
+                if isinstance(blueprint, str):
+                    blueprint = world.get_blueprint_library().find(blueprint)
+                actor = world.spawn_actor(blueprint, item.transform, parent)
+                actor_id = actor.id
+            elif isinstance(item, command.DestroyActor):
+                actor = world.get_actor(item.actor_id)
+                if actor is not None:
+                    actor.destroy()
+                actor_id = item.actor_id
+            elif isinstance(item, command.SetAutopilot):
+                target = future_actor if item.actor is command.FutureActor else getattr(item.actor, 'id', item.actor)
+                actor = world.get_actor(target)
+                if actor is not None:
+                    actor.set_autopilot(item.enabled, item.tm_port)
+                actor_id = target
+            for chained in item._then:
+                self._apply(world, chained, actor_id)
+            return command.Response(actor_id)
+        except Exception as error:
+            return command.Response(0, str(error))
@@ -0,0 +1,122 @@
+"""
+Synthetic sensor buffers of the mock at the configured resolutions.
+
+Every camera sees the same simple scene, a sky above the horizon and a ground plane below
+it, plus low amplitude noise that moves with the frame so encoders see realistic entropy.
+The static parts are computed once per resolution and field of view.
+"""
+
+import threading
+import numpy as np
+
+NOISE_ROWS = 64
+# Semantic tags written to the red channel, as CARLA does
+TAG_ROAD = 1
+TAG_SKY = 11
+CITYSCAPES_PALETTE = np.zeros((256, 3), dtype=np.uint8)
+CITYSCAPES_PALETTE[TAG_ROAD] = (128, 64, 128)
+CITYSCAPES_PALETTE[TAG_SKY] = (180, 130, 70)
+# Events per pixel per frame of the DVS camera
+DVS_EVENT_RATE = 0.01
+DVS_EVENT_DTYPE = np.dtype([
+    ('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', np.bool_)])
+
+_lock = threading.Lock()
+_scenes = {}
+
+
+def _scene(width, height, fov):
+    key = (width, height, round(fov, 3))
+    with _lock:
+        scene = _scenes.get(key)
+    if scene is not None:
+        return scene
+
+    rng = np.random.default_rng(width * 7919 + height)
+    focal = width / (2.0 * np.tan(fov * np.pi / 360.0))
+    rows = np.arange(height, dtype=np.float64) - height / 2.0 + 0.5
+    # Camera 1.7 m above a flat ground, depth of the ground along each row, 1000 m for the sky
+    depth_rows = np.where(rows > 0, 1.7 * focal / np.maximum(rows, 1e-6), 1000.0)
+    depth_rows = np.minimum(depth_rows, 1000.0)
+    depth = np.repeat(depth_rows[:, None], width, axis=1)
+
+    sky = rows[:, None] <= 0
+    bgra = np.empty((height, width, 4), dtype=np.uint8)
+    bgra[..., 0] = np.where(sky, 200, 90)
+    bgra[..., 1] = np.where(sky, 160, 90)
+    bgra[..., 2] = np.where(sky, 120, 90)
+    bgra[..., 3] = 255
+
+    normalized = np.round(depth / 1000.0 * 16777215.0).astype(np.uint32)
+    depth_bgra = np.empty((height, width, 4), dtype=np.uint8)
+    depth_bgra[..., 0] = (normalized >> 16) & 255
+    depth_bgra[..., 1] = (normalized >> 8) & 255
+    depth_bgra[..., 2] = normalized & 255
+    depth_bgra[..., 3] = 255
+
+    tags = np.where(sky, TAG_SKY, TAG_ROAD).astype(np.uint8)
+    segmentation = np.zeros((height, width, 4), dtype=np.uint8)
+    segmentation[..., 2] = tags
+    segmentation[..., 3] = 255
+
+    scene = {
+        'rgb': bgra,
+        'depth': depth_bgra,
+        'segmentation': segmentation,
+        'noise': rng.integers(0, 16, size=(height + NOISE_ROWS, width, 4), dtype=np.uint8),
+        'flow': (rng.standard_normal((height + NOISE_ROWS, width, 2)) * 0.01).astype(np.float32),
+    }
+    scene['noise'][..., 3] = 0
+    with _lock:
+        _scenes[key] = scene
+    return scene
+
+
+def rgb(width, height, fov, frame):
+    scene = _scene(width, height, fov)
+    offset = frame % NOISE_ROWS
+    return np.add(scene['rgb'], scene['noise'][offset:offset + height])
+
+
+def depth(width, height, fov, frame):
+    return _scene(width, height, fov)['depth'].copy()
+
+
+def segmentation(width, height, fov, frame, instances=False):
+    image = _scene(width, height, fov)['segmentation'].copy()
+    if instances:
+        # Instance ids in green and blue
+        offset = frame % NOISE_ROWS
+        image[..., :2] = _scene(width, height, fov)[
+            'noise'][offset:offset + height, :, :2]
+    return image
+
+
+def optical_flow(width, height, fov, frame):
+    scene = _scene(width, height, fov)
+    offset = frame % NOISE_ROWS
+    return scene['flow'][offset:offset + height].copy()
+
+
+def dvs_events(width, height, frame, start_ns, duration_ns, seed):
+    rng = np.random.default_rng(seed * 1000003 + frame)
+    count = int(width * height * DVS_EVENT_RATE)
+    events = np.empty(count, dtype=DVS_EVENT_DTYPE)
+    events['x'] = rng.integers(0, width, count)
+    events['y'] = rng.integers(0, height, count)
+    events['t'] = start_ns + np.sort(rng.integers(0, max(duration_ns, 1), count))
+    events['pol'] = rng.integers(0, 2, count).astype(np.bool_)
+    return events
+
+
+def depth_to_gray(bgra):
+    """ In place ColorConverter.Depth: linear grey scale of the encoded depth. """
+    normalized = (bgra[..., 0].astype(np.uint32) << 16) | (
+        bgra[..., 1].astype(np.uint32) << 8) | bgra[..., 2]
+    gray = (normalized >> 16).astype(np.uint8)
+    bgra[..., 0] = bgra[..., 1] = bgra[..., 2] = gray
+
+
+def cityscapes(bgra):
+    """ In place ColorConverter.CityScapesPalette of the tags in the red channel. """
+    bgra[..., :3] = CITYSCAPES_PALETTE[bgra[..., 2]]
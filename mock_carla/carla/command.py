@@ -0,0 +1,59 @@
+"""Batch commands of the mock, see carla.Client.apply_batch."""
+
+
+class FutureActor:
+    """Placeholder for the actor spawned by the command a .then() is chained to."""
+
+
+class _Command:
+    def __init__(self):
+        self._then = []
+
+    def then(self, command):
+        self._then.append(command)
+        return self
+
+
+class SpawnActor(_Command):
+    def __init__(self, blueprint, transform, parent=None):
+        super().__init__()
+        self.blueprint = blueprint
+        self.transform = transform
+        self.parent = parent
+
+
+class DestroyActor(_Command):
+    def __init__(self, actor):
+        super().__init__()
+        self.actor_id = getattr(actor, 'id', actor)
+
+
+class SetAutopilot(_Command):
+    def __init__(self, actor, enabled, tm_port=8000):
+        super().__init__()
+        self.actor = actor
+        self.enabled = enabled
+        self.tm_port = tm_port
+
+
+class SetVehicleLightState(_Command):
+    def __init__(self, actor, light_state):
+        super().__init__()
+        self.actor = actor
+        self.light_state = light_state
+
+
+class SetSimulatePhysics(_Command):
+    def __init__(self, actor, enabled):
+        super().__init__()
+        self.actor = actor
+        self.enabled = enabled
+
+
+class Response:
+    def __init__(self, actor_id=0, error=''):
+        self.actor_id = actor_id
+        self.error = error
+
+    def has_error(self):
+        return bool(self.error)
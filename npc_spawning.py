@@ -2,6 +2,7 @@ import carla
 import random
 import logging
 import math
+from configuration import blueprintLibrary
 
 # @todo cannot import these directly.
 SpawnActor = carla.command.SpawnActor
@@ -10,7 +11,7 @@ SetVehicleLightState = carla.command.SetVehicleLightState
 FutureActor = carla.command.FutureActor
 
 
-def spawnVehicles(client, world, spawn_points, blueprintsVehicles, number):
+def spawnVehicles(client, world, spawn_points, blueprintsVehicles, number, tm_port=8000):
     print("Spawning vehicles...")
     customBp = {
         'vehicle.bh.crossbike': 8,
@@ -35,16 +36,16 @@ def spawnVehicles(client, world, spawn_points, blueprintsVehicles, number):
             spawn_point = random.choice(spawn_points)
             vehicle_bp = "vehicle.tesla.model3"
             batch.append(carla.command.SpawnActor(vehicle_bp, spawn_point).then(
-                carla.command.SetAutopilot(carla.command.FutureActor, True)))
+                carla.command.SetAutopilot(carla.command.FutureActor, True, tm_port)))
     else:
 
         for model, percentage in customBp.items():
             num_per_blueprint = math.floor((number * percentage)/100)
-            vehicle_bp = world.get_blueprint_library().find(model)
+            vehicle_bp = blueprintLibrary(world).find(model)
             for _ in range(num_per_blueprint):
                 spawn_point = random.choice(spawn_points)
                 batch.append(carla.command.SpawnActor(vehicle_bp, spawn_point).then(
-                    carla.command.SetAutopilot(carla.command.FutureActor, True)))
+                    carla.command.SetAutopilot(carla.command.FutureActor, True, tm_port)))
 
     results = client.apply_batch_sync(batch, True)
 
@@ -77,7 +78,7 @@ def spawnWalkers(client, world, blueprintsWalkers, number):
 
     # 3. Spawn walker AI controllers for each walker
     batch = []
-    walker_controller_bp = world.get_blueprint_library().find('controller.ai.walker')
+    walker_controller_bp = blueprintLibrary(world).find('controller.ai.walker')
 
     for i in range(len(walkers_list)):
         batch.append(carla.command.SpawnActor(walker_controller_bp,
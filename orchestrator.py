@@ -0,0 +1,220 @@
+"""
+Runs a matrix of capture scenarios over several CARLA servers.
+
+> python orchestrator.py scenarios.json --endpoint 127.0.0.1:2000:8000 --endpoint 127.0.0.1:2004:8004
+
+scenarios.json is the matrix; every combination of its lists is one scenario:
+{
+    "maps": ["Town03", "Town10HD_Opt"],
+    "weathers": ["ClearNoon", "WetCloudySunset"],
+    "densities": [{"vehicles": 30, "walkers": 50}],
+    "seeds": [1, 2],
+    "durations": [1500],
+    "rigs": [{"name": "front", "args": ["--sensor-config", "config/sensors.json"]}],
+    "args": ["--fixed-perception"]
+}
+
+A rig is a name and the arguments of its sensors and views; without "rigs" every scenario uses
+the sensors of main.py's arguments.
+
+One worker process per endpoint (host:port:tm_port) pulls scenarios from a shared queue and
+runs the capture command for it, by default main.py with the scenario as arguments and the
+scenario name as --run-name. Failed scenarios are queued again up to --retries times.
+Finished scenarios are appended to <out>/orchestrator.jsonl and skipped on the next start.
+
+On a single server, main.py --scenarios scenarios.json runs the same matrix in one process and
+loads every town once instead of once per scenario.
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import itertools
+import subprocess
+import multiprocessing
+
+DEFAULT_COMMAND = shlex.quote(sys.executable) + " main.py"
+
+
+def parse_endpoint(text):
+    """ host:port[:tm_port] -> (host, port, tm_port), tm_port defaulting to port + 6000 """
+    parts = text.split(':')
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError("Endpoint must be host:port[:tm_port], got " + text)
+    port = int(parts[1])
+    tm_port = int(parts[2]) if len(parts) == 3 else port + 6000
+    return parts[0], port, tm_port
+
+
+def load_endpoints(path):
+    with open(path) as file:
+        return [(endpoint['host'], int(endpoint['port']), int(endpoint.get('tm_port', int(endpoint['port']) + 6000)))
+                for endpoint in json.load(file)]
+
+
+def expand_matrix(matrix):
+    """ Returns the scenarios of a matrix as dicts with a unique name. """
+    scenarios = []
+    for town, weather, density, seed, duration, rig in itertools.product(
+            matrix['maps'], matrix.get('weathers', ['ClearNoon']),
+            matrix.get('densities', [{'vehicles': 10, 'walkers': 50}]),
+            matrix.get('seeds', [None]), matrix.get('durations', [1500]),
+            matrix.get('rigs', [{'name': None, 'args': []}])):
+        name = f"{town}_{weather}_v{density['vehicles']}_w{density['walkers']}_s{seed}_d{duration}"
+        if rig.get('name') is not None:
+            name += '_' + rig['name']
+        scenarios.append({
+            'name': name,
+            'map': town,
+            'weather': weather,
+            'vehicles': density['vehicles'],
+            'walkers': density['walkers'],
+            'seed': seed,
+            'duration': duration,
+            'args': matrix.get('args', []) + rig.get('args', []),
+        })
+    return scenarios
+
+
+def scenario_arguments(scenario):
+    """ Arguments of main.py for a scenario. """
+    arguments = ['--map', scenario['map'],
+                 '--start-weather', scenario['weather'], '--end-weather', scenario['weather'],
+                 '--number-of-vehicles', str(scenario['vehicles']),
+                 '--number-of-walkers', str(scenario['walkers']),
+                 '--duration', str(scenario['duration']),
+                 '--run-name', scenario['name']]
+    if scenario['seed'] is not None:
+        arguments += ['--seed', str(scenario['seed'])]
+    return arguments + list(scenario['args'])
+
+
+def scenario_command(command, scenario, endpoint):
+    host, port, tm_port = endpoint
+    return shlex.split(command) + ['--host', host, '--port', str(port), '--tm-port', str(tm_port)] + \
+        scenario_arguments(scenario)
+
+
+def worker(endpoint, command, timeout, log_folder, scenarios, results):
+    """ Runs scenarios from the queue against one server until it gets None. """
+    while True:
+        item = scenarios.get()
+        if item is None:
+            break
+        scenario, attempt = item
+        arguments = scenario_command(command, scenario, endpoint)
+        log_path = os.path.join(
+            log_folder, f"{scenario['name']}-attempt{attempt}.log")
+        start = time.time()
+        try:
+            with open(log_path, 'w') as log:
+                log.write(' '.join(shlex.quote(a) for a in arguments) + '\n')
+                log.flush()
+                returncode = subprocess.run(arguments, stdout=log, stderr=subprocess.STDOUT,
+                                            timeout=timeout).returncode
+        except subprocess.TimeoutExpired:
+            returncode = 'timeout'
+        except Exception as error:
+            print("An exception occurred in orchestrator worker:", error)
+            returncode = 'error'
+        results.put((scenario, attempt, endpoint, returncode, time.time() - start))
+
+
+def load_done(state_path):
+    done = set()
+    if os.path.exists(state_path):
+        with open(state_path) as state:
+            for line in state:
+                entry = json.loads(line)
+                if entry['returncode'] == 0:
+                    done.add(entry['name'])
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a scenario matrix over several CARLA servers')
+    parser.add_argument('scenarios', help='scenario matrix JSON')
+    parser.add_argument('--endpoint', action='append', default=[], type=parse_endpoint,
+                        help='CARLA server as host:port[:tm_port], repeat for every server')
+    parser.add_argument('--endpoints', default=None,
+                        help='JSON list of {"host", "port", "tm_port"} endpoints')
+    parser.add_argument('--command', default=DEFAULT_COMMAND,
+                        help='capture command the scenario arguments are appended to (default: python main.py)')
+    parser.add_argument('--retries', default=2, type=int,
+                        help='times a failed scenario is run again (default: 2)')
+    parser.add_argument('--timeout', default=None, type=float,
+                        help='seconds after which a scenario is killed and counts as failed (default: none)')
+    parser.add_argument('--output', default='out',
+                        help='folder of the orchestrator state and logs (default: out)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the commands of the first endpoint and exit')
+    args = parser.parse_args()
+
+    endpoints = list(args.endpoint)
+    if args.endpoints:
+        endpoints += load_endpoints(args.endpoints)
+    if not endpoints:
+        parser.error("No CARLA endpoints given, use --endpoint or --endpoints")
+
+    with open(args.scenarios) as file:
+        scenarios = expand_matrix(json.load(file))
+
+    if args.dry_run:
+        for scenario in scenarios:
+            print(' '.join(shlex.quote(a) for a in scenario_command(
+                args.command, scenario, endpoints[0])))
+        return
+
+    log_folder = os.path.join(args.output, 'orchestrator-logs')
+    os.makedirs(log_folder, exist_ok=True)
+    state_path = os.path.join(args.output, 'orchestrator.jsonl')
+    done = load_done(state_path)
+    pending = [scenario for scenario in scenarios if scenario['name'] not in done]
+    print(f"{len(scenarios)} scenarios, {len(scenarios) - len(pending)} already done, "
+          f"{len(endpoints)} servers")
+
+    scenario_queue = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    for scenario in pending:
+        scenario_queue.put((scenario, 1))
+    workers = [multiprocessing.Process(target=worker, args=(
+        endpoint, args.command, args.timeout, log_folder, scenario_queue, results)) for endpoint in endpoints]
+    for process in workers:
+        process.start()
+
+    outstanding = len(pending)
+    failed = []
+    with open(state_path, 'a') as state:
+        while outstanding:
+            scenario, attempt, endpoint, returncode, seconds = results.get()
+            state.write(json.dumps({'name': scenario['name'], 'attempt': attempt,
+                                    'endpoint': '%s:%d:%d' % endpoint, 'returncode': returncode,
+                                    'seconds': round(seconds, 1)}) + '\n')
+            state.flush()
+            print(f"{scenario['name']} on {endpoint[0]}:{endpoint[1]}: "
+                  f"{'done' if returncode == 0 else 'failed (' + str(returncode) + ')'} "
+                  f"after {seconds:.0f}s, attempt {attempt}")
+            if returncode != 0 and attempt <= args.retries:
+                scenario_queue.put((scenario, attempt + 1))
+                continue
+            if returncode != 0:
+                failed.append(scenario['name'])
+            outstanding -= 1
+
+    for process in workers:
+        scenario_queue.put(None)
+    for process in workers:
+        process.join()
+
+    print(f"Finished: {len(pending) - len(failed)} done, {len(failed)} failed")
+    for name in failed:
+        print("    failed:", name)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
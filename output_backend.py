@@ -0,0 +1,206 @@
+"""
+Where save_sensors.py puts the files of a run.
+
+By default (SimulationParams.output_backend is None) every artifact is a file of its own.
+With --output-format tar, TarShardBackend gives every camera of a view rolling tar shards of a
+fixed size:
+
+<run>/shards/<view>/<camera>-000000.tar, <camera>-000001.tar, ...
+<run>/shards/<view>/<camera>.jsonl      one line per member: name, shard, offset, size
+
+Members are named by their path relative to the run, so extracting the shards gives the
+same tree as the default. All artifacts of an rgb camera (images, labels, annotations,
+DVS events and calibration, see output_layout.py) share the shards of that camera.
+RunFiles reads the files of a run by their path, wherever they were written.
+"""
+
+import io
+import os
+import json
+import time
+import tarfile
+import threading
+from collections import OrderedDict
+from output_layout import path_camera
+
+SHARD_FOLDER = 'shards'
+TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+class _ShardMember(io.BytesIO):
+    """ Buffers one artifact and appends it to its shard on close. """
+
+    def __init__(self, backend, path, text):
+        super().__init__()
+        self.backend = backend
+        self.path = path
+        self.text = text
+
+    def write(self, data):
+        if self.text:
+            data = data.encode('utf-8')
+        return super().write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def close(self):
+        if not self.closed:
+            self.backend.add(self.path, self.getvalue())
+        super().close()
+
+
+class _ShardStream:
+    def __init__(self, folder, camera, shard_size):
+        self.folder = folder
+        self.camera = camera
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        self.number = -1
+        self.tar = None
+        self.index = open(os.path.join(folder, camera + '.jsonl'), 'a')
+        self._next_shard()
+
+    def _next_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+        self.number += 1
+        self.shard_name = f'{self.camera}-{self.number:06d}.tar'
+        self.tar = tarfile.open(os.path.join(
+            self.folder, self.shard_name), 'w', format=tarfile.GNU_FORMAT)
+
+    def add(self, name, data):
+        with self.lock:
+            if self.tar.offset > 0 and self.tar.offset + len(data) > self.shard_size:
+                self._next_shard()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self.tar.addfile(info, io.BytesIO(data))
+            padded = -(-len(data) // TAR_BLOCK) * TAR_BLOCK
+            offset = self.tar.offset - padded
+            self.index.write(json.dumps({'name': name, 'shard': self.shard_name,
+                                         'offset': offset, 'size': len(data)}) + '\n')
+
+    def close(self):
+        with self.lock:
+            self.tar.close()
+            self.index.close()
+
+
+class TarShardBackend:
+    def __init__(self, run_root, shard_size=1 << 30, recent_sizes=100000):
+        self.run_root = os.path.abspath(run_root)
+        self.shard_size = shard_size
+        self._lock = threading.Lock()
+        self._streams = {}
+        # Sizes of the latest members, for the run index
+        self._sizes = OrderedDict()
+        self._recent_sizes = recent_sizes
+
+    def open(self, path, mode='w'):
+        if 'a' in mode:
+            # Per-sensor metadata logs stay loose files
+            return open(path, mode)
+        return _ShardMember(self, path, 'b' not in mode)
+
+    def _stream_of(self, relative):
+        view, camera = path_camera(relative)
+        camera = camera.replace('dvs', 'rgb')
+        with self._lock:
+            stream = self._streams.get((view, camera))
+            if stream is None:
+                folder = os.path.join(self.run_root, SHARD_FOLDER, view)
+                os.makedirs(folder, exist_ok=True)
+                stream = _ShardStream(folder, camera, self.shard_size)
+                self._streams[(view, camera)] = stream
+        return stream
+
+    def add(self, path, data):
+        relative = os.path.relpath(os.path.abspath(path), self.run_root)
+        self._stream_of(relative).add(relative, data)
+        with self._lock:
+            self._sizes[path] = len(data)
+            if len(self._sizes) > self._recent_sizes:
+                self._sizes.popitem(last=False)
+
+    def size(self, path):
+        with self._lock:
+            return self._sizes.get(path)
+
+    def close(self):
+        with self._lock:
+            streams = list(self._streams.values())
+            self._streams = {}
+        for stream in streams:
+            stream.close()
+
+
+def iter_shard_members(shard_paths):
+    """ Streams (member name, bytes) from shards in order, reading each tar sequentially once. """
+    for shard_path in shard_paths:
+        with tarfile.open(shard_path, 'r|') as tar:
+            for member in tar:
+                if member.isfile():
+                    yield member.name, tar.extractfile(member).read()
+
+
+def camera_shards(run_root, view, camera):
+    folder = os.path.join(run_root, SHARD_FOLDER, view)
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                  if f.startswith(camera + '-') and f.endswith('.tar'))
+
+
+def read_member(run_root, view, entry):
+    """ Random access to one member from its .jsonl index entry. """
+    with open(os.path.join(run_root, SHARD_FOLDER, view, entry['shard']), 'rb') as shard:
+        shard.seek(entry['offset'])
+        return shard.read(entry['size'])
+
+
+class RunFiles:
+    """
+    Read access to the files of a run, loose or members of its shards, by their path.
+    The .jsonl indexes of the shards are read once; a member written again replaces the earlier one.
+    """
+
+    def __init__(self, run_root):
+        self.run_root = os.path.abspath(run_root)
+        self._members = {}
+        # Folder relative to the run -> names of the files and folders in it
+        self._children = {}
+        shard_root = os.path.join(self.run_root, SHARD_FOLDER)
+        views = sorted(os.listdir(shard_root)) if os.path.isdir(shard_root) else []
+        for view in views:
+            for index in sorted(f for f in os.listdir(os.path.join(shard_root, view)) if f.endswith('.jsonl')):
+                with open(os.path.join(shard_root, view, index)) as file:
+                    for line in file:
+                        entry = json.loads(line)
+                        self._members[entry['name']] = (view, entry)
+        for name in self._members:
+            parts = name.split(os.sep)
+            for depth in range(1, len(parts)):
+                self._children.setdefault(os.sep.join(parts[:depth]), set()).add(parts[depth])
+
+    def _relative(self, path):
+        return os.path.relpath(os.path.abspath(path), self.run_root)
+
+    def exists(self, path):
+        return self._relative(path) in self._members or os.path.exists(path)
+
+    def isdir(self, path):
+        return self._relative(path) in self._children or os.path.isdir(path)
+
+    def listdir(self, path):
+        names = set(self._children.get(self._relative(path), ()))
+        if os.path.isdir(path):
+            names.update(os.listdir(path))
+        return sorted(names)
+
+    def open(self, path, mode='r'):
+        member = self._members.get(self._relative(path))
+        if member is None:
+            return open(path, mode)
+        data = read_member(self.run_root, *member)
+        return io.BytesIO(data) if 'b' in mode else io.StringIO(data.decode('utf-8'))
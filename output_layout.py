@@ -0,0 +1,77 @@
+"""
+Final on-disk layout of the labelled cameras of a view (ego0, fixed-1, ...).
+It is the layout the old shift-files.py, xml-yolo.py and shift-npz.py post-passes produced:
+
+<view>/images/rgb/rgb_camera-front/<frame>.png
+<view>/images/dvs/dvs_camera-front/<frame>.png
+<view>/images/calibration/calibration_camera-front/<frame>.txt
+<view>/labels/rgb/rgb_camera-front/<frame>.txt                  YOLO
+<view>/labels/dvs/dvs_camera-front/<frame>.txt                  YOLO
+<view>/annotations/rgb/rgb_camera-front/<frame>.{xml,json,txt}  Pascal VOC, COCO, KITTI
+<view>/annotations/dvs/dvs_camera-front/<frame>.{xml,json,txt}
+<view>/annotations/dvs/dvs_camera-front/npz/<frame>-xytp.npz   raw DVS events
+<view>/annotations/dvs/dvs_camera-front/npz/<frame>-repr.npz   DVS tensors
+
+All other sensors keep writing to <view>/<role_name>/.
+"""
+
+import os
+
+YOLO_CLASSES = {'car': 0, 'truck': 1, 'van': 2,
+                'pedestrian': 3, 'motorcycle': 4, 'bicycle': 5}
+
+
+def camera_folders(view_folder, rgb_camera):
+    """ Returns the output folders of the rgb camera role_name of a view and of its paired dvs camera. """
+    dvs_camera = rgb_camera.replace("rgb", "dvs")
+    return {
+        'rgb_images': os.path.join(view_folder, 'images', 'rgb', rgb_camera),
+        'dvs_images': os.path.join(view_folder, 'images', 'dvs', dvs_camera),
+        'calibration': os.path.join(view_folder, 'images', 'calibration',
+                                    rgb_camera.replace("rgb", "calibration")),
+        'rgb_labels': os.path.join(view_folder, 'labels', 'rgb', rgb_camera),
+        'dvs_labels': os.path.join(view_folder, 'labels', 'dvs', dvs_camera),
+        'rgb_annotations': os.path.join(view_folder, 'annotations', 'rgb', rgb_camera),
+        'dvs_annotations': os.path.join(view_folder, 'annotations', 'dvs', dvs_camera),
+        'dvs_events': os.path.join(view_folder, 'annotations', 'dvs', dvs_camera, 'npz'),
+    }
+
+
+def path_camera(relative_path):
+    """ (view, camera role_name) of a file given relative to the run folder; calibration files belong to their rgb camera. """
+    parts = relative_path.split(os.sep)
+    if len(parts) > 4 and parts[1] in ('images', 'labels', 'annotations'):
+        return parts[0], parts[3].replace('calibration', 'rgb')
+    return parts[0], parts[1] if len(parts) > 1 else ''
+
+
+def make_camera_folders(view_folder, rgb_camera):
+    folders = camera_folders(view_folder, rgb_camera)
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    return folders
+
+
+def yolo_lines(bounding_boxes, image_w, image_h):
+    """ YOLO lines for (obj_id, class_name, (xmin, ymin, width, height)) boxes.
+        Same arithmetic as the Pascal VOC -> YOLO conversion, so output is identical.
+    """
+    lines = []
+    for obj_id, class_name, bbox in bounding_boxes:
+        class_id = YOLO_CLASSES.get(class_name)
+        if class_id is None:
+            continue
+        xmin, ymin, width, height = bbox
+        x_min = float(xmin) / image_w
+        y_min = float(ymin) / image_h
+        x_max = float(xmin + width) / image_w
+        y_max = float(ymin + height) / image_h
+        lines.append(
+            f"{class_id} {(x_min + x_max) / 2} {(y_min + y_max) / 2} {x_max - x_min} {y_max - y_min}")
+    return lines
+
+
+def save_yolo_format(bounding_boxes, file_path, image_w, image_h, opener=open):
+    with opener(file_path, 'w') as file:
+        for line in yolo_lines(bounding_boxes, image_w, image_h):
+            file.write(line + '\n')
@@ -0,0 +1,149 @@
+"""
+Raw recordings of the labelled cameras of a view, labelled offline by labeler.py.
+--record-raw writes all of the files below; other captures write the actors, the poses and
+the depth buffers (unless --no-label-inputs), so that labeler.py --relabel can label them
+again with the DVS events saved next to the labels.
+
+<view>/raw/actors/<frame>.json             vehicles and pedestrians, see frame_actors.actor_record
+<view>/raw/<rgb camera>/<frame>.json       pose of the camera, frame, time and size of its rgb, dvs and depth data
+<view>/raw/<rgb camera>/<frame>-rgb.npy    raw_data of the rgb camera (BGRA)
+<view>/raw/<rgb camera>/<frame>-dvs.npy    raw_data of the paired dvs camera (events)
+<view>/raw/<rgb camera>/<frame>-depth.npz  "depth": the 24 bit encoded depth of the paired depth camera (BGR)
+
+The rgb and dvs buffers are stored as the sensors deliver them, without any decoding or
+compression, so the capture only pays for the disk. The depth buffer is compressed without its
+alpha channel, which is always 255, and is read back unchanged. Files are opened with the opener
+given, save_sensors.openOutput during a capture, so they follow --output-format, and are read
+back through output_backend.RunFiles, from loose files or tar shards.
+"""
+
+import os
+import re
+import json
+import numpy as np
+from frame_actors import actor_record, recorded_agents, transform_record, record_transform, RecordedSensor
+from output_backend import RunFiles
+
+RAW_FOLDER = 'raw'
+ACTORS_FOLDER = 'actors'
+KINDS = ['rgb', 'dvs', 'depth']
+# File of a buffer kind, by frame
+BUFFER_FILES = {'rgb': '{}-rgb.npy', 'dvs': '{}-dvs.npy', 'depth': '{}-depth.npz'}
+FRAME_FILE = re.compile(r'^(\d+)\.json$')
+
+
+class RecordedData:
+    """ Sensor data read back from a recording, with the attributes the labelling reads. """
+
+    def __init__(self, record, raw_data):
+        self.frame = record['frame']
+        self.timestamp = record['timestamp']
+        self.width = record['width']
+        self.height = record['height']
+        self.fov = record['fov']
+        self.transform = record_transform(record['transform'])
+        self.raw_data = raw_data
+
+
+def data_record(data):
+    return {
+        'frame': data.frame,
+        'timestamp': data.timestamp,
+        'width': data.width,
+        'height': data.height,
+        'fov': data.fov,
+        'transform': transform_record(data.transform),
+    }
+
+
+def write_actors(view_folder, frame, agents, opener=open):
+    folder = os.path.join(view_folder, RAW_FOLDER, ACTORS_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    with opener(os.path.join(folder, f'{frame}.json'), 'w') as file:
+        json.dump([actor_record(class_name, agent)
+                  for class_name, agent in agents], file)
+
+
+def run_files(view_folder):
+    return RunFiles(os.path.dirname(os.path.abspath(view_folder)))
+
+
+def read_actors(view_folder, frame, files=None):
+    files = files or run_files(view_folder)
+    with files.open(os.path.join(view_folder, RAW_FOLDER, ACTORS_FOLDER, f'{frame}.json')) as file:
+        return recorded_agents(json.load(file))
+
+
+def record_camera(view_folder, rgb_camera, output, sensor, dvs, depth, buffers, opener=open):
+    """ Stores the poses of an rgb camera frame and of its dvs and depth data, and the buffers ({kind: raw_data}) given;
+        the depth buffer must be taken before the image is converted. Returns the bytes of the buffer files. """
+    folder = os.path.join(view_folder, RAW_FOLDER, rgb_camera)
+    os.makedirs(folder, exist_ok=True)
+    nbytes = 0
+    for kind in buffers:
+        array = np.frombuffer(buffers[kind], dtype=np.uint8)
+        with opener(os.path.join(folder, BUFFER_FILES[kind].format(output.frame)), 'wb') as file:
+            if kind == 'depth':
+                np.savez_compressed(file, depth=array.reshape((depth.height, depth.width, 4))[:, :, :3])
+            else:
+                np.save(file, array)
+            nbytes += file.tell()
+    record = {
+        'sensor': {'id': sensor.id, 'type_id': sensor.type_id,
+                   'transform': transform_record(output.transform)},
+        'rgb': data_record(output),
+        'dvs': data_record(dvs),
+        'depth': data_record(depth),
+    }
+    with opener(os.path.join(folder, f'{output.frame}.json'), 'w') as file:
+        json.dump(record, file)
+    return nbytes
+
+
+def recorded_cameras(view_folder, kind=None, files=None):
+    """ Returns {rgb camera: [frames]} of the recordings of a view, only frames with a buffer of kind if given. """
+    files = files or run_files(view_folder)
+    root = os.path.join(view_folder, RAW_FOLDER)
+    cameras = {}
+    if not files.isdir(root):
+        return cameras
+    for camera in files.listdir(root):
+        if camera == ACTORS_FOLDER or not files.isdir(os.path.join(root, camera)):
+            continue
+        names = set(files.listdir(os.path.join(root, camera)))
+        frames = [int(match.group(1)) for match in map(FRAME_FILE.match, names) if match]
+        if kind is not None:
+            frames = [frame for frame in frames if BUFFER_FILES[kind].format(frame) in names]
+        cameras[camera] = sorted(frames)
+    return cameras
+
+
+def load_buffer(kind, file):
+    """ raw_data of a buffer file (path or binary file object), as the sensor delivered it. """
+    if kind != 'depth':
+        return np.load(file)
+    with np.load(file) as archive:
+        bgr = archive['depth']
+    bgra = np.empty(bgr.shape[:2] + (4,), dtype=np.uint8)
+    bgra[:, :, :3] = bgr
+    bgra[:, :, 3] = 255
+    return bgra.reshape(-1)
+
+
+def load_camera(view_folder, rgb_camera, frame, files=None):
+    """ Returns (agents, sensor, rgb, dvs, depth) of a recorded frame, ready for save_sensors.saveRgbImage;
+        the raw_data of buffers that were not recorded is None. """
+    files = files or run_files(view_folder)
+    folder = os.path.join(view_folder, RAW_FOLDER, rgb_camera)
+    with files.open(os.path.join(folder, f'{frame}.json')) as file:
+        record = json.load(file)
+    data = []
+    for kind in KINDS:
+        path = os.path.join(folder, BUFFER_FILES[kind].format(frame))
+        raw_data = None
+        if files.exists(path):
+            with files.open(path, 'rb') as file:
+                raw_data = load_buffer(kind, file)
+        data.append(RecordedData(record[kind], raw_data))
+    return (read_actors(view_folder, record['rgb']['frame'], files),
+            RecordedSensor(record['sensor'])) + tuple(data)
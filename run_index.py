@@ -0,0 +1,143 @@
+"""
+SQLite index written alongside each run (<run>/index.sqlite).
+
+frames:  one row per (view, sensor, frame) with the simulation time, the files written and their total size
+objects: one row per labelled object of an rgb camera frame
+
+> python run_index.py out/<run>/index.sqlite --view fixed-4 --class pedestrian --min-count 3 --occlusion-below 2
+> python run_index.py out/<run>/index.sqlite --stats
+"""
+
+import os
+import json
+import queue
+import sqlite3
+import argparse
+import threading
+import traceback
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    view TEXT, sensor TEXT, frame INTEGER, sim_time REAL, paths TEXT, bytes INTEGER);
+CREATE TABLE IF NOT EXISTS objects (
+    view TEXT, camera TEXT, frame INTEGER, actor_id INTEGER, class TEXT,
+    xmin INTEGER, ymin INTEGER, xmax INTEGER, ymax INTEGER,
+    distance REAL, occlusion INTEGER, truncation REAL, dvs_events INTEGER);
+CREATE INDEX IF NOT EXISTS frames_by_sensor ON frames (view, sensor, frame);
+CREATE INDEX IF NOT EXISTS objects_by_camera ON objects (view, camera, frame);
+CREATE INDEX IF NOT EXISTS objects_by_class ON objects (class, occlusion);
+"""
+
+INSERTS = {
+    'frames': "INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?)",
+    'objects': "INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+}
+
+
+class RunIndex:
+    """
+    Fills the index from the capture threads. Rows are queued and a single thread owning
+    the connection inserts them in batched transactions.
+    """
+
+    def __init__(self, db_path, batch_size=1000, flush_interval=1.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._rows = queue.Queue()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def add_frame(self, view, sensor, frame, sim_time, paths, size=None):
+        # size is given when the files are not on disk, e.g. packed into tar shards
+        if size is None:
+            paths = [path for path in paths if os.path.exists(path)]
+            size = sum(os.path.getsize(path) for path in paths)
+        self._rows.put(('frames', (view, sensor, frame, sim_time, json.dumps(paths), size)))
+
+    def add_object(self, view, camera, frame, actor_id, class_name, bbox, distance, occlusion, truncation, dvs_events):
+        xmin, ymin, width, height = bbox
+        self._rows.put(('objects', (view, camera, frame, actor_id, class_name, xmin, ymin,
+                                    xmin + width, ymin + height, distance, occlusion, truncation, dvs_events)))
+
+    def _write(self):
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        closing = False
+        while not closing:
+            batch = {'frames': [], 'objects': []}
+            count = 0
+            try:
+                item = self._rows.get(timeout=self.flush_interval)
+                while True:
+                    if item is None:
+                        closing = True
+                        break
+                    batch[item[0]].append(item[1])
+                    count += 1
+                    if count >= self.batch_size:
+                        break
+                    item = self._rows.get_nowait()
+            except queue.Empty:
+                pass
+            if count:
+                try:
+                    with connection:
+                        for table, rows in batch.items():
+                            if rows:
+                                connection.executemany(INSERTS[table], rows)
+                except Exception as error:
+                    print("An exception occurred in run index:", error)
+                    traceback.print_exc()
+        connection.close()
+
+    def close(self):
+        self._rows.put(None)
+        self._thread.join()
+
+
+def select_frames(connection, view=None, camera=None, class_name=None, min_count=1, occlusion_below=4):
+    """ Returns (view, camera, frame, count) of frames with at least min_count matching objects. """
+    conditions = ["occlusion < ?"]
+    values = [occlusion_below]
+    for column, value in [('view', view), ('camera', camera), ('class', class_name)]:
+        if value is not None:
+            conditions.append(column + " = ?")
+            values.append(value)
+    query = ("SELECT view, camera, frame, COUNT(*) FROM objects WHERE " + " AND ".join(conditions) +
+             " GROUP BY view, camera, frame HAVING COUNT(*) >= ? ORDER BY view, camera, frame")
+    return connection.execute(query, values + [min_count]).fetchall()
+
+
+def statistics(connection):
+    return {
+        'frames': connection.execute(
+            "SELECT view, sensor, COUNT(*), SUM(bytes) FROM frames GROUP BY view, sensor").fetchall(),
+        'objects': connection.execute(
+            "SELECT class, COUNT(*), AVG(distance), AVG(occlusion), AVG(truncation) FROM objects GROUP BY class").fetchall(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the SQLite index of a run')
+    parser.add_argument('db_path', help='out/<run>/index.sqlite')
+    parser.add_argument('--stats', action='store_true', help='print dataset statistics')
+    parser.add_argument('--view', default=None)
+    parser.add_argument('--camera', default=None)
+    parser.add_argument('--class', dest='class_name', default=None)
+    parser.add_argument('--min-count', default=1, type=int)
+    parser.add_argument('--occlusion-below', default=4, type=int)
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db_path)
+    if args.stats:
+        for table, rows in statistics(connection).items():
+            print(table)
+            for row in rows:
+                print("   ", *row)
+    else:
+        for row in select_frames(connection, args.view, args.camera, args.class_name,
+                                 args.min_count, args.occlusion_below):
+            print(*row)
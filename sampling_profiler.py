@@ -0,0 +1,121 @@
+"""
+Sampling profiler that a running capture turns on when it receives a signal.
+
+> kill -USR1 <pid of main.py>
+
+samples the Python stacks of all threads every --profile-interval ms for the next --profile-ticks
+ticks and writes them as collapsed stacks to <run>/profiles/profile-<first frame>-<last frame>.collapsed,
+one "thread;outer function;...;inner function count" line per distinct stack. flamegraph.pl,
+speedscope or inferno render them; the functions with the most samples are also printed.
+Sampling reads sys._current_frames() from a background thread, so the capture runs unchanged
+between samples and not at all slower while the profiler is off.
+"""
+
+import os
+import sys
+import signal
+import threading
+import collections
+
+
+class SamplingProfiler:
+    def __init__(self, output_folder, ticks=100, interval=0.01):
+        self.output_folder = output_folder
+        self.ticks = ticks
+        self.interval = interval
+        self._requested = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._counts = collections.Counter()
+        self._samples = 0
+        self._first_frame = None
+        self._remaining = 0
+        self._last_frame = None
+
+    def install(self, signal_number=None):
+        """ Turns the profiler on at the next tick after the signal (SIGUSR1 by default); main thread only. """
+        signal_number = signal_number or getattr(signal, 'SIGUSR1', None)
+        if signal_number is None:
+            print("Sampling profiler not installed, this platform has no SIGUSR1")
+            return False
+        signal.signal(signal_number, self._on_signal)
+        print(f"Sampling profiler: send signal {int(signal_number)} to process {os.getpid()} "
+              f"to profile the next {self.ticks} ticks")
+        return True
+
+    def _on_signal(self, signum, frame):
+        # Only set a flag here, the tick loop starts the sampler
+        self._requested = True
+
+    def on_tick(self, frame_id):
+        """ Called once per tick by the capture loop. """
+        self._last_frame = frame_id
+        if self._thread is not None:
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self._finish(frame_id)
+        elif self._requested:
+            self._requested = False
+            self._start(frame_id)
+
+    def _start(self, frame_id):
+        print(
+            f"Sampling profiler: profiling {self.ticks} ticks from frame {frame_id}")
+        self._first_frame = frame_id
+        self._remaining = self.ticks
+        self._counts = collections.Counter()
+        self._samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(_thread_group(names.get(ident, str(ident))))
+                self._counts[';'.join(reversed(stack))] += 1
+            self._samples += 1
+
+    def _finish(self, frame_id):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        os.makedirs(self.output_folder, exist_ok=True)
+        path = os.path.join(self.output_folder,
+                            f"profile-{self._first_frame}-{frame_id}.collapsed")
+        with open(path, 'w') as file:
+            for stack, count in self._counts.most_common():
+                file.write(f"{stack} {count}\n")
+        print(f"Sampling profiler: {self._samples} samples of frames {self._first_frame}-{frame_id} "
+              f"written to {path}")
+        for function, count in top_functions(self._counts, 10):
+            print(f"    {count:>7} {function}")
+
+    def close(self):
+        """ Writes a profile that is still running, e.g. when the capture ends before its last tick. """
+        if self._thread is not None:
+            self._finish(self._last_frame)
+
+
+def _thread_group(name):
+    """ Folds numbered pool threads (frame_0, writer_3, ThreadPoolExecutor-1_2) into one entry per pool. """
+    return name.rstrip('0123456789').rstrip('_-') or name
+
+
+def top_functions(counts, n):
+    """ Functions by samples in which they were running (the innermost frame). """
+    own = collections.Counter()
+    for stack, count in counts.items():
+        own[stack.rsplit(';', 1)[-1]] += count
+    return own.most_common(n)
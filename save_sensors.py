@@ -1,11 +1,18 @@
 import os
+import io
+import time
 import carla
 import numpy as np
-import pygame
 import cv2
 import traceback
 import json
 from bb import create_kitti_datapoint
+from configuration import SimulationParams
+from utils.flow import encode_flow
+from output_layout import camera_folders, save_yolo_format
+from dvs_representations import decode_dvs_events, build_representations, render_dvs_image
+from frame_actors import FrameSensor, frame_agents
+import raw_recording
 import concurrent.futures
 
 
@@ -211,11 +218,15 @@ edges = [[0, 1], [1, 3], [3, 2], [2, 0], [0, 4], [4, 5],
 
 
 def saveAllSensors(out_root_folder, sensor_datas, sensor_types, world):
-    sensor_datas.pop(0)
+    # The world snapshot of the frame; labels use its actor transforms, not the live ones
+    snapshot = sensor_datas.pop(0)[0]
+    agents = None
 
     dvs_camera = {}
     rgb_camera = {}
     depth_camera = {}
+    # Depth buffers as received, saveDepthImage converts the images in place
+    depth_raw = {}
     futures = []
     with concurrent.futures.ThreadPoolExecutor() as executor:
         for i in range(len(sensor_datas)):
@@ -229,6 +240,9 @@ def saveAllSensors(out_root_folder, sensor_datas, sensor_types, world):
                     print("An exception occurred in saveAllSensors:", error)
                     traceback.print_exc()
             sensor_name = sensor_types[i]
+            if sensor_data is None:
+                # Decimated sensor, not due this tick
+                continue
 
             if (sensor_name.find('dvs') != -1):
                 dvs_camera[sensor_name] = sensor_data
@@ -248,19 +262,47 @@ def saveAllSensors(out_root_folder, sensor_datas, sensor_types, world):
 
             if (sensor_name.find('depth_camera') != -1):
                 depth_camera[sensor_name] = sensor_data
+                # The labels decode this copy, as labeler.py --relabel does
+                depth_raw[sensor_name] = np.frombuffer(
+                    sensor_data.raw_data, dtype=np.uint8).copy()
                 saveDepthImage(sensor_data, os.path.join(
                     out_root_folder, sensor_name))
 
             if (sensor_name.find('rgb_camera') != -1):
                 try:
                     rgb_camera[sensor_name] = (
-                        sensor_data[i], os.path.join(out_root_folder, sensor_name))
+                        sensor_data, os.path.join(out_root_folder, sensor_name))
                     dvs = sensor_name.replace("rgb", "dvs")
                     depth = sensor_name.replace("rgb", "depth")
+                    if dvs not in dvs_camera or depth not in depth_camera:
+                        print(f"Skipping {sensor_name} at frame {sensor_data.frame}: labels need "
+                              f"{dvs} and {depth} to capture at the rate of {sensor_name}")
+                        continue
                     rgb_file_path = os.path.join(
                         out_root_folder, sensor_name)
-                    future = executor.submit(saveRgbImage, sensor_data, rgb_file_path,
-                                             world, sensor, vehicle, dvs_camera[dvs], depth_camera[depth])
+                    if agents is None:
+                        agents = frame_agents(world, snapshot)
+                        if SimulationParams.record_raw or SimulationParams.label_inputs:
+                            futures.append(executor.submit(raw_recording.write_actors,
+                                                           out_root_folder, sensor_data.frame, agents, openOutput))
+                    if SimulationParams.record_raw:
+                        buffers = {'rgb': sensor_data.raw_data, 'dvs': dvs_camera[dvs].raw_data,
+                                   'depth': depth_raw[depth]}
+                        future = executor.submit(recordRgbImage, sensor_data, out_root_folder, sensor_name,
+                                                 sensor, dvs_camera[dvs], depth_camera[depth], buffers)
+                    else:
+                        future = executor.submit(saveRgbImage, sensor_data, rgb_file_path,
+                                                 agents, sensor, vehicle, dvs_camera[dvs], depth_camera[depth],
+                                                 depth_raw[depth])
+                        if SimulationParams.label_inputs:
+                            # Poses and depth for labeler.py --relabel, the DVS events are saved with the labels
+                            record_args = (sensor_data, out_root_folder, sensor_name, sensor, dvs_camera[dvs],
+                                           depth_camera[depth], {'depth': depth_raw[depth]})
+                            if SimulationParams.writer_pool is None:
+                                futures.append(executor.submit(recordRgbImage, *record_args))
+                            else:
+                                SimulationParams.writer_pool.submit_frame(
+                                    sensor_data.frame, recordRgbImage, *record_args)
                     futures.append(future)
                 except Exception as error:
                     print("An exception occurred in rgb_camera sensor find:", error)
@@ -283,11 +325,12 @@ def saveSnapshot(output, filepath):
     return
 
 
-def saveSteeringAngle(value, filepath):
+def saveSteeringAngle(frame, value, filepath):
+    """ Appends a "frame, steering" line; called from the tick loop, so the lines are in frame order. """
     with open(filepath + "/steering_norm.txt", 'a') as fp:
-        fp.writelines(str(value) + ", ")
+        fp.write(f"{frame}, {value}\n")
     with open(filepath + "/steering_true.txt", 'a') as fp:
-        fp.writelines(str(70*value) + ", ")
+        fp.write(f"{frame}, {70*value}\n")
 
 
 def saveGnss(output, filepath, sensor_name):
@@ -370,7 +413,7 @@ def draw_bounding_box_corners(image, points, color=(0, 0, 255), thickness=2):
 
 
 def save_pascal_voc_format(bounding_boxes_with_ids, file_path, image_filename, image_w, image_h):
-    with open(file_path, 'w') as file:
+    with openOutput(file_path, 'w') as file:
         file.write(f'<?xml version="1.0" encoding="UTF-8"?>\n')
         file.write(f'<annotation>\n')
         file.write(f'    <filename>{image_filename}</filename>\n')
@@ -436,135 +479,183 @@ def save_coco_format(bounding_boxes, file_path, id, image_filename, image_w, ima
             "iscrowd": 0,
             "segmentation": [],
         })
-    with open(file_path, 'w') as file:
+    with openOutput(file_path, 'w') as file:
         json.dump(coco_data, file, indent=4)
 
 
 def save_kitti_3d_format(annotations, filepath):
-    with open(filepath, "w") as file:
+    with openOutput(filepath, "w") as file:
         for element in annotations:
             file.write(str(element) + "\n")
 
 
-def saveRgbImage(output, filepath, world, sensor, ego_vehicle, dvs, depth):
+def decode_depth(depth, raw_data=None):
+    """ Depth in meters of a raw sensor.camera.depth image; raw_data is a copy taken before the image was converted. """
+    array = np.frombuffer(depth.raw_data if raw_data is None else raw_data, dtype=np.dtype("uint8"))
+    array = np.reshape(array, (depth.height, depth.width, 4))
+    array = array[:, :, :3]
+    array = array.astype(np.float32)
+    normalized_depth = np.dot(array, [65536.0, 256.0, 1.0])
+    normalized_depth /= 16777215.0
+    return normalized_depth * 1000
+
+
+def label_agents(agents, sensor, output, img, dvs_events, deptharray, params):
+    """ 2D boxes and KITTI datapoints of the agents visible to an rgb camera and to its dvs camera. """
+    labels = {'rgb_boxes': [], 'dvs_boxes': [],
+              'rgb_kitti': [], 'dvs_kitti': [], 'objects': []}
+
+    calibration = np.identity(3)
+    calibration[0, 2] = output.width / 2.0
+    calibration[1, 2] = output.height / 2.0
+    calibration[0, 0] = calibration[1, 1] = output.width / \
+        (2.0 * np.tan(output.fov * np.pi / 360.0))
+
+    for class_name, agent in agents:
+        bounding_boxes = ClientSideBoundingBoxes.get_bounding_boxes(
+            [agent], sensor, output.height, output.width, output.fov)
+        for bbox in bounding_boxes:
+            points = [(int(bbox[i, 0]), int(bbox[i, 1]))
+                      for i in range(8)]
+            bounding_box = get_2d_bounding_box(
+                np.array(points, dtype=np.int32))
+            min_x, min_y, xdiff, ydiff = bounding_box
+            dvs_count = count_dvs_events_inside_bbox(
+                dvs_events, min_x, min_y, min_x + xdiff, min_y + ydiff)
+            transform = output.transform
+            image, datapoint, camera_bbox = create_kitti_datapoint(
+                agent, sensor, calibration, img, deptharray, transform, bbox, params)
+            if datapoint is not None:
+                labels['rgb_kitti'].append(datapoint)
+                labels['rgb_boxes'].append((agent.id, class_name,
+                                            (min_x, min_y, xdiff, ydiff)))
+                if dvs_count > 0:
+                    labels['dvs_kitti'].append(datapoint)
+                    labels['dvs_boxes'].append((agent.id, class_name,
+                                                (min_x, min_y, xdiff, ydiff)))
+                distance = agent.get_transform().location.distance(transform.location)
+                labels['objects'].append((agent.id, class_name, (min_x, min_y, xdiff, ydiff), distance,
+                                          int(datapoint.occluded), float(datapoint.truncated), dvs_count))
+    return labels
+
+
+def save_annotations(folders, output, labels):
+    """ Writes the Pascal VOC, COCO, KITTI and YOLO files of label_agents(); returns {'rgb': paths, 'dvs': paths}. """
+    image_filename = f'{output.frame}.png'
+    written = {}
+    for kind in ['rgb', 'dvs']:
+        boxes, kitti = labels[kind + '_boxes'], labels[kind + '_kitti']
+        annotations = folders[kind + '_annotations']
+        paths = [os.path.join(annotations, f'{output.frame}.{extension}') for extension in ['xml', 'json', 'txt']] + \
+            [os.path.join(folders[kind + '_labels'], f'{output.frame}.txt')]
+        save_pascal_voc_format(
+            boxes, paths[0], image_filename, output.width, output.height)
+        save_coco_format(
+            boxes, paths[1], output.frame, image_filename, output.width, output.height)
+        save_kitti_3d_format(kitti, paths[2])
+        save_yolo_format(boxes, paths[3], output.width,
+                         output.height, opener=openOutput)
+        written[kind] = paths
+    return written
+
+
+def saveRgbImage(output, filepath, agents, sensor, ego_vehicle, dvs, depth, depth_buffer=None):
     try:
-        dvs_events = np.frombuffer(dvs.raw_data, dtype=np.dtype([
-            ('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', np.bool)
-        ]))
-        output_file_path = os.path.join(
-            filepath, f'dvs-{output.frame}-xytp.npz')
-        np.savez_compressed(output_file_path, dvs_events=dvs_events)
-        dvs_events2 = np.frombuffer(dvs.raw_data, dtype=np.dtype([
-            ('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', np.bool)]))
-        dvs_img = np.zeros((dvs.height, dvs.width, 3), dtype=np.uint8)
-        dvs_img[dvs_events2[:]['y'], dvs_events2[:]
-                ['x'], dvs_events2[:]['pol'] * 2] = 255
-        surface = pygame.surfarray.make_surface(dvs_img.swapaxes(0, 1))
-
-        array = np.frombuffer(depth.raw_data, dtype=np.dtype("uint8"))
-        array = np.reshape(array, (depth.height, depth.width, 4))
-        array = array[:, :, :3]
-        array = array.astype(np.float32)
-        normalized_depth = np.dot(array, [65536.0, 256.0, 1.0])
-        normalized_depth /= 16777215.0
-        deptharray = normalized_depth * 1000
-
+        sensor = FrameSensor(sensor, output.transform)
+        folders = camera_folders(os.path.dirname(
+            filepath), os.path.basename(filepath))
+        stage_started = time.perf_counter()
+        dvs_events = decode_dvs_events(dvs.raw_data)
+        deptharray = decode_depth(depth, depth_buffer)
         img = np.frombuffer(output.raw_data, dtype=np.uint8).reshape(
             (output.height, output.width, 4))
+        observeStage('decode_seconds', stage_started, filepath, output.frame)
+
+        output_file_path = os.path.join(
+            folders['dvs_events'], f'{output.frame}-xytp.npz')
+        writeNpz(output_file_path, True, dvs_events=dvs_events)
+        saveDvsRepresentations(dvs_events, dvs.height, dvs.width, os.path.join(
+            folders['dvs_events'], f'{output.frame}-repr.npz'), output.frame)
 
         # All labels in CityObjectLabel
         # ['Any', 'Bicycle', 'Bridge', 'Buildings', 'Bus', 'Car', 'Dynamic', 'Fences', 'Ground', 'GuardRail', 'Motorcycle', 'NONE', 'Other', 'Pedestrians', 'Poles', 'RailTrack', 'Rider', 'RoadLines', 'Roads', 'Sidewalks', 'Sky', 'Static', 'Terrain', 'TrafficLight', 'TrafficSigns', 'Train', 'Truck', 'Vegetation', 'Walls', 'Water', '__abs__', '__add__', '__and__', '__bool__', '__ceil__', '__class__', '__delattr__', '__dir__', '__divmod__', '__doc__', '__eq__', '__float__', '__floor__', '__floordiv__', '__format__', '__ge__', '__getattribute__', '__getnewargs__', '__gt__', '__hash__', '__index__', '__init__', '__init_subclass__', '__int__', '__invert__', '__le__', '__lshift__', '__lt__', '__mod__', '__module__', '__mul__', '__ne__', '__neg__', '__new__', '__or__', '__pos__', '__pow__', '__radd__', '__rand__', '__rdivmod__', '__reduce__', '__reduce_ex__', '__repr__', '__rfloordiv__', '__rlshift__', '__rmod__', '__rmul__', '__ror__', '__round__', '__rpow__', '__rrshift__', '__rshift__', '__rsub__', '__rtruediv__', '__rxor__', '__setattr__', '__sizeof__', '__slots__', '__str__', '__sub__', '__subclasshook__', '__truediv__', '__trunc__', '__xor__', 'bit_length', 'conjugate', 'denominator', 'from_bytes', 'imag', 'name', 'names', 'numerator', 'real', 'to_bytes', 'values']
 
-        dvsbb = []
-        rgbbb = []
+        stage_started = time.perf_counter()
+        labels = label_agents(agents, sensor, output, img,
+                              dvs_events, deptharray, SimulationParams.labeling)
+        objects = labels['objects']
+        observeStage('label_seconds', stage_started, filepath, output.frame)
+
+        image_filename = f'{output.frame}.png'
+        written = {'rgb': [], 'dvs': [
+            os.path.join(folders['dvs_events'], f'{output.frame}-xytp.npz')]}
+        written['rgb'].append(os.path.join(folders['rgb_images'], image_filename))
+        writeImage(written['rgb'][-1], img)
+
+        video_sink = SimulationParams.video_sink
+        stream_video = video_sink is not None and video_sink.wants(
+            os.path.basename(filepath))
+        if stream_video:
+            video_sink.write(filepath, np.ascontiguousarray(
+                img[:, :, :3]), frame_id=output.frame)
+
+        if SimulationParams.dvs_png or (stream_video and video_sink.dvs):
+            dvs_img = render_dvs_image(dvs_events, dvs.height, dvs.width)
+            if SimulationParams.dvs_png:
+                written['dvs'].append(os.path.join(
+                    folders['dvs_images'], image_filename))
+                writeImage(written['dvs'][-1], dvs_img)
+            if stream_video and video_sink.dvs:
+                video_sink.write(filepath, dvs_img, kind='dvs',
+                                 frame_id=output.frame)
+
+        stage_started = time.perf_counter()
+        for kind, paths in save_annotations(folders, output, labels).items():
+            written[kind] += paths
 
-        calibration = np.identity(3)
-        calibration[0, 2] = output.width / 2.0
-        calibration[1, 2] = output.height / 2.0
-        calibration[0, 0] = calibration[1, 1] = output.width / \
-            (2.0 * np.tan(output.fov * np.pi / 360.0))
-        kitti3dbb = []
-        kitti3dbbDVS = []
-
-        for vehicle in world.get_actors().filter("*vehicle*"):
-            bounding_boxes = ClientSideBoundingBoxes.get_bounding_boxes(
-                [vehicle], sensor, output.height, output.width, output.fov)
-            for bbox in bounding_boxes:
-                points = [(int(bbox[i, 0]), int(bbox[i, 1]))
-                          for i in range(8)]
-                bounding_box = get_2d_bounding_box(
-                    np.array(points, dtype=np.int32))
-                min_x, min_y, xdiff, ydiff = bounding_box
-                isDvs = is_dvs_event_inside_bbox(
-                    dvs_events, min_x, min_y, min_x + xdiff, min_y + ydiff)
-                transform = output.transform
-                image, datapoint, camera_bbox = create_kitti_datapoint(
-                    vehicle, sensor, calibration, img, deptharray, transform, bbox)
-                if datapoint is not None:
-                    kitti3dbb.append(datapoint)
-                    rgbbb.append((vehicle.id, vehicle.attributes.get(
-                        'base_type'), (min_x, min_y, xdiff, ydiff)))
-                    if isDvs == True:
-                        kitti3dbbDVS.append(datapoint)
-                        dvsbb.append((vehicle.id, vehicle.attributes.get(
-                            'base_type'), (min_x, min_y, xdiff, ydiff)))
-
-        for vehicle in world.get_actors().filter("*pedestrian*"):
-            bounding_boxes = ClientSideBoundingBoxes.get_bounding_boxes(
-                [vehicle], sensor, output.height, output.width, output.fov)
-            for bbox in bounding_boxes:
-                points = [(int(bbox[i, 0]), int(bbox[i, 1])) for i in range(8)]
-                bounding_box = get_2d_bounding_box(
-                    np.array(points, dtype=np.int32))
-                min_x, min_y, xdiff, ydiff = bounding_box
-                transform = output.transform
-                image, datapoint, camera_bbox = create_kitti_datapoint(
-                    vehicle, sensor, calibration, img, deptharray, transform, bbox)
-                isDvs = is_dvs_event_inside_bbox(
-                    dvs_events, min_x, min_y, min_x + xdiff, min_y + ydiff)
-                if datapoint is not None:
-                    kitti3dbb.append(datapoint)
-                    rgbbb.append((vehicle.id, 'pedestrian',
-                                 (min_x, min_y, xdiff, ydiff)))
-                    if isDvs == True:
-                        kitti3dbbDVS.append(datapoint)
-                        dvsbb.append((vehicle.id, 'pedestrian',
-                                     (min_x, min_y, xdiff, ydiff)))
-
-        output_file = os.path.join(
-            filepath, f'{output.frame}.png')
-        cv2.imwrite(output_file, img)
-
-        output_file = os.path.join(filepath, f'dvs-{output.frame}.png')
-        pygame.image.save(surface, output_file)
-
-        save_pascal_voc_format(rgbbb, os.path.join(
-            filepath, f'{output.frame}.xml'), f'{output.frame}.png', output.width, output.height)
-        save_coco_format(rgbbb, os.path.join(
-            filepath, f'{output.frame}.json'), output.frame, f'{output.frame}.png', output.width, output.height)
-
-        save_pascal_voc_format(dvsbb, os.path.join(
-            filepath, f'dvs-{output.frame}.xml'), f'dvs-{output.frame}.png', output.width, output.height)
-        save_coco_format(dvsbb, os.path.join(
-            filepath, f'dvs-{output.frame}.json'), output.frame, f'dvs-{output.frame}.png', output.width, output.height)
-
-        save_kitti_3d_format(kitti3dbb, os.path.join(
-            filepath, f'{output.frame}.txt'))
-        save_kitti_3d_format(kitti3dbbDVS, os.path.join(
-            filepath, f'dvs-{output.frame}.txt'))
         intrinsic_matrix = get_intrinsic_matrix(
             output.height, output.width, output.fov)
-        save_calibration_matrices(os.path.join(
-            filepath, f'calib-{output.frame}.txt'), intrinsic_matrix)
+        written['rgb'].append(os.path.join(
+            folders['calibration'], f'{output.frame}.txt'))
+        save_calibration_matrices(written['rgb'][-1], intrinsic_matrix)
+        observeStage('serialize_seconds', stage_started,
+                     filepath, output.frame)
+
+        run_index = SimulationParams.run_index
+        if run_index is not None:
+            view = os.path.basename(os.path.dirname(filepath))
+            camera = os.path.basename(filepath)
+            run_index.add_frame(view, camera, output.frame,
+                                output.timestamp, written['rgb'], outputSize(written['rgb']))
+            run_index.add_frame(view, camera.replace("rgb", "dvs"), dvs.frame,
+                                dvs.timestamp, written['dvs'], outputSize(written['dvs']))
+            for object_row in objects:
+                run_index.add_object(view, camera, output.frame, *object_row)
 
     except Exception as error:
         print("An exception occurred:", error)
         traceback.print_exc()
 
 
+def recordRgbImage(output, out_root_folder, sensor_name, sensor, dvs, depth, buffers):
+    """ Stores the poses and the raw buffers ({kind: raw_data}) of an rgb camera frame for labeler.py. """
+    started = time.perf_counter()
+    nbytes = raw_recording.record_camera(
+        out_root_folder, sensor_name, output, sensor, dvs, depth, buffers, opener=openOutput)
+    telemetry = SimulationParams.telemetry
+    if telemetry is not None:
+        telemetry.observe('write_seconds', time.perf_counter() - started,
+                          sensor=telemetry.sensor_name(os.path.join(out_root_folder, sensor_name)),
+                          frame=output.frame, nbytes=nbytes)
+    if SimulationParams.backpressure is not None:
+        SimulationParams.backpressure.observe_write(time.perf_counter() - started)
+
+
 def saveISImage(output, filepath):
     try:
-        output.save_to_disk(filepath + '/%05d' % output.frame)
+        saveConverted(output, filepath)
+        indexFrame(filepath, output.frame, output.timestamp, [
+                   filepath + '/%05d.png' % output.frame])
         with open(filepath + "/rgb_camera_metadata.txt", 'a') as fp:
             fp.writelines(str(output) + ", ")
             fp.writelines(str(output.transform) + "\n")
@@ -573,44 +664,151 @@ def saveISImage(output, filepath):
 
 
 def is_dvs_event_inside_bbox(event, x_min, y_min, x_max, y_max):
-    # Extract x, y, and polarity
-    x, y, polarity = event['x'], event['y'], event['pol']
+    return count_dvs_events_inside_bbox(event, x_min, y_min, x_max, y_max) > 0
+
+
+def count_dvs_events_inside_bbox(event, x_min, y_min, x_max, y_max):
     is_inside_bbox = np.logical_and(
         np.logical_and(x_min <= event['x'], event['x'] <= x_max),
         np.logical_and(y_min <= event['y'], event['y'] <= y_max)
     )
-
-    if is_inside_bbox.any():
-        return True
-    return False
+    return int(np.count_nonzero(is_inside_bbox))
+
+
+def indexFrame(filepath, frame, sim_time, paths):
+    if SimulationParams.run_index is not None:
+        SimulationParams.run_index.add_frame(os.path.basename(os.path.dirname(
+            filepath)), os.path.basename(filepath), frame, sim_time, paths, outputSize(paths))
+
+
+def openOutput(path, mode='w'):
+    if SimulationParams.output_backend is None:
+        return open(path, mode)
+    return SimulationParams.output_backend.open(path, mode)
+
+
+def outputSize(paths):
+    """ Bytes written to paths when they do not exist as files, None otherwise. """
+    if SimulationParams.output_backend is None:
+        return None
+    return sum(SimulationParams.output_backend.size(path) or 0 for path in paths)
+
+
+def observeStage(metric, started, filepath, frame):
+    """ Records the seconds since started for the camera whose output folder is filepath. """
+    telemetry = SimulationParams.telemetry
+    if telemetry is not None:
+        telemetry.observe(metric, time.perf_counter() - started,
+                          sensor=telemetry.sensor_name(filepath), frame=frame)
+
+
+def writeEncoded(path, data, started, encoded):
+    """ Writes encoded bytes and records encode (started to encoded) and write time. """
+    with openOutput(path, 'wb') as file:
+        file.write(data)
+    telemetry = SimulationParams.telemetry
+    if telemetry is not None:
+        telemetry.observe('encode_seconds', encoded - started, path=path)
+        telemetry.observe('write_seconds', time.perf_counter() - encoded,
+                          path=path, nbytes=len(data))
+    if SimulationParams.backpressure is not None:
+        SimulationParams.backpressure.observe_write(time.perf_counter() - encoded)
+
+
+def writeImage(path, img):
+    started = time.perf_counter()
+    compression = pngCompression()
+    if compression is None:
+        data = cv2.imencode('.png', img)[1]
+    else:
+        data = cv2.imencode(
+            '.png', img, [cv2.IMWRITE_PNG_COMPRESSION, compression])[1]
+    writeEncoded(path, data.tobytes(), started, time.perf_counter())
+
+
+def pngCompression():
+    """ PNG compression level set by the backpressure controller, None for the encoder default. """
+    if SimulationParams.backpressure is None:
+        return None
+    return SimulationParams.backpressure.png_compression()
+
+
+def writeNpz(path, compressed, **arrays):
+    save = np.savez_compressed if compressed else np.savez
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    save(buffer, **arrays)
+    writeEncoded(path, buffer.getbuffer(), started, time.perf_counter())
+
+
+def saveConverted(output, filepath):
+    """ carla.Image.save_to_disk, or the same PNG into the output backend or at a lower compression effort. """
+    if SimulationParams.output_backend is None and pngCompression() is None:
+        started = time.perf_counter()
+        path = filepath + '/%05d.png' % output.frame
+        output.save_to_disk(path)
+        telemetry = SimulationParams.telemetry
+        if telemetry is not None:
+            # The simulator encodes and writes in one call
+            telemetry.observe('write_seconds', time.perf_counter() - started, path=path,
+                              nbytes=os.path.getsize(path) if os.path.exists(path) else 0)
+        if SimulationParams.backpressure is not None:
+            SimulationParams.backpressure.observe_write(time.perf_counter() - started)
+        return
+    image = np.frombuffer(output.raw_data, dtype=np.uint8).reshape(
+        (output.height, output.width, 4))
+    writeImage(filepath + '/%05d.png' % output.frame, image)
 
 
 def dvs_callback(data, filepath):
-    timestamp = data.timestamp
-    dvs_events = np.frombuffer(data.raw_data, dtype=np.dtype([
-        ('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', np.bool)]))
-    dvs_img = np.zeros((data.height, data.width, 3), dtype=np.uint8)
-    dvs_img[dvs_events[:]['y'], dvs_events[:]
-            ['x'], dvs_events[:]['pol'] * 2] = 255
-    surface = pygame.surfarray.make_surface(dvs_img.swapaxes(0, 1))
-    output_file = os.path.join(filepath, f'{data.frame}.png')
-    pygame.image.save(surface, output_file)
+    dvs_events = decode_dvs_events(data.raw_data)
+    saveDvsRepresentations(dvs_events, data.height, data.width, os.path.join(
+        filepath, f'{data.frame}-repr.npz'), data.frame)
+    if SimulationParams.dvs_png:
+        output_file = os.path.join(filepath, f'{data.frame}.png')
+        writeImage(output_file, render_dvs_image(
+            dvs_events, data.height, data.width))
+
+
+def saveDvsRepresentations(dvs_events, height, width, filename, frame=None):
+    if not SimulationParams.dvs_representations:
+        return
+    if SimulationParams.writer_pool is None:
+        writeDvsRepresentations(dvs_events, height, width, filename)
+    else:
+        SimulationParams.writer_pool.submit_frame(
+            frame, writeDvsRepresentations, dvs_events, height, width, filename)
+
+
+def writeDvsRepresentations(dvs_events, height, width, filename):
+    started = time.perf_counter()
+    tensors = build_representations(dvs_events, height, width, SimulationParams.dvs_representations,
+                                    bins=SimulationParams.dvs_bins,
+                                    tau=SimulationParams.dvs_time_surface_tau,
+                                    normalization=SimulationParams.dvs_normalization)
+    telemetry = SimulationParams.telemetry
+    if telemetry is not None:
+        telemetry.observe('encode_seconds', time.perf_counter() - started, path=filename)
+    writeNpz(filename, False, **tensors)
 
 
 def optical_camera_callback(image, filepath):
+    # Copy out of the sensor buffer here; quantising and compressing happen on a writer thread.
+    # The colour coded view is produced offline by utils/flow-to-color.py.
     image_data = np.frombuffer(image.raw_data, dtype=np.float32)
-    image_data = image_data.reshape((image.height, image.width, 2))
-    filename = os.path.join(filepath, f"{image.frame}.npz")
-    data_dict = {'flow': image_data}
-    np.savez_compressed(filename, **data_dict)
-
-    data = image.get_color_coded_flow()
-    array = np.frombuffer(data.raw_data, dtype=np.dtype("uint8"))
-    array = np.reshape(array, (data.height, data.width, 4))
-    array = array[:, :, :3]
-    array = array[:, :, ::-1]
-    filename = os.path.join(filepath, f"{image.frame}.png")
-    cv2.imwrite(filename, array)
+    image_data = image_data.reshape((image.height, image.width, 2)).copy()
+    if SimulationParams.writer_pool is None:
+        saveFlow(image_data, filepath, image.frame, image.timestamp)
+    else:
+        SimulationParams.writer_pool.submit_frame(
+            image.frame, saveFlow, image_data, filepath, image.frame, image.timestamp)
+
+
+def saveFlow(flow, filepath, frame, sim_time):
+    filename = os.path.join(filepath, f"{frame}.npz")
+    data_dict = encode_flow(flow, SimulationParams.flow_encoding)
+    writeNpz(filename, True, **data_dict)
+    indexFrame(filepath, frame, sim_time, [filename])
 
 
 def get_intrinsic_matrix(height, width, fov):
@@ -638,14 +836,16 @@ def save_calibration_matrices(filename, intrinsic_mat):
             map(str, arr.flatten(ravel_mode).squeeze()))))
 
     # All matrices are written on a line with spacing
-    with open(filename, 'w') as f:
+    with openOutput(filename, 'w') as f:
         for i in range(4):  # Avod expects all 4 P-matrices even though we only use the first
             write_flat(f, "P" + str(i), P0)
 
 
 def saveDepthImage(output, filepath):
     output.convert(carla.ColorConverter.Depth)
-    output.save_to_disk(filepath + '/%05d' % output.frame)
+    saveConverted(output, filepath)
+    indexFrame(filepath, output.frame, output.timestamp, [
+               filepath + '/%05d.png' % output.frame])
     with open(filepath + "/depth_camera_metadata.txt", 'a') as fp:
         fp.writelines(str(output) + ", ")
         fp.writelines(str(output.transform) + "\n")
@@ -653,7 +853,9 @@ def saveDepthImage(output, filepath):
 
 def saveSegImage(output, filepath):
     output.convert(carla.ColorConverter.CityScapesPalette)
-    output.save_to_disk(filepath + '/%05d' % output.frame)
+    saveConverted(output, filepath)
+    indexFrame(filepath, output.frame, output.timestamp, [
+               filepath + '/%05d.png' % output.frame])
 
     image_data = np.array(output.raw_data)
     image_data = image_data.reshape((output.height, output.width, 4))
@@ -0,0 +1,240 @@
+"""
+Per-stage runtime telemetry of a capture (<run>/metrics.jsonl or .csv and <run>/metrics.prom).
+
+Every observation is one record of the metrics file:
+{"time": 12.81, "metric": "label_seconds", "sensor": "ego0/rgb_camera-front", "frame": 4711, "value": 0.043, "bytes": 0}
+
+tick_seconds       wall time of world.tick()
+arrival_seconds    from the start of a tick to the arrival of a sensor's data of that frame
+decode_seconds     raw sensor buffers to arrays (DVS events, depth, image)
+label_seconds      projection, occlusion and KITTI labels of all agents for an rgb camera
+encode_seconds     PNG/NPZ encoding and DVS tensors
+write_seconds      writing encoded bytes to files or shards, with the bytes written
+serialize_seconds  annotations and calibration of an rgb camera
+save_seconds       all sensors of a view for one frame
+queue depths       writer_queue, frames_in_flight, pending_frames (per view), sampled every tick
+
+The last --telemetry-window observations of every metric and sensor give the rolling
+percentiles of the console summary and of the Prometheus text file, which is rewritten at every
+summary so a node exporter textfile collector or a local scraper can read it.
+"""
+
+import os
+import csv
+import json
+import time
+import threading
+import collections
+import numpy as np
+
+from output_layout import path_camera
+
+QUANTILES = [0.5, 0.9, 0.99]
+SUMMARY_STAGES = ['tick', 'arrival', 'decode',
+                  'label', 'encode', 'write', 'save']
+CSV_FIELDS = ['time', 'metric', 'sensor', 'frame', 'value', 'bytes']
+PROMETHEUS_PREFIX = 'carla_capture_'
+
+
+class Telemetry:
+    def __init__(self, run_root, metrics_format='jsonl', interval=10.0, window=1000):
+        self.run_root = os.path.abspath(run_root)
+        self.interval = interval
+        self.window = window
+        os.makedirs(run_root, exist_ok=True)
+        self.metrics_path = os.path.join(run_root, 'metrics.' + metrics_format)
+        self.prometheus_path = os.path.join(run_root, 'metrics.prom')
+        self._file = open(self.metrics_path, 'w', newline='')
+        self._csv = None
+        if metrics_format == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(CSV_FIELDS)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last_summary = self._started
+        # (metric, sensor) -> recent values, total count and sum
+        self._recent = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.window))
+        self._totals = collections.defaultdict(lambda: [0, 0.0])
+        self._bytes = collections.Counter()
+        self._bytes_at_summary = 0
+        self._gauges = {}
+        # Start times of the ticks whose sensor data may still arrive
+        self._tick_started = None
+        self._tick_starts = collections.OrderedDict()
+        self._ticks = 0
+        self._ticks_at_summary = 0
+        self._frame = None
+
+    def sensor_name(self, path):
+        """ view/camera of an output file, e.g. ego0/rgb_camera-front """
+        relative = os.path.relpath(os.path.abspath(path), self.run_root)
+        return '/'.join(path_camera(relative))
+
+    def observe(self, metric, value, sensor=None, frame=None, nbytes=0, path=None):
+        if path is not None and sensor is None:
+            sensor = self.sensor_name(path)
+        record = (round(time.monotonic() - self._started, 6),
+                  metric, sensor, frame, value, nbytes)
+        with self._lock:
+            self._recent[(metric, sensor)].append(value)
+            totals = self._totals[(metric, sensor)]
+            totals[0] += 1
+            totals[1] += value
+            if nbytes:
+                self._bytes[sensor] += nbytes
+            self._write(record)
+
+    def gauge(self, name, value, sensor=None, frame=None):
+        with self._lock:
+            self._gauges[(name, sensor)] = value
+            self._write((round(time.monotonic() - self._started, 6),
+                         name, sensor, frame, value, 0))
+
+    def _write(self, record):
+        if self._file.closed:
+            # Sensor callbacks still running after close()
+            return
+        if self._csv is not None:
+            self._csv.writerow(record)
+        else:
+            self._file.write(json.dumps(dict(zip(CSV_FIELDS, record))) + '\n')
+
+    def tick_started(self):
+        self._tick_started = time.monotonic()
+
+    def tick_finished(self, frame_id):
+        now = time.monotonic()
+        with self._lock:
+            self._tick_starts[frame_id] = self._tick_started
+            while len(self._tick_starts) > 64:
+                self._tick_starts.popitem(last=False)
+            self._ticks += 1
+            self._frame = frame_id
+        self.observe('tick_seconds', now - self._tick_started, frame=frame_id)
+
+    def sensor_arrival(self, sensor, frame_id):
+        """ Called from the sensor callbacks; data may arrive before tick() has returned. """
+        now = time.monotonic()
+        with self._lock:
+            started = self._tick_starts.get(frame_id, self._tick_started)
+        if started is not None:
+            self.observe('arrival_seconds', now - started,
+                         sensor=sensor, frame=frame_id)
+
+    def arrival_callback(self, view, names):
+        """ FrameAggregator on_arrival for the bundle slots of a view: world snapshot, then names. """
+        sensors = [view + '/world'] + [view + '/' + name for name in names]
+        return lambda index, frame_id: self.sensor_arrival(sensors[index], frame_id)
+
+    def percentiles(self, metric, sensor=None):
+        """ Rolling percentiles of a metric of one sensor, or over all sensors when sensor is None. """
+        with self._lock:
+            if sensor is not None:
+                values = list(self._recent.get((metric, sensor), ()))
+            else:
+                values = [value for (name, _), recent in self._recent.items()
+                          if name == metric for value in recent]
+        if not values:
+            return None
+        return np.quantile(values, QUANTILES)
+
+    def maybe_summarize(self):
+        """ Prints the console summary and rewrites the Prometheus file every interval seconds. """
+        now = time.monotonic()
+        if now - self._last_summary < self.interval:
+            return
+        self.summarize(now)
+
+    def summarize(self, now=None):
+        now = now or time.monotonic()
+        elapsed = max(now - self._last_summary, 1e-9)
+        with self._lock:
+            ticks = self._ticks - self._ticks_at_summary
+            total_bytes = sum(self._bytes.values())
+            written = total_bytes - self._bytes_at_summary
+            self._ticks_at_summary = self._ticks
+            self._bytes_at_summary = total_bytes
+            self._last_summary = now
+            gauges = dict(self._gauges)
+            self._file.flush()
+
+        parts = [f"frame {self._frame}", f"{ticks / elapsed:.2f} ticks/s"]
+        for stage in SUMMARY_STAGES:
+            quantiles = self.percentiles(stage + '_seconds')
+            if quantiles is not None:
+                parts.append(
+                    f"{stage} p50 {quantiles[0] * 1000:.0f} p99 {quantiles[2] * 1000:.0f} ms")
+        parts.append(f"{written / elapsed / 1e6:.1f} MB/s")
+        queues = collections.Counter()
+        for (name, sensor), value in gauges.items():
+            queues[name] += value
+        if queues:
+            parts.append(' '.join(f"{name} {_format_gauge(name, value)}" for name,
+                         value in sorted(queues.items())))
+        print("Telemetry: " + " | ".join(parts))
+        self.write_prometheus()
+
+    def write_prometheus(self):
+        with self._lock:
+            keys = list(self._recent.keys())
+            totals = {key: list(value) for key, value in self._totals.items()}
+            byte_counts = dict(self._bytes)
+            gauges = dict(self._gauges)
+        lines = []
+        metrics = sorted({metric for metric, sensor in keys})
+        for metric in metrics:
+            name = PROMETHEUS_PREFIX + metric
+            lines.append(
+                f"# HELP {name} {metric.replace('_', ' ')} over the last {self.window} observations")
+            lines.append(f"# TYPE {name} summary")
+            sensors = sorted({sensor for m, sensor in keys if m == metric},
+                             key=lambda sensor: sensor or '')
+            for sensor in sensors:
+                labels = _labels(sensor=sensor)
+                quantiles = self.percentiles(metric, sensor)
+                if quantiles is None:
+                    continue
+                for quantile, value in zip(QUANTILES, quantiles):
+                    lines.append(
+                        f"{name}{_labels(sensor=sensor, quantile=quantile)} {value:.6g}")
+                count, total = totals[(metric, sensor)]
+                lines.append(f"{name}_sum{labels} {total:.6g}")
+                lines.append(f"{name}_count{labels} {count}")
+        name = PROMETHEUS_PREFIX + 'bytes_written_total'
+        lines.append(f"# HELP {name} bytes written per sensor")
+        lines.append(f"# TYPE {name} counter")
+        for sensor, count in sorted(byte_counts.items(), key=lambda item: item[0] or ''):
+            lines.append(f"{name}{_labels(sensor=sensor)} {count}")
+        gauge_names = sorted({gauge for gauge, sensor in gauges})
+        for gauge in gauge_names:
+            name = PROMETHEUS_PREFIX + gauge
+            lines.append(f"# TYPE {name} gauge")
+            for (other, sensor), value in gauges.items():
+                if other == gauge:
+                    lines.append(f"{name}{_labels(sensor=sensor)} {value}")
+
+        # Scrapers must never see a half written file
+        temporary = self.prometheus_path + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary, self.prometheus_path)
+
+    def close(self):
+        self.summarize()
+        with self._lock:
+            self._file.close()
+
+
+def _format_gauge(name, value):
+    if name.endswith('_bytes'):
+        return f"{value / 1e6:.1f} MB"
+    if value == int(value):
+        return str(int(value))
+    return f"{value:.2f}"
+
+
+def _labels(**labels):
+    text = ','.join(f'{key}="{value}"' for key,
+                    value in labels.items() if value is not None)
+    return '{' + text + '}' if text else ''
@@ -147,9 +147,176 @@ class CommandLineArgsParser:
             '--end-weather',
             default='ClearNoon',
             help='set the end weather for carla simulation. Start == End for discrete weather.')
+        self.parser.add_argument(
+            '--run-name',
+            default=None,
+            help='Output folder name under out/ (default: <map>_<date>)')
+        self.parser.add_argument(
+            '--flow-encoding',
+            default='int16',
+            choices=['int16', 'float16', 'float32'],
+            help='Storage of optical flow: int16 fixed point with a scale factor, float16 or float32 (default: int16)')
+        self.parser.add_argument(
+            '--dvs-representations',
+            nargs='*',
+            default=[],
+            choices=['voxel_grid', 'time_surface', 'event_histogram'],
+            help='DVS tensors to build per camera per frame (default: none)')
+        self.parser.add_argument(
+            '--dvs-bins',
+            default=5,
+            type=int,
+            help='Number of time bins of the DVS voxel grid (default: 5)')
+        self.parser.add_argument(
+            '--dvs-time-surface-tau',
+            default=0.3,
+            type=float,
+            help='Decay of the DVS time surface as a fraction of the time spanned by the events of the frame (default: 0.3)')
+        self.parser.add_argument(
+            '--dvs-normalization',
+            default='none',
+            choices=['none', 'max', 'zscore'],
+            help='Normalisation of the DVS tensors (default: none)')
+        self.parser.add_argument(
+            '--no-dvs-png',
+            default=False,
+            action='store_true',
+            help='Do not write the red/blue DVS rendering (default: False)')
+        self.parser.add_argument(
+            '--video-cameras',
+            nargs='*',
+            default=[],
+            metavar='PATTERN',
+            help='RGB cameras (role names, wildcards allowed) to stream into review videos while capturing (default: none)')
+        self.parser.add_argument(
+            '--video-dvs',
+            default=False,
+            action='store_true',
+            help='Also stream the DVS rendering of every video camera (default: False)')
+        self.parser.add_argument(
+            '--video-fps',
+            default=None,
+            type=float,
+            help='Frame rate of the review videos (default: 1 / delta-seconds)')
+        self.parser.add_argument(
+            '--no-index',
+            default=False,
+            action='store_true',
+            help='Do not write the SQLite frame and object index of the run (default: False)')
+        self.parser.add_argument(
+            '--output-format',
+            default='files',
+            choices=['files', 'tar'],
+            help='Write one file per artifact or pack them into per camera tar shards (default: files)')
+        self.parser.add_argument(
+            '--shard-size',
+            default=1024,
+            type=int,
+            help='Size of a tar shard in MB before the next one is started (default: 1024)')
+        self.parser.add_argument(
+            '--max-frames-in-flight',
+            default=2,
+            type=int,
+            help='Frames ticked while earlier ones are still being saved; 1 ticks and saves in sequence (default: 2)')
+        self.parser.add_argument(
+            '--no-telemetry',
+            default=False,
+            action='store_true',
+            help='Do not record per-stage timings, queue depths and bytes written (default: False)')
+        self.parser.add_argument(
+            '--metrics-format',
+            default='jsonl',
+            choices=['jsonl', 'csv'],
+            help='Format of the <run>/metrics file of the telemetry (default: jsonl)')
+        self.parser.add_argument(
+            '--telemetry-interval',
+            default=10.0,
+            type=float,
+            help='Seconds between telemetry summaries on the console and in metrics.prom (default: 10)')
+        self.parser.add_argument(
+            '--telemetry-window',
+            default=1000,
+            type=int,
+            help='Number of recent observations per metric and sensor the telemetry percentiles are computed over (default: 1000)')
+        self.parser.add_argument(
+            '--profile-ticks',
+            default=100,
+            type=int,
+            help='Ticks the sampling profiler runs after the process receives SIGUSR1 (default: 100)')
+        self.parser.add_argument(
+            '--profile-interval',
+            default=10.0,
+            type=float,
+            help='Milliseconds between two stack samples of the sampling profiler (default: 10)')
+        self.parser.add_argument(
+            '--record-raw',
+            default=False,
+            action='store_true',
+            help='Store raw rgb, dvs and depth buffers with actor states instead of labels; label them with labeler.py (default: False)')
+        self.parser.add_argument(
+            '--no-label-inputs',
+            default=False,
+            action='store_true',
+            help='Do not store the actor states, sensor poses and raw depth that labeler.py --relabel reads (default: False)')
+        self.parser.add_argument(
+            '--intake-budget',
+            default=4096,
+            type=int,
+            help='MB of arrived sensor data held until it is saved; 0 for no limit (default: 4096)')
+        self.parser.add_argument(
+            '--intake-policy',
+            default='block',
+            choices=['block', 'drop', 'spill'],
+            help='Over the intake budget: wait before the next tick, drop data of low priority sensors or spill camera buffers to disk (default: block)')
+        self.parser.add_argument(
+            '--spill-size',
+            default=8192,
+            type=int,
+            help='MB of the disk ring of --intake-policy spill (default: 8192)')
+        self.parser.add_argument(
+            '--spill-folder',
+            default=None,
+            help='Local folder of the spill ring (default: <run>/spill)')
+        self.parser.add_argument(
+            '--no-backpressure',
+            default=False,
+            action='store_true',
+            help='Keep full fidelity however far the writers fall behind (default: False)')
+        self.parser.add_argument(
+            '--backpressure-queue',
+            default=64,
+            type=int,
+            help='Writer jobs pending above which the capture steps down in fidelity (default: 64)')
+        self.parser.add_argument(
+            '--backpressure-latency',
+            default=2.0,
+            type=float,
+            help='90th percentile write seconds above which the capture steps down in fidelity (default: 2.0)')
+        self.parser.add_argument(
+            '--backpressure-hold',
+            default=10,
+            type=int,
+            help='Ticks the writers must stay behind or caught up before the fidelity changes by one level (default: 10)')
+        self.parser.add_argument(
+            '--sensor-config',
+            default='config/sensors.json',
+            help='Sensors of every ego vehicle (default: config/sensors.json)')
+        self.parser.add_argument(
+            '--fixed-sensor-config',
+            default='config/sensors-fixed-perception.json',
+            help='Sensors of every fixed view (default: config/sensors-fixed-perception.json)')
+        self.parser.add_argument(
+            '--scenarios',
+            default=None,
+            help='Scenario matrix of orchestrator.py to run one after the other in this process, loading every town once (default: none)')
+        self.parser.add_argument(
+            '--writer-threads',
+            default=4,
+            type=int,
+            help='Number of background threads that encode and write sensor data (default: 4)')
 
-    def parse_args(self):
-        return self.parser.parse_args()
+    def parse_args(self, argv=None):
+        return self.parser.parse_args(argv)
 
     def int_within_range(min_val, max_val):
         def validate(value):
@@ -1,100 +1,49 @@
-import numpy as np
 import os
-from tqdm import tqdm
+import re
 import time
-
-
-input_directories = [
-    '/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/FIXED/1/fixed-1',
-    '/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/FIXED/1/fixed-2',
-    '/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/FIXED/1/fixed-3',
-    '/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/FIXED/1/fixed-4',
-
-    '/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/FIXED/2/fixed-5',
-    '/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/FIXED/2/fixed-6',
-    '/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/FIXED/2/fixed-7',
-    '/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/FIXED/2/fixed-8',
-]
-for input_directory in input_directories:
-    num = input_directory.split('/')[-2]
-    result = input_directory.split('/')[-1]
-    type = input_directory.split('/')[-3]
-
-    all_files = sorted([filename for filename in os.listdir(input_directory) if filename.endswith(".npz")],
-                       key=lambda x: int(x.split('-')[0]))
-
-    compiled_output_file_path = f'/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/{type}/{num}/compiled-{result}.npz'
-    compiled_data = {}
-    for filename in tqdm(all_files, desc=f"Processing files {num}-{result}"):
-        if filename.endswith(".npz"):
-            file_path = os.path.join(input_directory, filename)
-            file_number = str(filename.split('-')[0])
-            try:
-                loaded_data = np.load(file_path)
-                dvs_events = loaded_data['dvs_events']
-                compiled_data[file_number] = dvs_events
-                del loaded_data, dvs_events
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    start = time.time()
-    np.savez_compressed(compiled_output_file_path, **compiled_data)
-    end = time.time()
-    print(end - start, "s")
-
-    # compiled_output_file_path = f'/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/EGO/{num}/compiled-{result}-1.npz'
-    # compiled_data = {}
-    # for filename in tqdm(all_files[:1000], desc=f"Processing files {num}-{result}"):
-    #     if filename.endswith(".npz"):
-    #         file_path = os.path.join(input_directory, filename)
-    #         file_number = str(filename.split('-')[0])
-    #         try:
-    #             loaded_data = np.load(file_path)
-    #             dvs_events = loaded_data['dvs_events']
-    #             compiled_data[file_number] = dvs_events
-    #             del loaded_data, dvs_events
-    #         except Exception as e:
-    #             print(f"Error processing {filename}: {e}")
-
-    # start = time.time()
-    # np.savez_compressed(compiled_output_file_path, **compiled_data)
-    # end = time.time()
-    # print(end - start, "s")
-
-    # compiled_output_file_path = f'/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/EGO/{num}/compiled-{result}-2.npz'
-    # compiled_data = {}
-    # for filename in tqdm(all_files[1000:1900], desc=f"Processing files {num}-{result}"):
-    #     if filename.endswith(".npz"):
-    #         file_path = os.path.join(input_directory, filename)
-    #         file_number = str(filename.split('-')[0])
-    #         try:
-    #             loaded_data = np.load(file_path)
-    #             dvs_events = loaded_data['dvs_events']
-    #             compiled_data[file_number] = dvs_events
-    #             del loaded_data, dvs_events
-    #         except Exception as e:
-    #             print(f"Error processing {filename}: {e}")
-
-    # start = time.time()
-    # np.savez_compressed(compiled_output_file_path, **compiled_data)
-    # end = time.time()
-    # print(end - start, "s")
-
-    # compiled_output_file_path = f'/Users/manideepreddyaliminati/Documents/coding/research/data-fix/data/EGO/{num}/compiled-{result}-3.npz'
-    # compiled_data = {}
-    # for filename in tqdm(all_files[1900:], desc=f"Processing files {num}-{result}"):
-    #     if filename.endswith(".npz"):
-    #         file_path = os.path.join(input_directory, filename)
-    #         file_number = str(filename.split('-')[0])
-    #         try:
-    #             loaded_data = np.load(file_path)
-    #             dvs_events = loaded_data['dvs_events']
-    #             compiled_data[file_number] = dvs_events
-    #             del loaded_data, dvs_events
-    #         except Exception as e:
-    #             print(f"Error processing {filename}: {e}")
-
-    # start = time.time()
-    # np.savez_compressed(compiled_output_file_path, **compiled_data)
-    # end = time.time()
-    # print(end - start, "s")
+import argparse
+from event_store import compile_events
+
+# Compiles the per-frame DVS event NPZs of camera folders into one memory-mappable .npy each.
+# > python utils/compile-npz.py out/<run>/fixed-1/annotations/dvs/dvs_camera/npz
+#
+# Writes compiled-<camera>.npy and compiled-<camera>-index.npy (frame -> start, end) next to
+# the camera folder. Read them back with event_store.EventStore.
+
+EVENT_FILE = re.compile(r'^(?:dvs-)?(\d+)-xytp\.npz$')
+
+
+def camera_name(input_directory):
+    parts = os.path.normpath(os.path.abspath(input_directory)).split(os.sep)
+    # <camera>/npz in the capture layout, the camera folder itself in legacy runs
+    return parts[-2] if parts[-1] == 'npz' else parts[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compile per-frame DVS event NPZs into an offset-indexed flat .npy')
+    parser.add_argument('input_directories', nargs='+',
+                        help='folders containing <frame>-xytp.npz files')
+    parser.add_argument('--output', default=None,
+                        help='output folder (default: next to each input folder)')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='number of files read in parallel (default: number of cores)')
+    args = parser.parse_args()
+
+    for input_directory in args.input_directories:
+        matches = [(int(m.group(1)), m.group(0)) for m in
+                   (EVENT_FILE.match(f) for f in os.listdir(input_directory)) if m]
+        matches.sort()
+        name = camera_name(input_directory)
+        output_folder = args.output or os.path.dirname(
+            os.path.normpath(os.path.abspath(input_directory)))
+        store_path = os.path.join(output_folder, f'compiled-{name}.npy')
+
+        start = time.time()
+        index = compile_events([os.path.join(input_directory, f) for _, f in matches],
+                               [frame for frame, _ in matches], store_path, args.workers)
+        print(f"{store_path}: {len(index)} frames, {int(index[-1, 2])} events in {time.time() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
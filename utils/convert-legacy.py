@@ -0,0 +1,144 @@
+import os
+import re
+import sys
+import shutil
+import argparse
+import concurrent.futures
+import xml.etree.ElementTree as ET
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from output_layout import make_camera_folders, yolo_lines  # noqa: E402
+
+# Converts runs captured in the old flat layout (everything of a camera in <view>/rgb_camera*/,
+# dvs-* and calib-* prefixed) to the layout described in output_layout.py. Replaces the
+# shift-files.py, xml-yolo.py and shift-npz.py post-passes.
+# > python utils/convert-legacy.py out/Town10HD_Opt_19_10_2026_10_00_00
+#
+# Work is spread over a process pool by camera. Every converted file is appended to
+# <run>/.convert-journal/<view>-<camera>.log, so an interrupted conversion resumes where it stopped.
+
+LEGACY_FILE = re.compile(r'^(dvs-|calib-)?(\d+)(-xytp|-repr)?\.(png|xml|json|txt|npz)$')
+
+
+def parse_voc(xml_path):
+    """ Streams a Pascal VOC file and returns (width, height, [(None, name, (xmin, ymin, w, h))]). """
+    width = height = None
+    boxes = []
+    values = {}
+    for event, element in ET.iterparse(xml_path, events=('end',)):
+        tag = element.tag
+        if tag in ('width', 'height', 'name', 'xmin', 'ymin', 'xmax', 'ymax'):
+            values[tag] = element.text
+        elif tag == 'size':
+            width, height = int(values['width']), int(values['height'])
+        elif tag == 'object':
+            xmin, ymin = int(values['xmin']), int(values['ymin'])
+            boxes.append((None, values['name'],
+                         (xmin, ymin, int(values['xmax']) - xmin, int(values['ymax']) - ymin)))
+            element.clear()
+    return width, height, boxes
+
+
+def transfer(source, target, keep_source):
+    """ Moves by rename when possible; with keep_source hardlinks, copying only across devices. """
+    if keep_source:
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copy2(source, target)
+    else:
+        try:
+            os.replace(source, target)
+        except OSError:
+            shutil.move(source, target)
+
+
+def target_of(file, folders):
+    """ Returns (target path, source is a VOC file whose YOLO labels go to this folder) or None. """
+    match = LEGACY_FILE.match(file)
+    if match is None:
+        return None
+    prefix, frame, suffix, extension = match.groups()
+    if prefix == 'calib-':
+        return os.path.join(folders['calibration'], f'{frame}.txt'), None
+    kind = 'dvs' if prefix == 'dvs-' else 'rgb'
+    if extension == 'npz':
+        return os.path.join(folders['dvs_events'], f'{frame}{suffix or ""}.npz'), None
+    if extension == 'png':
+        return os.path.join(folders[kind + '_images'], f'{frame}.png'), None
+    target = os.path.join(folders[kind + '_annotations'], f'{frame}.{extension}')
+    if extension == 'xml':
+        return target, os.path.join(folders[kind + '_labels'], f'{frame}.txt')
+    return target, None
+
+
+def convert_camera(run_root, view, camera, keep_source):
+    camera_folder = os.path.join(run_root, view, camera)
+    folders = make_camera_folders(os.path.join(run_root, view), camera)
+    journal_folder = os.path.join(run_root, '.convert-journal')
+    os.makedirs(journal_folder, exist_ok=True)
+    journal_path = os.path.join(journal_folder, f'{view}-{camera}.log')
+
+    done = set()
+    if os.path.exists(journal_path):
+        with open(journal_path) as journal:
+            done = set(line.strip() for line in journal)
+
+    converted = 0
+    with open(journal_path, 'a') as journal:
+        with os.scandir(camera_folder) as entries:
+            for entry in entries:
+                if entry.name in done or not entry.is_file():
+                    continue
+                target = target_of(entry.name, folders)
+                if target is None:
+                    continue
+                target_path, label_path = target
+                if label_path is not None:
+                    width, height, boxes = parse_voc(entry.path)
+                    with open(label_path, 'w') as label_file:
+                        for line in yolo_lines(boxes, width, height):
+                            label_file.write(line + '\n')
+                transfer(entry.path, target_path, keep_source)
+                journal.write(entry.name + '\n')
+                converted += 1
+    return f'{view}/{camera}', converted
+
+
+def find_cameras(run_root):
+    cameras = []
+    for view in sorted(os.listdir(run_root)):
+        view_folder = os.path.join(run_root, view)
+        if not os.path.isdir(view_folder) or view.startswith('.'):
+            continue
+        for camera in sorted(os.listdir(view_folder)):
+            if camera.find('rgb_camera') != -1 and os.path.isdir(os.path.join(view_folder, camera)):
+                cameras.append((view, camera))
+    return cameras
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert a run captured in the legacy flat layout to the images/labels/annotations layout')
+    parser.add_argument('run_root', help='run output folder, e.g. out/<map>_<date>')
+    parser.add_argument('--keep-source', action='store_true',
+                        help='hardlink instead of moving, leaving the legacy tree in place')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='number of cameras converted in parallel (default: number of cores)')
+    args = parser.parse_args()
+
+    cameras = find_cameras(args.run_root)
+    print(f"Converting {len(cameras)} cameras in {args.run_root}")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(convert_camera, args.run_root, view, camera, args.keep_source)
+                   for view, camera in cameras]
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), unit="camera"):
+            camera, converted = future.result()
+            print(f"Done {camera}: {converted} files")
+
+
+if __name__ == '__main__':
+    main()
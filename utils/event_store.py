@@ -0,0 +1,88 @@
+"""
+Flat, memory-mappable store of the DVS events of one camera:
+
+<name>.npy          all events of all frames, concatenated in frame order (uncompressed)
+<name>-index.npy    int64 (N, 3) table of frame, start, end offsets into <name>.npy
+"""
+
+import os
+import zipfile
+import numpy as np
+import concurrent.futures
+
+
+def index_path(store_path):
+    return store_path[:-len('.npy')] + '-index.npy'
+
+
+def read_npz_header(npz_path, key='dvs_events'):
+    """ Returns (shape, dtype) of an array in an NPZ by decompressing only the .npy header. """
+    with zipfile.ZipFile(npz_path) as archive:
+        with archive.open(key + '.npy') as member:
+            version = np.lib.format.read_magic(member)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(member)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(member)
+    return shape, dtype
+
+
+def compile_events(npz_paths, frames, store_path, workers=None, key='dvs_events'):
+    """ Streams per-frame event NPZs into one .npy plus offset table.
+        Memory use is bounded by the number of frames in flight, not by the length of the run.
+    """
+    if not npz_paths:
+        raise ValueError("No event files to compile into " + store_path)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        headers = list(executor.map(lambda path: read_npz_header(path, key), npz_paths))
+
+    dtype = headers[0][1]
+    lengths = np.array([shape[0] for shape, _ in headers], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    index = np.stack([np.asarray(frames, dtype=np.int64), ends - lengths, ends], axis=1)
+
+    store = np.lib.format.open_memmap(
+        store_path, mode='w+', dtype=dtype, shape=(int(ends[-1]) if len(ends) else 0,))
+
+    def copy_frame(i):
+        with np.load(npz_paths[i]) as loaded:
+            store[index[i, 1]:index[i, 2]] = loaded[key]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        # Bounded submission keeps at most 2 * workers decoded frames alive
+        in_flight = set()
+        limit = 2 * (workers or os.cpu_count() or 1)
+        for i in range(len(npz_paths)):
+            if len(in_flight) >= limit:
+                finished, in_flight = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+            in_flight.add(executor.submit(copy_frame, i))
+        for future in concurrent.futures.as_completed(in_flight):
+            future.result()
+
+    store.flush()
+    del store
+    np.save(index_path(store_path), index)
+    return index
+
+
+class EventStore:
+    """ Random access to a compiled store; events are served straight from the memory map. """
+
+    def __init__(self, store_path):
+        self.events = np.load(store_path, mmap_mode='r')
+        index = np.load(index_path(store_path))
+        self.offsets = {int(frame): (int(start), int(end))
+                        for frame, start, end in index}
+
+    def frames(self):
+        return sorted(self.offsets)
+
+    def __contains__(self, frame):
+        return frame in self.offsets
+
+    def __getitem__(self, frame):
+        start, end = self.offsets[frame]
+        return self.events[start:end]
@@ -0,0 +1,41 @@
+import os
+import argparse
+import concurrent.futures
+import cv2
+from tqdm import tqdm
+from flow import load_flow, flow_to_color
+
+
+# Renders the colour coded preview of stored optical flow NPZs.
+# > python utils/flow-to-color.py out/Town10HD_Opt_.../ego0/optical_flow-front --output preview/
+
+def export_file(npz_path, output_folder):
+    frame = os.path.basename(npz_path).split('.')[0]
+    image = flow_to_color(load_flow(npz_path))
+    cv2.imwrite(os.path.join(output_folder, f"{frame}.png"), image)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Colour code stored optical flow for previewing')
+    parser.add_argument('input_folder', help='folder containing <frame>.npz flow files')
+    parser.add_argument('--output', default=None,
+                        help='output folder (default: <input_folder>/color)')
+    parser.add_argument('--every', default=1, type=int,
+                        help='only export every n-th frame (default: 1)')
+    args = parser.parse_args()
+
+    output_folder = args.output or os.path.join(args.input_folder, 'color')
+    os.makedirs(output_folder, exist_ok=True)
+    npz_files = sorted([f for f in os.listdir(args.input_folder) if f.endswith('.npz')],
+                       key=lambda x: int(x.split('.')[0]))[::args.every]
+
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        futures = [executor.submit(export_file, os.path.join(args.input_folder, f), output_folder)
+                   for f in npz_files]
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), unit="frame"):
+            future.result()
+
+
+if __name__ == '__main__':
+    main()
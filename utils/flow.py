@@ -0,0 +1,42 @@
+import numpy as np
+import cv2
+
+# CARLA reports optical flow normalised to [-2, 2]. Fixed point with this scale
+# covers [-4, 4) at a resolution of ~1.2e-4, well below a pixel at 1280 px.
+FLOW_INT16_SCALE = 1.0 / 8192.0
+FLOW_ENCODINGS = ['int16', 'float16', 'float32']
+
+
+def encode_flow(flow, encoding='int16', scale=FLOW_INT16_SCALE):
+    """ Returns the arrays to store for a float32 (H, W, 2) flow field. """
+    if encoding == 'int16':
+        quantized = np.clip(np.rint(flow / scale), -32768, 32767)
+        return {'flow': quantized.astype(np.int16), 'scale': np.float32(scale)}
+    if encoding == 'float16':
+        return {'flow': flow.astype(np.float16)}
+    if encoding == 'float32':
+        return {'flow': flow.astype(np.float32)}
+    raise ValueError("Unknown flow encoding " + str(encoding))
+
+
+def decode_flow(stored):
+    """ Returns the float32 (H, W, 2) flow from an opened flow NPZ (any encoding). """
+    flow = stored['flow']
+    if flow.dtype == np.int16:
+        return flow.astype(np.float32) * np.float32(stored['scale'])
+    return flow.astype(np.float32)
+
+
+def load_flow(file_path):
+    with np.load(file_path) as stored:
+        return decode_flow(stored)
+
+
+def flow_to_color(flow):
+    """ Colour codes a flow field (hue = direction, value = magnitude) as a BGR image. """
+    magnitude, angle = cv2.cartToPolar(flow[:, :, 0], flow[:, :, 1])
+    hsv = np.zeros((flow.shape[0], flow.shape[1], 3), dtype=np.uint8)
+    hsv[:, :, 0] = angle * 90.0 / np.pi
+    hsv[:, :, 1] = 255
+    hsv[:, :, 2] = cv2.normalize(magnitude, None, 0, 255, cv2.NORM_MINMAX)
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
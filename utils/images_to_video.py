@@ -1,38 +1,215 @@
 import os
-import cv2
 import re
+import cv2
+import json
+import queue
+import argparse
+import threading
+import numpy as np
 import concurrent.futures
 from tqdm import tqdm
 
-def create_video_from_images(image_dir, output_video, frame_width, frame_height, frame_rate):
-    image_files = [f for f in os.listdir(image_dir) if f.endswith(('.jpg', '.png')) and re.match(r'^\d', f)]
-    if "dvs" in output_video:
-        image_files = [f for f in os.listdir(image_dir) if f.endswith(('.jpg', '.png')) and f[0].isalpha()]
-    image_files = sorted(image_files, key=lambda x: int(x.split('.')[0]))
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Use 'mp4v' codec for MP4
-    out = cv2.VideoWriter(output_video, fourcc, frame_rate, (frame_width, frame_height))
-    for image_file in tqdm(image_files, desc="Processing images", unit="image"):
-        image_path = os.path.join(image_dir, image_file)
-        frame = cv2.imread(image_path)
-        frame = cv2.resize(frame, (frame_width, frame_height))
-        out.write(frame)
-    out.release()
-    print(f"Video '{output_video}' created successfully.")
-
-folders = [
-    '/home/apg/manideep/carla/out/f-2/fixed-1/rgb_camera',    
-]
-
-frame_width = 1280
-frame_height = 960
-frame_rate = 10  
-
-def process_folder(folder):
-    folder_name = folder.split('/')[-1]
-    perception = folder.split('/')[-2]
-    output_video = f'/home/apg/manideep/carla/out/aa-{perception}-{folder_name}.mp4'
-    print("Starting with ", perception, folder_name)
-    create_video_from_images(folder, output_video, frame_width, frame_height, frame_rate)
-
-with concurrent.futures.ThreadPoolExecutor() as executor:
-    executor.map(process_folder, folders)
\ No newline at end of file
+# Builds review videos for every camera of a run directory.
+# > python utils/images_to_video.py out/Town10HD_Opt_19_10_2026_10_00_00 --mosaic
+#
+# Videos are written to <run>/videos/<view>-<camera>.mp4 next to a <video>.json frame index.
+# A video whose index matches the frames on disk is skipped, so re-runs only build what changed.
+
+FRAME_PATTERN = re.compile(r'^(dvs-)?(\d+)\.(png|jpg)$')
+# Tile order of the 2x3 mosaic: front row on top, back row below
+MOSAIC_ORDER = ['front-left', 'front', 'front-right',
+                'back-left', 'back', 'back-right']
+PREFETCH_FRAMES = 16
+END_OF_FRAMES = object()
+
+
+def find_videos(run_dir):
+    """ Returns {video name: (view, camera, sorted [(frame, image path)])} for every folder holding numbered frames. """
+    videos = {}
+    for root, dirs, files in os.walk(run_dir):
+        dirs[:] = [d for d in dirs if d != 'videos']
+        frames = {'': [], 'dvs-': []}
+        for file in files:
+            match = FRAME_PATTERN.match(file)
+            if match:
+                frames[match.group(1) or ''].append(
+                    (int(match.group(2)), os.path.join(root, file)))
+        relative = os.path.relpath(root, run_dir).split(os.sep)
+        view, camera = relative[0], relative[-1]
+        for prefix, images in frames.items():
+            if images:
+                # Legacy runs keep dvs-<frame>.png inside the rgb camera folder
+                video_camera = camera.replace('rgb', 'dvs') if prefix else camera
+                videos[f'{view}-{video_camera}'] = (view, video_camera, sorted(images))
+    return videos
+
+
+def mosaic_groups(videos):
+    """ Groups the rgb and dvs videos of a view (or of all fixed views) into tiles of at most 6. """
+    groups = {}
+    for name, (view, camera, images) in videos.items():
+        if view.startswith('fixed'):
+            view = 'fixed'
+        for kind in ['rgb', 'dvs']:
+            if camera.startswith(kind + '_camera'):
+                groups.setdefault(f'{view}-{kind}', []).append(name)
+
+    def tile_order(name):
+        suffix = videos[name][1].split('_camera')[-1].lstrip('-')
+        return (MOSAIC_ORDER.index(suffix) if suffix in MOSAIC_ORDER else len(MOSAIC_ORDER), name)
+
+    mosaics = {}
+    for group, names in groups.items():
+        names = sorted(names, key=tile_order)
+        if len(names) < 2:
+            continue
+        for start in range(0, len(names), 6):
+            suffix = '' if start == 0 else f'-{start // 6 + 1}'
+            mosaics[f'mosaic-{group}{suffix}'] = names[start:start + 6]
+    return mosaics
+
+
+def frame_index(images):
+    frames = [frame for frame, path in images]
+    return {'count': len(frames), 'first': frames[0], 'last': frames[-1]}
+
+
+def is_up_to_date(video_path, index):
+    try:
+        with open(video_path + '.json') as file:
+            return os.path.exists(video_path) and json.load(file) == index
+    except (OSError, ValueError):
+        return False
+
+
+def prefetch(paths, frames):
+    """ Decodes images in order on a separate thread so decoding overlaps encoding. """
+    for path in paths:
+        frames.put(cv2.imread(path))
+    frames.put(END_OF_FRAMES)
+
+
+def decoded_frames(paths):
+    frames = queue.Queue(maxsize=PREFETCH_FRAMES)
+    threading.Thread(target=prefetch, args=(paths, frames), daemon=True).start()
+    previous = None
+    while True:
+        frame = frames.get()
+        if frame is END_OF_FRAMES:
+            return
+        if frame is None:
+            print("Could not decode a frame, repeating the previous one")
+            frame = previous
+        previous = frame
+        yield frame
+
+
+def fit(frame, size):
+    if frame.shape[1] != size[0] or frame.shape[0] != size[1]:
+        return cv2.resize(frame, size)
+    return frame
+
+
+def write_video(video_path, index, frames, size, fps):
+    writer = None
+    for frame in frames:
+        if frame is None:
+            continue
+        if writer is None:
+            size = size or (frame.shape[1], frame.shape[0])
+            writer = cv2.VideoWriter(
+                video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+        writer.write(fit(frame, size))
+    if writer is not None:
+        writer.release()
+        with open(video_path + '.json', 'w') as file:
+            json.dump(index, file)
+
+
+def build_video(video_path, images, index, size, fps):
+    write_video(video_path, index, decoded_frames(
+        [path for frame, path in images]), size, fps)
+    return video_path
+
+
+def build_mosaic(video_path, tiles, index, tile_size, fps):
+    """ tiles is a list of [(frame, path)] restricted to the frames all tiles share. """
+    streams = [decoded_frames([path for frame, path in images]) for images in tiles]
+    size = tile_size
+    blank = None
+
+    def mosaic_frames():
+        nonlocal size, blank
+        for frames in zip(*streams):
+            # A tile is None until its stream has decoded a first frame
+            decoded = [frame for frame in frames if frame is not None]
+            if not decoded:
+                continue
+            if blank is None:
+                # One tile size for the whole mosaic, whatever the resolutions of the tiles
+                size = size or (decoded[0].shape[1] // 2, decoded[0].shape[0] // 2)
+                blank = np.zeros_like(fit(decoded[0], size))
+            cells = [blank if frame is None else fit(frame, size) for frame in frames]
+            cells += [blank] * (6 - len(cells))
+            yield np.vstack([np.hstack(cells[:3]), np.hstack(cells[3:])])
+
+    write_video(video_path, index, mosaic_frames(), None, fps)
+    return video_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build review videos for every camera of a run directory')
+    parser.add_argument('run_dir', help='run output folder, e.g. out/<map>_<date>')
+    parser.add_argument('--output', default=None,
+                        help='video folder (default: <run_dir>/videos)')
+    parser.add_argument('--fps', default=10, type=float, help='frame rate (default: 10)')
+    parser.add_argument('--size', default=None, metavar='WIDTHxHEIGHT',
+                        help='resize frames to this size (default: keep the source size)')
+    parser.add_argument('--mosaic', action='store_true',
+                        help='also build 2x3 multi-camera mosaics')
+    parser.add_argument('--mosaic-tile', default=None, metavar='WIDTHxHEIGHT',
+                        help='size of a mosaic tile (default: half the source size)')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='number of videos built in parallel (default: number of cores)')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild videos that are up to date')
+    args = parser.parse_args()
+
+    def parse_size(value):
+        return tuple(int(x) for x in value.split('x')) if value else None
+
+    output = args.output or os.path.join(args.run_dir, 'videos')
+    os.makedirs(output, exist_ok=True)
+    videos = find_videos(args.run_dir)
+
+    jobs = []
+    for name, (view, camera, images) in videos.items():
+        video_path = os.path.join(output, name + '.mp4')
+        index = frame_index(images)
+        if args.force or not is_up_to_date(video_path, index):
+            jobs.append((build_video, video_path, images,
+                        index, parse_size(args.size), args.fps))
+    if args.mosaic:
+        for name, members in mosaic_groups(videos).items():
+            shared = set.intersection(
+                *[set(frame for frame, path in videos[m][2]) for m in members])
+            if not shared:
+                continue
+            tiles = [[(frame, path) for frame, path in videos[m][2] if frame in shared]
+                     for m in members]
+            video_path = os.path.join(output, name + '.mp4')
+            index = dict(frame_index(tiles[0]), tiles=members)
+            if args.force or not is_up_to_date(video_path, index):
+                jobs.append((build_mosaic, video_path, tiles, index,
+                            parse_size(args.mosaic_tile), args.fps))
+
+    print(f"{len(jobs)} of {len(videos)} videos to build")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(*job) for job in jobs]
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), unit="video"):
+            print(f"Video '{future.result()}' created successfully.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import heapq
+import queue
+import fnmatch
+import threading
+import traceback
+import cv2
+
+
+class VideoSink:
+    """
+    Streams decoded camera frames into one cv2.VideoWriter per camera while capturing,
+    so review videos exist as soon as a run ends. Every video has its own worker thread
+    and a bounded queue; a full queue blocks the caller instead of growing memory.
+    With several frames in flight, frames may arrive out of order; each stream holds
+    back up to reorder frames and writes them sorted by frame id.
+    """
+
+    def __init__(self, output_folder, cameras, fps, dvs=False, queue_size=32, fourcc='mp4v', reorder=0):
+        self.output_folder = output_folder
+        self.cameras = cameras
+        self.fps = fps
+        self.dvs = dvs
+        self.queue_size = queue_size
+        self.reorder = reorder
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self._lock = threading.Lock()
+        self._streams = {}
+        os.makedirs(output_folder, exist_ok=True)
+
+    def wants(self, camera_name):
+        return any(fnmatch.fnmatch(camera_name, pattern) for pattern in self.cameras)
+
+    def write(self, camera_folder, frame, kind='rgb', frame_id=None):
+        """ Queues a BGR uint8 frame for the camera whose output folder is camera_folder. """
+        view = os.path.basename(os.path.dirname(camera_folder))
+        camera = os.path.basename(camera_folder)
+        if kind != 'rgb':
+            camera = camera.replace('rgb', kind)
+        name = f'{view}-{camera}'
+        with self._lock:
+            stream = self._streams.get(name)
+            if stream is None:
+                stream = self._open(name, frame)
+                self._streams[name] = stream
+        stream[0].put((frame_id, frame))
+
+    def _open(self, name, first_frame):
+        height, width = first_frame.shape[:2]
+        writer = cv2.VideoWriter(os.path.join(self.output_folder, name + '.mp4'),
+                                 self.fourcc, self.fps, (width, height))
+        frames = queue.Queue(maxsize=self.queue_size)
+        worker = threading.Thread(target=self._encode, args=(
+            name, writer, frames), daemon=True)
+        worker.start()
+        return frames, worker
+
+    def _encode(self, name, writer, frames):
+        pending = []
+        count = 0
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            frame_id, frame = item
+            heapq.heappush(pending, (count if frame_id is None else frame_id, count, frame))
+            count += 1
+            while len(pending) > self.reorder:
+                self._write_frame(name, writer, heapq.heappop(pending)[2])
+        while pending:
+            self._write_frame(name, writer, heapq.heappop(pending)[2])
+        writer.release()
+
+    def _write_frame(self, name, writer, frame):
+        try:
+            writer.write(frame)
+        except Exception as error:
+            print("An exception occurred in video sink " + name + ":", error)
+            traceback.print_exc()
+
+    def close(self):
+        with self._lock:
+            streams = list(self._streams.values())
+            self._streams = {}
+        for frames, worker in streams:
+            frames.put(None)
+        for frames, worker in streams:
+            worker.join()
@@ -0,0 +1,74 @@
+import collections
+import concurrent.futures
+import threading
+import traceback
+
+
+class WriterPool:
+    """
+    Runs encode/write jobs on background threads so the tick loop never waits
+    on disk. Keeps a count of the jobs that are still pending, in total and
+    per frame, so that a frame's sensor data can be held until its jobs are written.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="writer")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._frame_pending = collections.Counter()
+        self._frame_callbacks = {}
+
+    def submit(self, fn, *args, **kwargs):
+        return self.submit_frame(None, fn, *args, **kwargs)
+
+    def submit_frame(self, frame, fn, *args, **kwargs):
+        """ Like submit, for a job that writes data of frame. """
+        with self._lock:
+            self._pending += 1
+            if frame is not None:
+                self._frame_pending[frame] += 1
+        future = self.executor.submit(self._run, frame, fn, *args, **kwargs)
+        return future
+
+    def _run(self, frame, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as error:
+            print("An exception occurred in writer pool:", error)
+            traceback.print_exc()
+        finally:
+            callbacks = []
+            with self._lock:
+                self._pending -= 1
+                if frame is not None:
+                    self._frame_pending[frame] -= 1
+                    if self._frame_pending[frame] == 0:
+                        del self._frame_pending[frame]
+                        callbacks = self._frame_callbacks.pop(frame, [])
+            self._call(callbacks)
+
+    def when_written(self, frame, callback):
+        """ Calls callback once no job of frame is pending, right away if there is none. """
+        with self._lock:
+            if self._frame_pending[frame] > 0:
+                self._frame_callbacks.setdefault(frame, []).append(callback)
+                return
+            del self._frame_pending[frame]
+        self._call([callback])
+
+    def _call(self, callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as error:
+                print("An exception occurred in writer pool callback:", error)
+                traceback.print_exc()
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def shutdown(self):
+        """ Blocks until every submitted job has been written. """
+        self.executor.shutdown(wait=True)